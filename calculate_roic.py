@@ -13,12 +13,44 @@ import json
 import os
 import sys
 import math
+import warnings
 from collections import defaultdict
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from period_series import PeriodSeries, MetricGraph, CompanyInfo, quarter_ordinal, quarter_label
 
 # ── Configuration ──
 INPUT_DIR = os.environ.get("INPUT_DIR", "output")
 OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "docs")
+# "enforce" blocks publishing on hard failures, "warn" only reports, "off" skips
+QUALITY_GATE = os.environ.get("QUALITY_GATE", "enforce")
+# Comma-separated tickers whose CSV rows changed (set by the agent's watch
+# mode); everyone else is reused from the previous internal data.json
+CHANGED_TICKERS = [t for t in os.environ.get("CHANGED_TICKERS", "").split(",") if t]
+# Event study: relative-quarter window "pre,post" and bootstrap resamples
+EVENT_WINDOW = tuple(int(x) for x in os.environ.get("EVENT_WINDOW", "-4,8").split(","))
+EVENT_BOOTSTRAP = int(os.environ.get("EVENT_BOOTSTRAP", "5000"))
+EVENT_SEED = int(os.environ.get("EVENT_SEED", "0"))
+# "on" also evaluates the methodology grid in SENSITIVITY_GRID and writes
+# internal/sensitivity.json
+SENSITIVITY = os.environ.get("SENSITIVITY", "off")
+# Tickers per pass over the grid; peak memory scales with this, not the universe
+SENSITIVITY_CHUNK = int(os.environ.get("SENSITIVITY_CHUNK", "64"))
+# "on" fills short gaps in core line items (see IMPUTE_ITEMS) and carries
+# Monte Carlo uncertainty bands through to adj_roic and the indices
+IMPUTE = os.environ.get("IMPUTE", "off")
+IMPUTE_DRAWS = int(os.environ.get("IMPUTE_DRAWS", "500"))
+IMPUTE_SEED = int(os.environ.get("IMPUTE_SEED", "0"))
+# Restatement flags: changelog entries older than this many days are not shown
+RESTATEMENT_DAYS = int(os.environ.get("RESTATEMENT_DAYS", "180"))
+# Peer discovery: k-means cluster count and nearest peers kept per ticker
+PEER_CLUSTERS = int(os.environ.get("PEER_CLUSTERS", "4"))
+PEER_NEIGHBORS = int(os.environ.get("PEER_NEIGHBORS", "5"))
+# Set to a path (e.g. output/roic_workbook.xlsx) to also write the Excel
+# workbook; needs xlsxwriter
+WORKBOOK_PATH = os.environ.get("WORKBOOK_PATH", "")
 
 COMPANIES = {
     "MSFT": {"name": "Microsoft", "sector": "Technology", "tier": 1},
@@ -49,33 +81,12 @@ COMPANIES = {
     "UPS": {"name": "UPS", "sector": "Logistics", "tier": 2},
 }
 
-AI_EVENTS = [
-    {"ticker": "IBM",   "quarter": "Q2 2023", "jobs": 7800,  "type": "direct"},
-    {"ticker": "CHGG",  "quarter": "Q2 2023", "jobs": 80,    "type": "disrupted"},
-    {"ticker": "DBX",   "quarter": "Q2 2023", "jobs": 500,   "type": "direct"},
-    {"ticker": "META",  "quarter": "Q1 2023", "jobs": 10000, "type": "partial"},
-    {"ticker": "GOOGL", "quarter": "Q1 2023", "jobs": 12000, "type": "partial"},
-    {"ticker": "DUOL",  "quarter": "Q1 2024", "jobs": 100,   "type": "direct"},
-    {"ticker": "CHGG",  "quarter": "Q2 2024", "jobs": 248,   "type": "disrupted"},
-    {"ticker": "GOOGL", "quarter": "Q2 2024", "jobs": 6000,  "type": "partial"},
-    {"ticker": "CRM",   "quarter": "Q1 2024", "jobs": 700,   "type": "partial"},
-    {"ticker": "PYPL",  "quarter": "Q1 2024", "jobs": 2500,  "type": "partial"},
-    {"ticker": "DBX",   "quarter": "Q4 2024", "jobs": 528,   "type": "direct"},
-    {"ticker": "SAP",   "quarter": "Q1 2024", "jobs": 8000,  "type": "direct"},
-    {"ticker": "WDAY",  "quarter": "Q1 2025", "jobs": 1750,  "type": "direct"},
-    {"ticker": "MSFT",  "quarter": "Q1 2025", "jobs": 6000,  "type": "direct"},
-    {"ticker": "CRWD",  "quarter": "Q2 2025", "jobs": 500,   "type": "direct"},
-    {"ticker": "MSFT",  "quarter": "Q3 2025", "jobs": 9000,  "type": "direct"},
-    {"ticker": "CHGG",  "quarter": "Q4 2025", "jobs": 388,   "type": "disrupted"},
-    {"ticker": "FVRR",  "quarter": "Q3 2025", "jobs": 250,   "type": "direct"},
-    {"ticker": "IBM",   "quarter": "Q4 2025", "jobs": 2700,  "type": "direct"},
-    {"ticker": "CRM",   "quarter": "Q3 2025", "jobs": 4000,  "type": "direct"},
-    {"ticker": "HPQ",   "quarter": "Q4 2025", "jobs": 6000,  "type": "direct"},
-    {"ticker": "CHRW",  "quarter": "Q4 2025", "jobs": 1400,  "type": "direct"},
-    {"ticker": "AMZN",  "quarter": "Q4 2025", "jobs": 14000, "type": "direct"},
-    {"ticker": "SAP",   "quarter": "Q2 2025", "jobs": 3000,  "type": "direct"},
-    {"ticker": "UPS",   "quarter": "Q3 2025", "jobs": 14000, "type": "partial"},
-]
+COMPANY_INFO = {t: CompanyInfo(t, c["name"], c["sector"], tier=c["tier"]) for t, c in COMPANIES.items()}
+
+# AI layoff events come from the agent's ai_layoff_events.csv (its
+# AI_LAYOFF_EVENTS list), so the two scripts cannot drift apart
+EVENT_COLUMNS = {"Ticker": "ticker", "Quarter": "quarter", "Jobs_Cut": "jobs", "Attribution": "type",
+                 "Description": "description"}
 
 # ── Line item name normalization ──
 # The EDGAR agent may use slightly different names than expected.
@@ -128,27 +139,261 @@ ALIAS_MAP = build_alias_map()
 # ── CSV Ingestion ──
 
 def load_combined_csv(filepath):
-    """Load all_companies_quarterly.csv from EDGAR agent."""
-    data = defaultdict(lambda: defaultdict(dict))
+    """Load all_companies_quarterly.csv from EDGAR agent.
+    
+    Returns {ticker: {item: PeriodSeries}}, every series spanning the
+    quarter columns of the file.
+    """
+    data = defaultdict(dict)
     
     with open(filepath, 'r') as f:
         reader = csv.DictReader(f)
+        columns = [k for k in reader.fieldnames or [] if k.startswith('Q')]
+        if not columns:
+            return data
+        ordinals = {k: quarter_ordinal(k) for k in columns}
+        start = min(ordinals.values())
+        length = max(ordinals.values()) - start + 1
         for row in reader:
             ticker = row.get('Ticker', '').strip()
             raw_item = row.get('Line Item', '').strip()
             
             # Normalize item name
             item = ALIAS_MAP.get(raw_item, raw_item)
+            series = data[ticker].get(item)
+            if series is None:
+                series = data[ticker][item] = PeriodSeries(start, length)
             
-            for key, val in row.items():
-                if key.startswith('Q') and val != '':
+            for key in columns:
+                val = row.get(key, '')
+                if val != '':
                     try:
-                        data[ticker][item][key] = float(val)
+                        series[ordinals[key]] = float(val)
                     except ValueError:
                         pass
     return data
 
 
+def load_events(path):
+    """AI layoff events from ai_layoff_events.csv as [{"ticker", "quarter", "jobs", "type", "description"}]."""
+    if not os.path.exists(path):
+        return []
+    events = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            e = {key: (row.get(col) or "").strip() for col, key in EVENT_COLUMNS.items()}
+            try:
+                e["jobs"] = int(e["jobs"])
+            except ValueError:
+                e["jobs"] = None
+            if e["ticker"] and e["quarter"]:
+                events.append(e)
+    return events
+
+
+def load_restatements(path, days=RESTATEMENT_DAYS, now=None):
+    """Recently restated cells from the agent's changelog.jsonl.
+    
+    Only entries from the last `days` days count, and for each company only
+    those after its latest "baseline" line (written when the agent had no
+    comparable snapshot, e.g. after a methodology change). Each cell keeps
+    its latest change.
+    
+    Returns {ticker: {quarter: [{"item", "old", "new", "accn", "run"}, ...]}}.
+    """
+    if not os.path.exists(path):
+        return {}
+    cutoff = ((now or datetime.now()) - timedelta(days=days)).isoformat(timespec="seconds")
+    latest = defaultdict(dict)
+    with open(path) as f:
+        for line in f:
+            try:
+                c = json.loads(line)
+            except ValueError:
+                continue
+            if c.get("kind") == "baseline":
+                for t in c.get("tickers", []):
+                    latest.pop(t, None)
+                continue
+            if (c.get("run") or "") < cutoff:
+                continue
+            latest[c["ticker"]][(c["quarter"], c.get("item"))] = {
+                k: c.get(k) for k in ("item", "old", "new", "accn", "run", "kind")}
+    restated = defaultdict(lambda: defaultdict(list))
+    for ticker, cells in latest.items():
+        for (quarter, _), c in cells.items():
+            restated[ticker][quarter].append(c)
+    return {t: dict(qs) for t, qs in restated.items()}
+
+
+# ── Data-quality gate ──
+# Runs over the full ticker × quarter matrices before anything is published.
+# Hard failures (unit/scale errors, impossible tax rates, universe coverage)
+# block writing docs/; soft failures are reported only.
+
+MM_ITEMS = [item for item in ITEM_ALIASES if item.endswith("($mm)") and item != "Market Cap ($mm)"]
+FLOW_ITEMS = [
+    "Operating Income ($mm)", "Stock-Based Compensation ($mm)", "Restructuring Charges ($mm)",
+    "Share Buybacks ($mm)", "Capital Expenditures ($mm)", "Free Cash Flow ($mm)",
+]
+STOCK_ITEMS = [
+    "Total Debt ($mm)", "Cash & Equivalents ($mm)", "Goodwill ($mm)",
+    "Acquired Intangibles ($mm)", "Operating Lease Liabilities ($mm)", "Headcount",
+]
+CORE_ITEMS = ["Operating Income ($mm)", "Effective Tax Rate", "Total Debt ($mm)", "Total Shareholders' Equity ($mm)"]
+
+QUALITY_THRESHOLDS = {
+    "max_abs_mm": 1e7,            # $10T in $mm — anything larger is a unit error
+    "max_ratio_to_revenue": 1e3,  # any $mm item 1000× revenue is a unit mismatch
+    "max_flow_to_revenue": 5,     # income/cash-flow items this far above revenue are suspect
+    "max_qoq_ratio": 10,          # quarter-over-quarter jump (either direction)
+    "tax_rate_hard": 1.0,         # a ticker whose median |rate| exceeds this reports percents
+    "tax_rate_soft": (0.0, 1.0),
+    "min_ticker_coverage": 0.5,   # share of quarters with all core inputs
+    "min_universe_coverage": 0.5, # share of tickers with core inputs in the latest quarter
+    "max_listed": 50,             # cells listed per check in the report
+}
+
+
+def build_matrices(data, tickers, quarters, items=None):
+    """Dense ticker × quarter float matrices per line item (NaN = missing)."""
+    t_idx = {t: i for i, t in enumerate(tickers)}
+    q_ords = np.array([quarter_ordinal(q) for q in quarters], dtype=int)
+    items = items or list(ITEM_ALIASES)
+    mats = {item: np.full((len(tickers), len(quarters)), np.nan) for item in items}
+    if not len(q_ords):
+        return mats
+    # Ordinal -> matrix column (-1 where the quarter is not in `quarters`)
+    lo = q_ords.min()
+    col_of = np.full(q_ords.max() - lo + 1, -1)
+    col_of[q_ords - lo] = np.arange(len(q_ords))
+    for ticker, ticker_items in data.items():
+        i = t_idx.get(ticker)
+        if i is None:
+            continue
+        for item, series in ticker_items.items():
+            m = mats.get(item)
+            if m is None:
+                continue
+            ords = series.ordinals[series.mask] - lo
+            keep = (ords >= 0) & (ords < len(col_of))
+            cols = col_of[ords[keep]]
+            hit = cols >= 0
+            m[i, cols[hit]] = series.values[series.mask][keep][hit]
+    return mats
+
+
+def run_quality_gate(data, quarters, thresholds=QUALITY_THRESHOLDS):
+    """Vectorized validation of the loaded CSV data.
+    
+    Returns a machine-readable report dict with status "pass", "warn" or "fail".
+    """
+    tickers = sorted(data)
+    mats = build_matrices(data, tickers, quarters)
+    tickers_arr = np.array(tickers, dtype=object)
+    quarters_arr = np.array(quarters, dtype=object)
+    checks = []
+    
+    def record(check, severity, item, mask, values, message):
+        cells = np.argwhere(mask)
+        listed = [
+            {"ticker": tickers_arr[i], "quarter": quarters_arr[j], "value": float(values[i, j])}
+            for i, j in cells[: thresholds["max_listed"]]
+        ]
+        if len(cells):
+            checks.append({
+                "check": check, "severity": severity, "item": item, "message": message,
+                "count": int(len(cells)), "tickers": sorted(set(tickers_arr[cells[:, 0]])), "cells": listed,
+            })
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rev = np.abs(mats["Revenue ($mm)"])
+        
+        # Unit magnitude: absolute ceiling and ratio to revenue
+        for item in MM_ITEMS:
+            m = mats[item]
+            record("unit_scale", "hard", item, np.abs(m) > thresholds["max_abs_mm"], m,
+                   f"|value| above {thresholds['max_abs_mm']:.0e} $mm — scale error")
+            if item != "Revenue ($mm)":
+                ratio = np.abs(m) / rev
+                record("unit_vs_revenue", "hard", item, ratio > thresholds["max_ratio_to_revenue"], m,
+                       f"more than {thresholds['max_ratio_to_revenue']:.0f}x revenue — unit mismatch")
+        for item in FLOW_ITEMS:
+            m = mats[item]
+            ratio = np.abs(m) / rev
+            record("flow_vs_revenue", "soft", item,
+                   (ratio > thresholds["max_flow_to_revenue"]) & (ratio <= thresholds["max_ratio_to_revenue"]), m,
+                   f"more than {thresholds['max_flow_to_revenue']}x revenue")
+        
+        # Quarter-over-quarter jumps
+        for item in ["Revenue ($mm)", "Goodwill ($mm)", "Headcount"]:
+            m = mats[item]
+            ratio = np.full_like(m, np.nan)
+            ratio[:, 1:] = np.abs(m[:, 1:]) / np.abs(m[:, :-1])
+            jump = (ratio > thresholds["max_qoq_ratio"]) | (ratio < 1 / thresholds["max_qoq_ratio"])
+            record("qoq_jump", "soft", item, jump & (np.abs(m[:, :]) > 0), m,
+                   f"changed more than {thresholds['max_qoq_ratio']}x vs prior quarter")
+        
+        # Balance-sheet identities
+        for item in STOCK_ITEMS:
+            m = mats[item]
+            record("negative_balance", "soft", item, m < 0, m, "balance-sheet stock is negative")
+        ic = (np.nan_to_num(mats["Total Debt ($mm)"]) + mats["Total Shareholders' Equity ($mm)"]
+              - np.nan_to_num(mats["Cash & Equivalents ($mm)"]))
+        record("invested_capital", "soft", "Invested Capital", ic <= 0, ic,
+               "debt + equity - cash is not positive; ROIC undefined")
+        
+        # Tax-rate bounds: isolated outliers happen (tax reform, near-zero
+        # pretax income); a whole series above 1 means percents, not ratios
+        tax = mats["Effective Tax Rate"]
+        lo, hi = thresholds["tax_rate_soft"]
+        has_tax = ~np.isnan(tax).all(axis=1)
+        median = np.full(len(tickers), np.nan)
+        median[has_tax] = np.nanmedian(np.abs(tax[has_tax]), axis=1)
+        percent_rows = (median > thresholds["tax_rate_hard"])[:, None] & ~np.isnan(tax)
+        record("tax_rate_units", "hard", "Effective Tax Rate", percent_rows, tax,
+               "series is not a ratio (median |rate| > 1)")
+        record("tax_rate", "soft", "Effective Tax Rate", ((tax < lo) | (tax > hi)) & ~percent_rows, tax,
+               f"outside [{lo}, {hi}]")
+    
+    # Coverage thresholds
+    core = np.ones((len(tickers), len(quarters)), dtype=bool)
+    for item in CORE_ITEMS:
+        core &= ~np.isnan(mats[item])
+    any_data = np.zeros_like(core)
+    for m in mats.values():
+        any_data |= ~np.isnan(m)
+    active = any_data.any(axis=0)
+    ticker_cov = core[:, active].mean(axis=1) if active.any() else np.zeros(len(tickers))
+    low = ticker_cov < thresholds["min_ticker_coverage"]
+    if low.any():
+        checks.append({
+            "check": "ticker_coverage", "severity": "soft", "item": "core inputs",
+            "message": f"fewer than {thresholds['min_ticker_coverage']:.0%} of quarters have all core inputs",
+            "count": int(low.sum()), "tickers": sorted(tickers_arr[low]),
+            "cells": [{"ticker": t, "coverage": round(float(c), 3)} for t, c in zip(tickers_arr[low], ticker_cov[low])],
+        })
+    latest = np.flatnonzero(active)
+    universe_cov = float(core[:, latest[-1]].mean()) if len(latest) and len(tickers) else 0.0
+    if universe_cov < thresholds["min_universe_coverage"]:
+        checks.append({
+            "check": "universe_coverage", "severity": "hard", "item": "core inputs",
+            "message": f"only {universe_cov:.0%} of tickers have core inputs in {quarters[latest[-1]] if len(latest) else 'any quarter'}",
+            "count": 1, "tickers": [], "cells": [],
+        })
+    
+    hard = [c for c in checks if c["severity"] == "hard"]
+    return {
+        "generated": datetime.now(timezone.utc).isoformat(),
+        "status": "fail" if hard else ("warn" if checks else "pass"),
+        "tickers": len(tickers),
+        "quarters": len(quarters),
+        "hard_failures": sum(c["count"] for c in hard),
+        "soft_failures": sum(c["count"] for c in checks if c["severity"] == "soft"),
+        "checks": checks,
+    }
+
+
 def safe_div(a, b, default=None):
     if b is None or b == 0 or a is None:
         return default
@@ -161,78 +406,188 @@ def clamp(v, lo=-3, hi=3):
     return max(lo, min(hi, v))
 
 
-def calculate_adjustments(data, quarters):
-    """Apply Tier 1-2 ROIC adjustments."""
+def quarter_span(quarters):
+    """(first ordinal, ordinal span, position of each quarter within the span)."""
+    start = quarter_ordinal(quarters[0])
+    span = quarter_ordinal(quarters[-1]) - start + 1
+    return start, span, [quarter_ordinal(q) - start for q in quarters]
+
+
+# ── ROIC metric graph ──
+# Every calculate_adjustments field is a node naming the CSV line items or
+# other nodes it is computed from. calculate_adjustments evaluates only the
+# nodes its requested fields need; to add a field, add a node here and list
+# it in ADJUSTMENT_FIELDS.
+
+ROIC_METRICS = MetricGraph()
+
+
+def _derived(like, values, mask):
+    return PeriodSeries(like.start, len(like.values), np.where(mask, values, 0.0), mask)
+
+
+def _or_zero(s):
+    return s.filled(0.0)
+
+
+def _annualized(nopat, ic):
+    """safe_div(nopat, ic, 0) * 4, elementwise."""
+    nz = ic.values != 0
+    return np.where(nz, nopat.values / np.where(nz, ic.values, 1), 0.0) * 4
+
+
+@ROIC_METRICS.metric("valid", "Operating Income ($mm)", "Effective Tax Rate", "Total Debt ($mm)",
+                     "Total Shareholders' Equity ($mm)")
+def _valid(opinc, tax, debt, equity):
+    """Quarters with every core field, the only ones reported."""
+    ok = opinc.mask & tax.mask & debt.mask & equity.mask
+    return _derived(opinc, ok, ok)
+
+
+@ROIC_METRICS.metric("nopat", "Operating Income ($mm)", "Effective Tax Rate", "valid")
+def _nopat(opinc, tax, valid):
+    return _derived(opinc, opinc.values * (1 - tax.values), valid.mask)
+
+
+@ROIC_METRICS.metric("invested_capital", "Total Debt ($mm)", "Total Shareholders' Equity ($mm)",
+                     "Cash & Equivalents ($mm)", "valid")
+def _invested_capital(debt, equity, cash, valid):
+    return _derived(debt, debt.values + equity.values - _or_zero(cash), valid.mask)
+
+
+@ROIC_METRICS.metric("restruct_avg", "Restructuring Charges ($mm)")
+def _restruct_avg(restructuring):
+    """Restructuring amortized over the trailing 4 quarters (missing = 0)."""
+    return restructuring.trailing_mean(4)
+
+
+@ROIC_METRICS.metric("adj_invested_capital", "invested_capital", "Goodwill ($mm)", "Acquired Intangibles ($mm)",
+                     "Operating Lease Liabilities ($mm)")
+def _adj_invested_capital(ic, goodwill, intang, leases):
+    return _derived(ic, ic.values - _or_zero(goodwill) - _or_zero(intang) + _or_zero(leases), ic.mask)
+
+
+@ROIC_METRICS.metric("adj_nopat", "Operating Income ($mm)", "restruct_avg", "Effective Tax Rate", "valid")
+def _adj_nopat(opinc, restruct_avg, tax, valid):
+    return _derived(opinc, (opinc.values - restruct_avg.values) * (1 - tax.values), valid.mask)
+
+
+@ROIC_METRICS.metric("reported_roic", "nopat", "invested_capital")
+def _reported_roic(nopat, ic):
+    return _derived(nopat, _annualized(nopat, ic), nopat.mask)
+
+
+@ROIC_METRICS.metric("adj_roic", "adj_nopat", "adj_invested_capital")
+def _adj_roic(adj_nopat, adj_ic):
+    return _derived(adj_nopat, _annualized(adj_nopat, adj_ic), adj_nopat.mask)
+
+
+@ROIC_METRICS.metric("spread", "adj_nopat", "adj_invested_capital", "nopat", "invested_capital")
+def _spread(adj_nopat, adj_ic, nopat, ic):
+    return _derived(nopat, _annualized(adj_nopat, adj_ic) - _annualized(nopat, ic), nopat.mask)
+
+
+@ROIC_METRICS.metric("rev_per_employee", "Revenue ($mm)", "Headcount", "valid")
+def _rev_per_employee(rev, headcount, valid):
+    """Annualized revenue per employee in $k (None where zero or unknown)."""
+    ok = valid.mask & rev.mask & headcount.mask & (headcount.values != 0)
+    v = rev.values / np.where(ok, headcount.values, 1) * 4 * 1000
+    return _derived(rev, v, ok & (v != 0))
+
+
+@ROIC_METRICS.metric("capex_intensity", "Capital Expenditures ($mm)", "Revenue ($mm)", "valid")
+def _capex_intensity(capex, rev, valid):
+    ok = valid.mask & capex.mask & rev.mask & (rev.values != 0)
+    v = capex.values / np.where(ok, rev.values, 1)
+    return _derived(rev, v, ok & (v != 0))
+
+
+@ROIC_METRICS.metric("fcf_conversion", "Free Cash Flow ($mm)", "adj_nopat")
+def _fcf_conversion(fcf, adj_nopat):
+    ok = adj_nopat.mask & fcf.mask & (adj_nopat.values != 0)
+    v = fcf.values / np.where(ok, adj_nopat.values, 1)
+    return _derived(adj_nopat, v, ok & (v != 0))
+
+
+@ROIC_METRICS.metric("buyback_flag", "Share Buybacks ($mm)", "adj_nopat")
+def _buyback_flag(buybacks, adj_nopat):
+    """Buybacks above 30% of adjusted NOPAT."""
+    flag = (adj_nopat.values != 0) & (_or_zero(buybacks) > adj_nopat.values * 0.3)
+    return _derived(adj_nopat, flag, adj_nopat.mask)
+
+
+# Line items reported as-is: {field: (line item, value when missing)}
+PASSTHROUGH_FIELDS = {
+    "revenue": ("Revenue ($mm)", None),
+    "operating_income": ("Operating Income ($mm)", None),
+    "goodwill": ("Goodwill ($mm)", 0),
+    "intangibles": ("Acquired Intangibles ($mm)", 0),
+    "leases": ("Operating Lease Liabilities ($mm)", 0),
+    "market_cap": ("Market Cap ($mm)", None),
+    "headcount": ("Headcount", None),
+}
+
+# Output fields in the order written to the JSON, with their rounding
+ADJUSTMENT_FIELDS = {
+    "adj_roic": 4, "reported_roic": 4, "spread": 4,
+    "revenue": None, "operating_income": None,
+    "nopat": 1, "invested_capital": 1, "adj_invested_capital": 1, "adj_nopat": 1, "restruct_avg": 1,
+    "goodwill": None, "intangibles": None, "leases": None, "market_cap": None, "headcount": None,
+    "rev_per_employee": 1, "capex_intensity": 4, "fcf_conversion": 4,
+    "buyback_flag": None,
+}
+# Fields clamped on output (the nodes hold the unclamped values)
+CLAMPED_FIELDS = {"adj_roic": (-3, 3), "reported_roic": (-3, 3), "spread": (-2, 2)}
+
+
+def calculate_adjustments(data, quarters, fields=None, cache=None):
+    """Apply Tier 1-2 ROIC adjustments.
+    
+    Only the ROIC_METRICS nodes behind `fields` (default: all of
+    ADJUSTMENT_FIELDS) are evaluated. `cache` ({ticker: {}}) keeps node
+    results between calls so companies whose inputs are unchanged skip
+    recomputation.
+    """
     results = {}
+    if not quarters:
+        return results
+    fields = [f for f in ADJUSTMENT_FIELDS if fields is None or f in fields]
+    start, span, positions = quarter_span(quarters)
+    empty = PeriodSeries(start, span)
+    nodes = ["valid"] + [f for f in fields if f in ROIC_METRICS.nodes]
     
     for ticker, items in data.items():
         if ticker not in COMPANIES:
             continue
         
-        co_result = {"info": COMPANIES[ticker], "quarters": {}}
+        co_result = {"info": COMPANY_INFO[ticker].as_dict(), "quarters": {}}
+        # Every item aligned to the same ordinal range, so nodes are array operations
+        series = {item: items[item].reindex(start, span) for item in ROIC_METRICS.requires(nodes) | set(
+            item for item, _ in PASSTHROUGH_FIELDS.values()) if item in items}
+        out = ROIC_METRICS.evaluate(series, nodes, None if cache is None else cache.setdefault(ticker, {}), empty)
+        columns = {}
+        for f in fields:
+            if f in out:
+                columns[f] = (out[f].values.tolist(), out[f].mask.tolist(), None)
+            else:
+                item, missing = PASSTHROUGH_FIELDS[f]
+                s = series.get(item, empty)
+                columns[f] = (s.values.tolist(), s.mask.tolist(), missing)
         
-        for qi, q in enumerate(quarters):
-            rev = items.get("Revenue ($mm)", {}).get(q)
-            opinc = items.get("Operating Income ($mm)", {}).get(q)
-            tax_rate = items.get("Effective Tax Rate", {}).get(q)
-            sbc = items.get("Stock-Based Compensation ($mm)", {}).get(q, 0)
-            
-            restruct_vals = []
-            for back in range(min(4, qi + 1)):
-                bq = quarters[qi - back]
-                rv = items.get("Restructuring Charges ($mm)", {}).get(bq, 0)
-                restruct_vals.append(rv or 0)
-            restruct_avg = sum(restruct_vals) / len(restruct_vals) if restruct_vals else 0
-            
-            debt = items.get("Total Debt ($mm)", {}).get(q)
-            equity = items.get("Total Shareholders' Equity ($mm)", {}).get(q)
-            cash = items.get("Cash & Equivalents ($mm)", {}).get(q)
-            goodwill = items.get("Goodwill ($mm)", {}).get(q, 0)
-            intang = items.get("Acquired Intangibles ($mm)", {}).get(q, 0)
-            leases = items.get("Operating Lease Liabilities ($mm)", {}).get(q, 0)
-            buybacks = items.get("Share Buybacks ($mm)", {}).get(q, 0)
-            headcount = items.get("Headcount", {}).get(q)
-            capex = items.get("Capital Expenditures ($mm)", {}).get(q)
-            fcf = items.get("Free Cash Flow ($mm)", {}).get(q)
-            mktcap = items.get("Market Cap ($mm)", {}).get(q)
-            
-            if opinc is None or tax_rate is None or debt is None or equity is None:
+        valid = out["valid"].mask
+        for i, q in zip(positions, quarters):
+            if not valid[i]:
                 continue
-            
-            nopat = opinc * (1 - tax_rate)
-            invested_capital = (debt or 0) + (equity or 0) - (cash or 0)
-            reported_roic = safe_div(nopat, invested_capital, 0) * 4
-            
-            adj_ic = invested_capital - (goodwill or 0) - (intang or 0) + (leases or 0)
-            adj_nopat = (opinc - restruct_avg) * (1 - tax_rate)
-            adj_roic = safe_div(adj_nopat, adj_ic, 0) * 4
-            
-            rev_per_emp = safe_div(rev, headcount, 0) * 4 * 1000 if headcount else None
-            capex_intensity = safe_div(capex, rev, 0) if rev else None
-            fcf_conversion = safe_div(fcf, adj_nopat, 0) if adj_nopat and adj_nopat != 0 else None
-            buyback_flag = (buybacks or 0) > (adj_nopat * 0.3) if adj_nopat else False
-            
-            co_result["quarters"][q] = {
-                "adj_roic": round(clamp(adj_roic), 4),
-                "reported_roic": round(clamp(reported_roic), 4),
-                "spread": round(clamp(adj_roic - reported_roic, -2, 2), 4),
-                "revenue": rev,
-                "operating_income": opinc,
-                "nopat": round(nopat, 1),
-                "invested_capital": round(invested_capital, 1),
-                "adj_invested_capital": round(adj_ic, 1),
-                "adj_nopat": round(adj_nopat, 1),
-                "restruct_avg": round(restruct_avg, 1),
-                "goodwill": goodwill,
-                "intangibles": intang,
-                "leases": leases,
-                "market_cap": mktcap,
-                "headcount": headcount,
-                "rev_per_employee": round(rev_per_emp, 1) if rev_per_emp else None,
-                "capex_intensity": round(capex_intensity, 4) if capex_intensity else None,
-                "fcf_conversion": round(fcf_conversion, 4) if fcf_conversion else None,
-                "buyback_flag": buyback_flag,
-            }
+            qd = {}
+            for f, (values, mask, missing) in columns.items():
+                if f == "buyback_flag":
+                    qd[f] = bool(values[i])
+                elif not mask[i]:
+                    qd[f] = missing
+                else:
+                    v = clamp(values[i], *CLAMPED_FIELDS[f]) if f in CLAMPED_FIELDS else values[i]
+                    qd[f] = v if ADJUSTMENT_FIELDS[f] is None else round(v, ADJUSTMENT_FIELDS[f])
+            co_result["quarters"][q] = qd
         
         if co_result["quarters"]:
             results[ticker] = co_result
@@ -240,6 +595,255 @@ def calculate_adjustments(data, quarters):
     return results
 
 
+def load_previous_internal(path, quarters):
+    """A previous internal data.json, if its quarters still match."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if previous.get("quarters") != quarters:
+        return None
+    return previous
+
+
+# ── Gap imputation ──
+# Interior gaps of up to IMPUTE_MAX_GAP quarters are filled by a Brownian
+# bridge between the observed neighbours: the centre is the straight line
+# between them, and each Monte Carlo draw adds bridge noise scaled by the
+# series' own quarter-to-quarter volatility. Flow items are bridged on
+# their year-over-year change and added to the same quarter a year
+# earlier, which keeps seasonality (a missing Q4 looks like last Q4). All
+# draws for a gap are one array operation. The CSVs only carry quarterly
+# cells (annual/YTD differencing already happens at extraction), so those
+# neighbours are the constraints available here.
+
+IMPUTE_MAX_GAP = 4
+IMPUTE_ITEMS = {
+    "Revenue ($mm)": "flow",
+    "Operating Income ($mm)": "flow",
+    "Capital Expenditures ($mm)": "flow",
+    "Free Cash Flow ($mm)": "flow",
+    "Effective Tax Rate": "level",
+    "Total Debt ($mm)": "level",
+    "Total Shareholders' Equity ($mm)": "level",
+    "Cash & Equivalents ($mm)": "level",
+    "Goodwill ($mm)": "level",
+    "Acquired Intangibles ($mm)": "level",
+    "Operating Lease Liabilities ($mm)": "level",
+    "Headcount": "level",
+}
+
+
+def _bridge(values, mask, draws, rng, max_gap=IMPUTE_MAX_GAP):
+    """(centre, draws × span samples, filled mask) for one series, or None.
+    
+    Gaps longer than max_gap, and quarters before the first or after the
+    last observation, stay missing.
+    """
+    obs = np.flatnonzero(mask)
+    if len(obs) < 2:
+        return None
+    steps = np.diff(values[obs]) / np.sqrt(np.diff(obs))
+    sigma = float(np.std(steps)) if len(steps) > 1 else abs(float(steps[0]))
+    centre = np.where(mask, values, 0.0)
+    samples = np.repeat(centre[None], draws, axis=0)
+    filled = mask.copy()
+    for a, b in zip(obs[:-1], obs[1:]):
+        n = b - a - 1
+        if n == 0 or n > max_gap:
+            continue
+        frac = np.arange(1, n + 1) / (n + 1)
+        line = values[a] + (values[b] - values[a]) * frac
+        walk = np.cumsum(rng.normal(0.0, sigma, (draws, n + 1)), axis=1)
+        centre[a + 1:b] = line
+        samples[:, a + 1:b] = line + walk[:, :n] - walk[:, -1:] * frac
+        filled[a + 1:b] = True
+    return centre, samples, filled
+
+
+def impute_series(series, kind, draws, rng):
+    """Imputed (centre PeriodSeries, samples, imputed mask) for one line item."""
+    values, mask = series.values, series.mask
+    level = _bridge(values, mask, draws, rng)
+    if level is None:
+        return None
+    centre, samples, filled = level
+    if kind == "flow":
+        prior = series.shift(4)
+        yoy = _bridge(values - prior.values, mask & prior.mask, draws, rng)
+        if yoy is not None:
+            d_centre, d_samples, d_filled = yoy
+            # In time order, so a quarter can build on one imputed a year earlier
+            for i in np.flatnonzero(~mask & d_filled):
+                if i >= 4 and (mask[i - 4] or filled[i - 4]):
+                    centre[i] = centre[i - 4] + d_centre[i]
+                    samples[:, i] = samples[:, i - 4] + d_samples[:, i]
+                    filled[i] = True
+    imputed = filled & ~mask
+    return PeriodSeries(series.start, len(values), centre, filled), samples, imputed
+
+
+def impute_gaps(data, quarters, draws=None, seed=None):
+    """Fill short gaps in IMPUTE_ITEMS for every company.
+    
+    Returns (filled data in the load_combined_csv shape, {ticker: {item:
+    (samples, imputed mask)}} for the items that changed).
+    """
+    draws = IMPUTE_DRAWS if draws is None else draws
+    rng = np.random.default_rng(IMPUTE_SEED if seed is None else seed)
+    start, span, _ = quarter_span(quarters)
+    filled, samples = {}, {}
+    for t, items in data.items():
+        filled[t] = dict(items)
+        for item, kind in IMPUTE_ITEMS.items():
+            if item not in items:
+                continue
+            out = impute_series(items[item].reindex(start, span), kind, draws, rng)
+            if out is not None and out[2].any():
+                filled[t][item] = out[0]
+                samples.setdefault(t, {})[item] = (out[1], out[2])
+    return filled, samples
+
+
+def imputation_bands(results, data, samples, quarters, lo=5, hi=95):
+    """Monte Carlo bands for adj_roic and the indices.
+    
+    Every draw recomputes adjusted ROIC from its sampled inputs (as
+    calculate_adjustments does), and the indices from those ROICs. Quarters
+    with an imputed input gain "adj_roic_band" [lo, hi] and "imputed" (the
+    items filled). Returns {"draws", "cells", "index_bands"}.
+    """
+    start, span, positions = quarter_span(quarters)
+    empty = PeriodSeries(start, span)
+    draws = next((s.shape[0] for co in samples.values() for s, _ in co.values()), 0)
+    num = {key: np.zeros((draws, len(quarters))) for key in ("all", "tier1", "tier2")}
+    den = {key: np.zeros(len(quarters)) for key in num}
+    cells = {}
+    pos = np.array(positions)
+    
+    for t, co in results.items():
+        items = data.get(t, {})
+        drawn = samples.get(t, {})
+        
+        def value(item, fill=None):
+            if item in drawn:
+                return drawn[item][0][:, pos]
+            s = items[item].reindex(start, span) if item in items else empty
+            return (s.values if fill is None else s.filled(fill))[pos]
+        
+        restruct = (items["Restructuring Charges ($mm)"].reindex(start, span) if "Restructuring Charges ($mm)" in items
+                    else empty).trailing_mean(4).values[pos]
+        opinc, tax = value("Operating Income ($mm)"), value("Effective Tax Rate")
+        ic = value("Total Debt ($mm)") + value("Total Shareholders' Equity ($mm)") - value("Cash & Equivalents ($mm)", 0.0)
+        adj_ic = ic - value("Goodwill ($mm)", 0.0) - value("Acquired Intangibles ($mm)", 0.0) \
+            + value("Operating Lease Liabilities ($mm)", 0.0)
+        adj_nopat = (opinc - restruct) * (1 - tax)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            roic = np.clip(np.where(adj_ic != 0, adj_nopat / np.where(adj_ic != 0, adj_ic, 1), 0.0) * 4, -3, 3)
+        roic = np.broadcast_to(roic, (draws, len(quarters)))
+        
+        flagged = np.zeros(len(quarters), dtype=bool)
+        for item, (_, imputed) in drawn.items():
+            flagged |= imputed[pos]
+        cells[t] = int(flagged.sum())
+        for j, q in enumerate(quarters):
+            qd = co["quarters"].get(q)
+            if not qd:
+                continue
+            if flagged[j]:
+                band = np.percentile(roic[:, j], [lo, hi])
+                qd["adj_roic_band"] = [round(float(band[0]), 4), round(float(band[1]), 4)]
+                qd["imputed"] = sorted(item for item, (_, imputed) in drawn.items() if imputed[pos[j]])
+            if qd.get("market_cap") and qd.get("adj_roic") is not None:
+                for key, tier in (("all", None), ("tier1", 1), ("tier2", 2)):
+                    if tier is None or co["info"]["tier"] == tier:
+                        num[key][:, j] += qd["market_cap"] * roic[:, j]
+                        den[key][j] += qd["market_cap"]
+    
+    bands = {key: {} for key in ("all", "tier1", "tier2", "gap")}
+    index_draws = {}
+    for key in num:
+        ok = den[key] > 0
+        index_draws[key] = np.where(ok, num[key] / np.where(ok, den[key], 1), np.nan)
+    index_draws["gap"] = index_draws["tier1"] - index_draws["tier2"]
+    for key, m in index_draws.items():
+        for j in np.flatnonzero(~np.isnan(m).any(axis=0)) if draws else []:
+            b = np.percentile(m[:, j], [lo, hi])
+            bands[key][quarters[j]] = [round(float(b[0]), 4), round(float(b[1]), 4)]
+    return {"draws": draws, "cells": cells, "index_bands": bands}
+
+
+# ── Rolling windows ──
+# Trailing-twelve-month flows, trailing-average capital, TTM ROIC and YoY
+# deltas. Every window is a PeriodSeries.rolling_sum / rolling_mean (two
+# cumulative sums, O(1) per quarter); a TTM value exists only when all four
+# quarters do, so gaps never read as a full year.
+
+TTM_WINDOW = 4
+
+
+def _results_series(co, field, start, span):
+    """PeriodSeries of one calculate_adjustments field for one company."""
+    s = PeriodSeries(start, span)
+    for q, qd in co["quarters"].items():
+        v = qd.get(field)
+        if v is not None:
+            s[q] = v
+    return s
+
+
+def _at(series, positions, digits=4):
+    """JSON list of a series at the given positions (None where invalid)."""
+    return [round(float(series.values[i]), digits) if series.mask[i] else None for i in positions]
+
+
+def calculate_rolling(data, results, quarters, tickers=None):
+    """TTM and YoY series per company, as lists aligned with `quarters`.
+    
+    Only `tickers` (default: every company in results) are computed, so an
+    incremental run can reuse the previous output for everyone else.
+    """
+    if not quarters:
+        return {}
+    start, span, positions = quarter_span(quarters)
+    rolling = {}
+    for t in (tickers if tickers is not None else results):
+        if t not in results:
+            continue
+        co, items = results[t], data.get(t, {})
+        raw = {item: series.reindex(start, span) for item, series in items.items() if item in ITEM_ALIASES}
+        
+        ttm = {}
+        if "Revenue ($mm)" in raw:
+            ttm["revenue"] = _at(raw["Revenue ($mm)"].rolling_sum(TTM_WINDOW), positions, 1)
+        for kind, nopat_field, ic_field in [("reported", "nopat", "invested_capital"),
+                                           ("adj", "adj_nopat", "adj_invested_capital")]:
+            nopat = _results_series(co, nopat_field, start, span).rolling_sum(TTM_WINDOW)
+            avg_ic = _results_series(co, ic_field, start, span).rolling_mean(TTM_WINDOW)
+            ok = nopat.mask & avg_ic.mask & (avg_ic.values != 0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                roic = np.clip(np.where(ok, nopat.values / np.where(ok, avg_ic.values, 1), 0.0), -3, 3)
+            ttm[nopat_field] = _at(nopat, positions, 1)
+            ttm[f"avg_{ic_field}"] = _at(avg_ic, positions, 1)
+            ttm[f"{kind}_roic"] = _at(PeriodSeries(start, span, roic, ok), positions)
+        
+        yoy = {}
+        for item, s in raw.items():
+            prev = s.shift(TTM_WINDOW)
+            ok = s.mask & prev.mask
+            delta = PeriodSeries(start, span, s.values - prev.values, ok)
+            nonzero = ok & (prev.values != 0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                pct = PeriodSeries(start, span, np.where(nonzero, delta.values / np.abs(np.where(nonzero, prev.values, 1)), 0.0), nonzero)
+            yoy[item] = {"delta": _at(delta, positions), "pct": _at(pct, positions)}
+        
+        rolling[t] = {"ttm": ttm, "yoy": yoy}
+    return rolling
+
+
 def calculate_indices(results, quarters):
     indices = {"all": {}, "tier1": {}, "tier2": {}, "gap": {}}
     
@@ -269,17 +873,727 @@ def calculate_indices(results, quarters):
     return indices
 
 
-def generate_public_json(results, indices, quarters, events):
+def results_matrix(results, tickers, quarters, field):
+    """Ticker × quarter matrix of one calculate_adjustments field (NaN = missing)."""
+    q_idx = {q: j for j, q in enumerate(quarters)}
+    m = np.full((len(tickers), len(quarters)), np.nan)
+    for i, t in enumerate(tickers):
+        for q, qd in results[t]["quarters"].items():
+            v = qd.get(field)
+            if v is not None and q in q_idx:
+                m[i, q_idx[q]] = v
+    return m
+
+
+def _to_list(arr, digits=4):
+    """NaN-safe JSON list."""
+    return [None if np.isnan(v) else round(float(v), digits) for v in arr]
+
+
+def calculate_rollups(results, quarters, top_n=10, hist_edges=None):
+    """Precompute the aggregates the dashboards render.
+    
+    Every series is a list aligned with `quarters`, so pages plot them as-is
+    instead of walking every company in the browser: equal-weight tier and
+    sector averages, cross-sectional percentile bands, a histogram of the
+    current quarter, the full ranking for that quarter and top/bottom-N lists.
+    """
+    tickers = list(results)
+    if not tickers:
+        return {}
+    roic = results_matrix(results, tickers, quarters, "adj_roic")
+    tiers = np.array([results[t]["info"]["tier"] for t in tickers])
+    sectors = np.array([results[t]["info"]["sector"] for t in tickers])
+    counts = (~np.isnan(roic)).sum(axis=0)
+    
+    with np.errstate(invalid="ignore", divide="ignore"):
+        def col_mean(mask):
+            sub = roic[mask]
+            n = (~np.isnan(sub)).sum(axis=0)
+            return np.where(n > 0, np.nansum(sub, axis=0) / np.maximum(n, 1), np.nan)
+        
+        equal_weight = {"all": _to_list(col_mean(np.ones(len(tickers), dtype=bool)))}
+        for tier in (1, 2):
+            equal_weight[f"tier{tier}"] = _to_list(col_mean(tiers == tier))
+        
+        sector_series = {}
+        for sector in sorted(set(sectors)):
+            mask = sectors == sector
+            sector_series[sector] = {
+                "adj_roic": _to_list(col_mean(mask)),
+                "count": (~np.isnan(roic[mask])).sum(axis=0).tolist(),
+            }
+        
+        # Percentile bands (need a few companies per quarter to mean anything)
+        pct_levels = [10, 25, 50, 75, 90]
+        bands = np.full((len(pct_levels), len(quarters)), np.nan)
+        enough = counts >= 3
+        if enough.any():
+            bands[:, enough] = np.nanpercentile(roic[:, enough], pct_levels, axis=0)
+        percentiles = {f"p{p}": _to_list(bands[k]) for k, p in enumerate(pct_levels)}
+    
+    # Current quarter = latest with any adj_roic
+    populated = np.flatnonzero(counts)
+    if not len(populated):
+        return {"quarters": quarters, "equal_weight": equal_weight, "sectors": sector_series,
+                "percentiles": percentiles}
+    cur = populated[-1]
+    current = roic[:, cur]
+    valid = ~np.isnan(current)
+    
+    edges = np.asarray(hist_edges if hist_edges is not None else np.round(np.arange(-0.5, 2.01, 0.1), 2))
+    clipped = np.clip(current[valid], edges[0], edges[-1])
+    histogram = {"edges": edges.tolist(), "all": np.histogram(clipped, edges)[0].tolist()}
+    for tier in (1, 2):
+        sel = np.clip(current[valid & (tiers == tier)], edges[0], edges[-1])
+        histogram[f"tier{tier}"] = np.histogram(sel, edges)[0].tolist()
+    
+    order = np.flatnonzero(valid)[np.argsort(-current[valid], kind="stable")]
+    n = min(top_n, len(order) // 2) if len(order) > 1 else len(order)
+    
+    def entry(i):
+        info = results[tickers[i]]["info"]
+        return {"ticker": tickers[i], "name": info["name"], "tier": info["tier"],
+                "adj_roic": round(float(current[i]), 4)}
+    
+    return {
+        "quarter": quarters[cur],
+        "equal_weight": equal_weight,
+        "sectors": sector_series,
+        "percentiles": percentiles,
+        "histogram": histogram,
+        "ranked": [entry(i) for i in order],
+        "top": [entry(i) for i in order[:n]],
+        "bottom": [entry(i) for i in order[::-1][:n]],
+    }
+
+
+# ── Sensitivity grid ──
+# Re-derives adjusted ROIC from the raw CSV matrices under every combination
+# of methodology choices at once. Each parameter owns one tensor axis, so the
+# whole grid is a single broadcast (window × goodwill × intangibles × leases
+# × ticker × quarter) followed by per-annualization / per-clamp reductions.
+# Tickers are taken in chunks and only the per-tier sums are kept, so memory
+# does not grow with the universe.
+
+SENSITIVITY_GRID = {
+    "restructuring_window": [1, 2, 4, 6, 8],
+    "goodwill_strip": [0.0, 0.25, 0.5, 0.75, 1.0],
+    "intangibles_strip": [0.0, 0.25, 0.5, 0.75, 1.0],
+    "lease_addback": [0.0, 0.25, 0.5, 0.75, 1.0],
+    "annualization": ["x4", "compound"],
+    "clamp": [1.0, 2.0, 3.0, 5.0, None],
+}
+# The configuration calculate_adjustments uses
+SENSITIVITY_BASELINE = {
+    "restructuring_window": 4, "goodwill_strip": 1.0, "intangibles_strip": 1.0,
+    "lease_addback": 1.0, "annualization": "x4", "clamp": 3.0,
+}
+
+
+def _trailing_mean(m, window):
+    """Mean over the last min(window, q+1) columns, NaN counted as 0."""
+    c = np.cumsum(np.nan_to_num(m), axis=-1)
+    shifted = np.zeros_like(c)
+    shifted[..., window:] = c[..., :-window]
+    n = np.minimum(np.arange(1, m.shape[-1] + 1), window)
+    return (c - shifted) / n
+
+
+def run_sensitivity(data, quarters, grid=SENSITIVITY_GRID, trailing=4, chunk=SENSITIVITY_CHUNK):
+    """Tier-gap surfaces over every methodology configuration in `grid`.
+    
+    Surfaces are nested lists in the axis order of `grid`; the gap is the
+    equal-weight tier 1 minus tier 2 adjusted ROIC.
+    """
+    tickers = [t for t in data if t in COMPANIES]
+    mats = build_matrices(data, tickers, quarters)
+    tiers = np.array([COMPANIES[t]["tier"] for t in tickers])
+    
+    def axis(values, pos, ndim=4):
+        shape = [1] * (ndim + 2)
+        shape[pos] = len(values)
+        return np.asarray(values, dtype=float).reshape(shape)
+    
+    params = [grid[k] for k in ("restructuring_window", "goodwill_strip", "intangibles_strip", "lease_addback")]
+    shape = tuple(len(p) for p in params) + (len(quarters),)
+    n_ann, n_clamp = len(grid["annualization"]), len(grid["clamp"])
+    # Tier 1 / tier 2 sums and counts: 2 × A × C × W × G × H × L × Q
+    total = np.zeros((2, n_ann, n_clamp) + shape)
+    count = np.zeros_like(total)
+    populated = np.zeros(len(quarters), dtype=bool)
+    
+    for lo in range(0, len(tickers), max(chunk, 1)):
+        rows = slice(lo, lo + max(chunk, 1))
+        m = {item: mat[rows] for item, mat in mats.items()}
+        opinc = m["Operating Income ($mm)"]
+        tax = m["Effective Tax Rate"]
+        debt = m["Total Debt ($mm)"]
+        equity = m["Total Shareholders' Equity ($mm)"]
+        valid = ~(np.isnan(opinc) | np.isnan(tax) | np.isnan(debt) | np.isnan(equity))
+        populated |= valid.any(axis=0)
+        zero = lambda item: np.nan_to_num(m[item])
+        ic = np.nan_to_num(debt) + np.nan_to_num(equity) - zero("Cash & Equivalents ($mm)")
+        
+        # W × G × H × L × n × Q
+        restruct = np.stack([_trailing_mean(m["Restructuring Charges ($mm)"], w)
+                             for w in grid["restructuring_window"]])[:, None, None, None]
+        adj_nopat = (opinc - restruct) * (1 - tax)
+        adj_ic = (ic - axis(grid["goodwill_strip"], 1) * zero("Goodwill ($mm)")
+                  - axis(grid["intangibles_strip"], 2) * zero("Acquired Intangibles ($mm)")
+                  + axis(grid["lease_addback"], 3) * zero("Operating Lease Liabilities ($mm)"))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            quarterly = np.where(adj_ic != 0, adj_nopat / adj_ic, 0.0)
+        quarterly = np.where(valid, quarterly, np.nan)
+        del restruct, adj_nopat, adj_ic
+        
+        tier_masks = [(tiers[rows] == 1).astype(float), (tiers[rows] == 2).astype(float)]
+        for a, ann in enumerate(grid["annualization"]):
+            with np.errstate(invalid="ignore"):
+                annual = quarterly * 4 if ann == "x4" else np.power(1 + np.maximum(quarterly, -1), 4) - 1
+            for c, cap in enumerate(grid["clamp"]):
+                v = annual if cap is None else np.clip(annual, -cap, cap)
+                present = ~np.isnan(v)
+                filled = np.where(present, v, 0.0)
+                for k, w in enumerate(tier_masks):
+                    # Tier sum per quarter: contract the ticker axis
+                    total[k, a, c] += np.tensordot(filled, w, axes=([-2], [0]))
+                    count[k, a, c] += np.tensordot(present.astype(float), w, axes=([-2], [0]))
+    
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = total / count
+    gap = np.moveaxis(means[0] - means[1], [0, 1], [4, 5])      # W × G × H × L × A × C × Q
+    populated = np.flatnonzero(populated)
+    cols = populated[-trailing:] if len(populated) else populated
+    
+    latest = gap[..., cols[-1]] if len(cols) else np.full(gap.shape[:-1], np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        trail = np.nanmean(gap[..., cols], axis=-1) if len(cols) else latest
+        live = ~np.isnan(gap)
+        share_pos = np.where(live.any(axis=-1), (gap > 0).sum(axis=-1) / np.maximum(live.sum(axis=-1), 1), np.nan)
+    
+    def nested(arr, digits=4):
+        return np.vectorize(lambda x: None if np.isnan(x) else round(float(x), digits), otypes=[object])(arr).tolist()
+    
+    base_idx = tuple(grid[k].index(SENSITIVITY_BASELINE[k]) for k in grid)
+    finite = latest[~np.isnan(latest)]
+    return {
+        "generated": datetime.now(timezone.utc).isoformat(),
+        "axes": list(grid),
+        "params": grid,
+        "configurations": int(latest.size),
+        "latest_quarter": quarters[cols[-1]] if len(cols) else None,
+        "trailing_quarters": [quarters[j] for j in cols],
+        "baseline": {
+            "params": SENSITIVITY_BASELINE,
+            "latest_gap": nested(latest[base_idx]),
+            "gap": nested(gap[base_idx]),
+        },
+        "summary": {
+            "latest_gap_min": round(float(finite.min()), 4) if finite.size else None,
+            "latest_gap_max": round(float(finite.max()), 4) if finite.size else None,
+            "share_configs_tier1_ahead": round(float((finite > 0).mean()), 4) if finite.size else None,
+        },
+        "surfaces": {
+            "latest_gap": nested(latest),
+            f"mean_gap_{trailing}q": nested(trail),
+            "share_quarters_tier1_ahead": nested(share_pos, 3),
+        },
+    }
+
+
+# ── Cross-sectional ranks ──
+# Where each company stood against the universe in every quarter: a
+# mid-rank percentile (ties share the average position) from one sort per
+# quarter, and a z-score against its own sector's mean and spread.
+
+RANK_FIELDS = [
+    "adj_roic", "reported_roic", "spread", "revenue", "operating_income", "nopat",
+    "invested_capital", "adj_invested_capital", "adj_nopat", "restruct_avg",
+    "goodwill", "intangibles", "leases", "market_cap", "headcount",
+    "rev_per_employee", "capex_intensity", "fcf_conversion",
+]
+PUBLIC_RANK_FIELDS = ["adj_roic", "spread", "rev_per_employee"]
+
+
+def percentile_ranks(m):
+    """Column-wise mid-rank percentiles in [0, 1] for a ticker × quarter matrix."""
+    out = np.full(m.shape, np.nan)
+    ordered = np.sort(m, axis=0)               # NaN sorts last
+    counts = (~np.isnan(m)).sum(axis=0)
+    for j in np.flatnonzero(counts):
+        col = ordered[:counts[j], j]
+        valid = ~np.isnan(m[:, j])
+        v = m[valid, j]
+        below = np.searchsorted(col, v, side="left")
+        upto = np.searchsorted(col, v, side="right")
+        out[valid, j] = (below + upto) / 2 / counts[j]
+    return out
+
+
+def sector_zscores(m, sector_ids, n_sectors, min_members=2):
+    """Z-score of each cell against its sector's mean/std in the same quarter."""
+    onehot = np.zeros((len(sector_ids), n_sectors))
+    onehot[np.arange(len(sector_ids)), sector_ids] = 1
+    present = ~np.isnan(m)
+    filled = np.where(present, m, 0.0)
+    n = onehot.T @ present                     # sectors × quarters
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (onehot.T @ filled) / n
+        var = (onehot.T @ (filled ** 2)) / n - mean ** 2
+        std = np.sqrt(np.maximum(var, 0))
+        ok = (n >= min_members) & (std > 1e-12)
+        z = (m - mean[sector_ids]) / std[sector_ids]
+    return np.where(ok[sector_ids] & present, z, np.nan)
+
+
+def calculate_ranks(results, quarters, fields=RANK_FIELDS):
+    """Percentile and sector z-score histories per ticker and field.
+    
+    Returns {ticker: {field: {"pct": [...], "sector_z": [...]}}} with lists
+    aligned with `quarters`.
+    """
+    tickers = list(results)
+    sector_names = sorted({results[t]["info"]["sector"] for t in tickers})
+    sector_ids = np.array([sector_names.index(results[t]["info"]["sector"]) for t in tickers], dtype=int)
+    ranks = {t: {} for t in tickers}
+    for field in fields:
+        m = results_matrix(results, tickers, quarters, field)
+        pct = percentile_ranks(m)
+        z = sector_zscores(m, sector_ids, len(sector_names))
+        for i, t in enumerate(tickers):
+            ranks[t][field] = {"pct": _to_list(pct[i]), "sector_z": _to_list(z[i], 3)}
+    return ranks
+
+
+# ── Peer discovery ──
+# Companies are compared on their standardized adj ROIC, spread and revenue
+# per employee trajectories. Distances are the RMS difference over the
+# quarters both companies report, computed a block of rows at a time, so
+# only a chunk × N slice of the distance matrix ever exists.
+
+PEER_FIELDS = ["adj_roic", "spread", "rev_per_employee"]
+PEER_CHUNK = 1024       # rows per distance block
+PEER_MIN_OVERLAP = 8    # shared feature cells needed for a distance
+
+
+def peer_features(results, tickers, quarters, fields=PEER_FIELDS):
+    """N × (fields · quarters) feature matrix and its validity mask.
+    
+    Each field is standardized over the whole panel (log first for revenue
+    per employee), so every field weighs the same in the distance.
+    """
+    blocks = []
+    for field in fields:
+        m = results_matrix(results, tickers, quarters, field)
+        if field == "rev_per_employee":
+            m = np.log(np.where(m > 0, m, np.nan))
+        present = ~np.isnan(m)
+        if present.any():
+            std = np.nanstd(m)
+            m = (m - np.nanmean(m)) / (std if std > 1e-12 else 1.0)
+        blocks.append(m)
+    x = np.hstack(blocks) if blocks else np.empty((len(tickers), 0))
+    mask = ~np.isnan(x)
+    return np.where(mask, x, 0.0), mask
+
+
+def masked_distances(x, w, rows):
+    """RMS difference between x[rows] and every row of x over shared cells.
+    
+    With w the 0/1 mask, sum w_a w_b (a - b)^2 expands into three matrix
+    products, so a block costs O(len(rows) · N · D) with no per-pair loop.
+    Pairs sharing fewer than PEER_MIN_OVERLAP cells are inf.
+    """
+    xa, wa = x[rows], w[rows]
+    sq = (x ** 2) * w
+    total = (xa ** 2 * wa) @ w.T + wa @ sq.T - 2 * (xa * wa) @ (x * w).T
+    count = wa @ w.T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        d = np.sqrt(np.maximum(total, 0) / count)
+    return np.where(count >= PEER_MIN_OVERLAP, d, np.inf)
+
+
+def kmeans(x, k, iterations=100, seed=0):
+    """Lloyd's k-means with k-means++ seeding; returns (labels, centers)."""
+    n = len(x)
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+    centers = [x[rng.integers(n)]]
+    d2 = ((x - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        p = d2 / d2.sum() if d2.sum() > 0 else np.full(n, 1 / n)
+        centers.append(x[rng.choice(n, p=p)])
+        d2 = np.minimum(d2, ((x - centers[-1]) ** 2).sum(axis=1))
+    centers = np.array(centers)
+    labels = np.full(n, -1)
+    for _ in range(iterations):
+        d2 = (x ** 2).sum(axis=1)[:, None] - 2 * x @ centers.T + (centers ** 2).sum(axis=1)[None]
+        new = d2.argmin(axis=1)
+        if (new == labels).all():
+            break
+        labels = new
+        for c in range(k):
+            if (labels == c).any():
+                centers[c] = x[labels == c].mean(axis=0)
+    return labels, centers
+
+
+def discover_peers(results, quarters, k=None, neighbors=None, chunk=PEER_CHUNK):
+    """Nearest peers, k-means clusters and distance to the Tier 1 cohort.
+    
+    Returns {"fields", "clusters": {ticker: id}, "cluster_members": [[...]],
+    "nearest": {ticker: [{"ticker", "distance"}]}, "cohort_distance":
+    {ticker: mean distance to Tier 1 companies}}.
+    """
+    k = PEER_CLUSTERS if k is None else k
+    neighbors = PEER_NEIGHBORS if neighbors is None else neighbors
+    tickers = list(results)
+    x, mask = peer_features(results, tickers, quarters)
+    w = mask.astype(float)
+    cohort = np.array([results[t]["info"]["tier"] == 1 for t in tickers])
+    
+    nearest, cohort_distance = {}, {}
+    for lo in range(0, len(tickers), chunk):
+        rows = np.arange(lo, min(lo + chunk, len(tickers)))
+        d = masked_distances(x, w, rows)
+        d[np.arange(len(rows)), rows] = np.inf  # not your own peer
+        n_keep = min(neighbors, len(tickers) - 1)
+        if n_keep > 0:
+            top = np.argpartition(d, n_keep - 1, axis=1)[:, :n_keep]
+            top = np.take_along_axis(top, np.argsort(np.take_along_axis(d, top, axis=1), axis=1), axis=1)
+        for r, i in enumerate(rows):
+            t = tickers[i]
+            nearest[t] = [{"ticker": tickers[j], "distance": round(float(d[r, j]), 4)}
+                          for j in (top[r] if n_keep > 0 else []) if np.isfinite(d[r, j])]
+            to_cohort = d[r, cohort & np.isfinite(d[r])]
+            cohort_distance[t] = round(float(to_cohort.mean()), 4) if len(to_cohort) else None
+    
+    # Cluster on the standardized features with gaps at the panel mean (0)
+    labels, _ = kmeans(x, k) if len(tickers) else (np.array([], dtype=int), None)
+    members = [[t for t, c in zip(tickers, labels) if c == cid] for cid in range(int(labels.max()) + 1 if len(labels) else 0)]
+    return {
+        "fields": PEER_FIELDS,
+        "clusters": {t: int(c) for t, c in zip(tickers, labels)},
+        "cluster_members": members,
+        "nearest": nearest,
+        "cohort_distance": cohort_distance,
+    }
+
+
+# ── Event study ──
+# Aligns every AI layoff event to its company's series at relative quarters
+# EVENT_WINDOW and measures the change from the pre-event baseline, net of
+# the same change in the tier-2 control average. Events are gathered with one
+# fancy-indexing pass and bootstrapped as (resample × event × offset) arrays.
+
+# How each metric is differenced: "diff" in levels, "log" as log ratio
+EVENT_METRICS = {"adj_roic": "diff", "spread": "diff", "rev_per_employee": "log"}
+
+
+def _nan_pad(m, before, after):
+    """Pad the last axis with NaN so out-of-range offsets gather NaN."""
+    pad = [(0, 0)] * (m.ndim - 1) + [(before, after)]
+    return np.pad(m, pad, constant_values=np.nan)
+
+
+def _bootstrap_means(ar, n_boot, rng, max_cells=4_000_000):
+    """Bootstrap distribution of the event-mean at each offset.
+    
+    `ar` is events × offsets with NaN gaps; returns n_boot × offsets.
+    Resamples are drawn in chunks so memory stays bounded for large event sets.
+    """
+    n_events, n_off = ar.shape
+    filled = np.nan_to_num(ar)
+    present = (~np.isnan(ar)).astype(float)
+    out = np.empty((n_boot, n_off))
+    chunk = max(1, max_cells // max(1, n_events * n_off))
+    for start in range(0, n_boot, chunk):
+        stop = min(n_boot, start + chunk)
+        draw = rng.integers(0, n_events, size=(stop - start, n_events))
+        sums = filled[draw].sum(axis=1)
+        counts = present[draw].sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[start:stop] = np.where(counts > 0, sums / counts, np.nan)
+    return out
+
+
+def run_event_study(results, quarters, events, window=EVENT_WINDOW, metrics=EVENT_METRICS,
+                    n_boot=EVENT_BOOTSTRAP, seed=EVENT_SEED, ci=0.95):
+    """Abnormal changes around each event versus the tier-2 control group.
+    
+    Tier-2 tickers that have events of their own are left out of the control.
+    
+    Returns offsets, per-metric mean abnormal change with bootstrap CIs for
+    all events and per event type, and each event's own abnormal path.
+    """
+    pre, post = window
+    offsets = np.arange(pre, post + 1)
+    tickers = list(results)
+    t_idx = {t: i for i, t in enumerate(tickers)}
+    q_idx = {q: j for j, q in enumerate(quarters)}
+    
+    used = [e for e in events if e["ticker"] in t_idx and e["quarter"] in q_idx]
+    skipped = [f"{e['ticker']} {e['quarter']}" for e in events if e not in used]
+    # Firms with their own events are never part of anyone's counterfactual
+    treated = {e["ticker"] for e in used}
+    control = np.array([results[t]["info"]["tier"] == 2 and t not in treated for t in tickers])
+    if not used or not control.any():
+        return {"window": [pre, post], "offsets": offsets.tolist(), "events": 0,
+                "skipped": skipped, "metrics": {}}
+    
+    rows = np.array([t_idx[e["ticker"]] for e in used])
+    cols = np.array([q_idx[e["quarter"]] for e in used])
+    before, after = max(0, -pre), max(0, post)
+    gather = cols[:, None] + offsets[None, :] + before   # events × offsets
+    base_cols = offsets < 0 if pre < 0 else offsets == pre
+    types = np.array([e.get("type", "") for e in used])
+    alpha = (1 - ci) / 2
+    rng = np.random.default_rng(seed)
+    
+    out = {}
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        # All-NaN slices (events near the data edges) are expected and yield NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for field, mode in metrics.items():
+            m = results_matrix(results, tickers, quarters, field)
+            if mode == "log":
+                m = np.where(m > 0, np.log(m), np.nan)
+            ctrl = m[control]
+            n_ctrl = (~np.isnan(ctrl)).sum(axis=0)
+            ctrl_mean = np.where(n_ctrl > 0, np.nansum(ctrl, axis=0) / np.maximum(n_ctrl, 1), np.nan)
+            
+            y = _nan_pad(m, before, after)[rows[:, None], gather]
+            c = _nan_pad(ctrl_mean, before, after)[gather]
+            # Pre-event baseline: mean over the negative offsets
+            y_base = np.nanmean(np.where(base_cols, y, np.nan), axis=1, keepdims=True)
+            c_base = np.nanmean(np.where(base_cols, c, np.nan), axis=1, keepdims=True)
+            ar = (y - y_base) - (c - c_base)
+            
+            groups = {"all": np.ones(len(used), dtype=bool)}
+            groups.update({t: types == t for t in sorted(set(types)) if t})
+            post_cols = offsets >= 0
+            summary = {}
+            for name, sel in groups.items():
+                sub = ar[sel]
+                n = (~np.isnan(sub)).sum(axis=0)
+                mean = np.where(n > 0, np.nansum(sub, axis=0) / np.maximum(n, 1), np.nan)
+                boot = _bootstrap_means(sub, n_boot, rng)
+                lo, hi = np.nanpercentile(boot, [100 * alpha, 100 * (1 - alpha)], axis=0)
+                post_boot = np.nanmean(boot[:, post_cols], axis=1)
+                post_mean = np.nanmean(mean[post_cols])
+                summary[name] = {
+                    "events": int(sel.sum()),
+                    "n": n.tolist(),
+                    "mean": _to_list(mean),
+                    "ci_low": _to_list(lo),
+                    "ci_high": _to_list(hi),
+                    "post_mean": _to_list([post_mean])[0],
+                    "post_ci": _to_list(np.nanpercentile(post_boot, [100 * alpha, 100 * (1 - alpha)])),
+                }
+            out[field] = {
+                "mode": mode,
+                "groups": summary,
+                "by_event": [
+                    {"ticker": e["ticker"], "quarter": e["quarter"], "type": e.get("type"),
+                     "abnormal": _to_list(ar[k])}
+                    for k, e in enumerate(used)
+                ],
+            }
+    
+    return {
+        "window": [pre, post],
+        "offsets": offsets.tolist(),
+        "control": "tier2 equal-weight, excluding tickers with events",
+        "control_excluded": sorted(t for t in treated if results[t]["info"]["tier"] == 2),
+        "baseline": "mean of pre-event quarters",
+        "bootstrap": n_boot,
+        "ci": ci,
+        "events": len(used),
+        "skipped": skipped,
+        "metrics": out,
+    }
+
+
+# ── Difference-in-differences ──
+# Two-way fixed-effects DiD on the ticker × quarter panel:
+#   y_it = a_i + g_t + beta * D_it + e_it
+# Every (outcome, treatment definition) pair is fit at once: ticker and quarter
+# effects are swept out by alternating masked demeaning over a stacked
+# (outcome × treatment × ticker × quarter) array, then beta and its
+# ticker-clustered standard error are closed-form reductions over that array.
+
+# Outcome field -> transform ("level" or "log")
+DID_OUTCOMES = {"adj_roic": "level", "reported_roic": "level", "spread": "level", "rev_per_employee": "log"}
+DID_TREATMENTS = {
+    "any_event": "tier 1 treated from its first AI event; tier 1 without events dropped",
+    "direct_event": "as any_event, counting only direct AI events",
+    "tier1_common": "all tier 1 treated from the earliest event quarter",
+}
+
+
+def build_treatments(results, tickers, quarters, events):
+    """Treatment definitions (see DID_TREATMENTS) as (D, sample) boolean
+    ticker × quarter arrays. Tier 2 is the never-treated control in all.
+    """
+    q_idx = {q: j for j, q in enumerate(quarters)}
+    tier1 = np.array([results[t]["info"]["tier"] == 1 for t in tickers])
+    cols = np.arange(len(quarters))
+    
+    def first_event(types=None):
+        start = np.full(len(tickers), np.inf)
+        for i, t in enumerate(tickers):
+            hits = [q_idx[e["quarter"]] for e in events
+                    if e["ticker"] == t and e["quarter"] in q_idx and (types is None or e.get("type") in types)]
+            if hits:
+                start[i] = min(hits)
+        return start
+    
+    treatments = {}
+    for name, start in [("any_event", first_event()), ("direct_event", first_event({"direct"}))]:
+        d = tier1[:, None] & (cols[None, :] >= start[:, None])
+        sample = ~tier1 | np.isfinite(start)
+        treatments[name] = (d, np.broadcast_to(sample[:, None], d.shape))
+    starts = first_event()
+    common = starts[np.isfinite(starts)].min() if np.isfinite(starts).any() else np.inf
+    d = tier1[:, None] & (cols[None, :] >= common)
+    treatments["tier1_common"] = (d, np.ones_like(d))
+    return treatments
+
+
+def _twfe_demean(x, mask, max_iter=200, tol=1e-10):
+    """Sweep ticker and quarter means out of x over the last two axes (masked)."""
+    x = np.where(mask, x, 0.0)
+    n_row = np.maximum(mask.sum(axis=-1, keepdims=True), 1)
+    n_col = np.maximum(mask.sum(axis=-2, keepdims=True), 1)
+    for _ in range(max_iter):
+        x = np.where(mask, x - x.sum(axis=-1, keepdims=True) / n_row, 0.0)
+        col_mean = x.sum(axis=-2, keepdims=True) / n_col
+        x = np.where(mask, x - col_mean, 0.0)
+        if np.abs(col_mean).max(initial=0.0) < tol:
+            break
+    return x
+
+
+def _betainc(a, b, x, max_iter=300, eps=1e-12):
+    """Regularized incomplete beta I_x(a, b) by Lentz's continued fraction."""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    if x > (a + 1) / (a + b + 2):
+        return 1.0 - _betainc(b, a, 1.0 - x, max_iter, eps)
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                     + a * math.log(x) + b * math.log(1.0 - x)) / a
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, max_iter + 1):
+        for num in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                    -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + num * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + num / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1.0) < eps:
+            break
+    return front * h
+
+
+def _t_pvalue(t, df):
+    """Two-sided p-value of a t statistic with df degrees of freedom."""
+    return _betainc(df / 2.0, 0.5, df / (df + t * t))
+
+
+def run_did(results, quarters, events, outcomes=DID_OUTCOMES):
+    """Fit every outcome × treatment TWFE DiD with ticker-clustered SEs.
+    
+    p-values use a t distribution with clusters − 1 degrees of freedom: with
+    a dozen or so clusters the normal approximation is anti-conservative.
+    """
+    tickers = list(results)
+    treatments = build_treatments(results, tickers, quarters, events)
+    names = list(treatments)
+    fields = list(outcomes)
+    
+    y = np.stack([results_matrix(results, tickers, quarters, f) for f in fields])   # O × N × T
+    for k, f in enumerate(fields):
+        if outcomes[f] == "log":
+            y[k] = np.where(y[k] > 0, np.log(np.where(y[k] > 0, y[k], 1.0)), np.nan)
+    d = np.stack([treatments[n][0] for n in names]).astype(float)                    # R × N × T
+    sample = np.stack([treatments[n][1] for n in names])
+    
+    # O × R × N × T
+    mask = ~np.isnan(y)[:, None] & sample[None]
+    yy = np.broadcast_to(np.nan_to_num(y)[:, None], mask.shape)
+    dd = np.broadcast_to(d[None], mask.shape)
+    y_t = _twfe_demean(yy, mask)
+    d_t = _twfe_demean(dd, mask)
+    
+    sxx = (d_t * d_t).sum(axis=(-2, -1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        beta = (d_t * y_t).sum(axis=(-2, -1)) / sxx
+        resid = np.where(mask, y_t - beta[..., None, None] * d_t, 0.0)
+        score = (d_t * resid).sum(axis=-1)                        # per-ticker cluster score
+        n_obs = mask.sum(axis=(-2, -1))
+        n_clusters = mask.any(axis=-1).sum(axis=-1)
+        n_fe = mask.any(axis=-1).sum(axis=-1) + mask.any(axis=-2).sum(axis=-1)
+        dof = np.maximum(n_obs - n_fe, 1)
+        correction = n_clusters / np.maximum(n_clusters - 1, 1) * (n_obs - 1) / dof
+        se = np.sqrt(correction * (score ** 2).sum(axis=-1)) / sxx
+        t_stat = beta / se
+    treated_clusters = ((dd > 0) & mask).any(axis=-1).sum(axis=-1)
+    
+    specs = []
+    for a, f in enumerate(fields):
+        for b, n in enumerate(names):
+            ok = sxx[a, b] > 0 and treated_clusters[a, b] > 0
+            t = float(t_stat[a, b]) if ok else None
+            df = int(n_clusters[a, b]) - 1
+            specs.append({
+                "outcome": f,
+                "transform": outcomes[f],
+                "treatment": n,
+                "beta": round(float(beta[a, b]), 5) if ok else None,
+                "se": round(float(se[a, b]), 5) if ok else None,
+                "t": round(t, 3) if t is not None and math.isfinite(t) else None,
+                "p": round(_t_pvalue(t, df), 4) if t is not None and math.isfinite(t) and df > 0 else None,
+                "df": df,
+                "n_obs": int(n_obs[a, b]),
+                "clusters": int(n_clusters[a, b]),
+                "treated_clusters": int(treated_clusters[a, b]),
+            })
+    return {
+        "model": "two-way fixed effects (ticker, quarter)",
+        "se": "clustered by ticker",
+        "p": "two-sided, t distribution with clusters - 1 df",
+        "treatments": {n: DID_TREATMENTS[n] for n in names},
+        "specs": specs,
+    }
+
+
+def generate_public_json(results, indices, quarters, events, rollups=None, ranks=None, restatements=None,
+                         rolling=None, imputation=None):
     current_q = None
     for q in reversed(quarters):
         if q in indices["all"]:
             current_q = q
             break
     
+    if ranks is None:
+        ranks = calculate_ranks(results, quarters, PUBLIC_RANK_FIELDS)
+    cur = quarters.index(current_q) if current_q in quarters else None
+    if rolling is None:
+        rolling = calculate_rolling({}, results, quarters)
+    
     scoreboard = []
     for ticker, co in results.items():
         qd = co["quarters"].get(current_q, {})
         if qd:
+            adj_rank = ranks.get(ticker, {}).get("adj_roic", {})
             scoreboard.append({
                 "ticker": ticker,
                 "name": co["info"]["name"],
@@ -289,6 +1603,11 @@ def generate_public_json(results, indices, quarters, events):
                 "reported_roic": qd.get("reported_roic"),
                 "spread": qd.get("spread"),
                 "rev_per_employee": qd.get("rev_per_employee"),
+                "adj_roic_band": qd.get("adj_roic_band"),
+                "ttm_adj_roic": rolling.get(ticker, {}).get("ttm", {}).get("adj_roic", [None] * len(quarters))[cur],
+                "pct_rank": adj_rank["pct"][cur] if adj_rank else None,
+                "sector_z": adj_rank["sector_z"][cur] if adj_rank else None,
+                "restated_quarters": sorted((restatements or {}).get(ticker, {}), key=quarter_ordinal),
             })
     scoreboard.sort(key=lambda x: x.get("adj_roic") or -999, reverse=True)
     
@@ -297,7 +1616,12 @@ def generate_public_json(results, indices, quarters, events):
         "current_quarter": current_q,
         "quarters": quarters,
         "indices": indices,
+        "index_bands": (imputation or {}).get("index_bands", {}),
         "scoreboard": scoreboard,
+        "ranks": {t: {f: r[f] for f in PUBLIC_RANK_FIELDS if f in r} for t, r in ranks.items()},
+        "restatements": {t: sorted(qs, key=quarter_ordinal) for t, qs in (restatements or {}).items() if t in results},
+        "ttm": {t: {"adj_roic": r["ttm"]["adj_roic"], "revenue": r["ttm"].get("revenue")} for t, r in rolling.items()},
+        "rollups": rollups if rollups is not None else calculate_rollups(results, quarters),
         "events": events,
         "methodology_summary": {
             "adjustments": [
@@ -313,17 +1637,198 @@ def generate_public_json(results, indices, quarters, events):
     }
 
 
-def generate_internal_json(results, indices, quarters, events):
+def generate_internal_json(results, indices, quarters, events, rollups=None, event_study=None, did=None,
+                           ranks=None, restatements=None, rolling=None, peers=None, imputation=None):
     return {
         "generated": datetime.now(timezone.utc).isoformat(),
         "quarters": quarters,
         "indices": indices,
+        "rollups": rollups if rollups is not None else calculate_rollups(results, quarters),
         "companies": results,
+        "ranks": ranks if ranks is not None else calculate_ranks(results, quarters),
+        "restatements": restatements or {},
+        "rolling": rolling if rolling is not None else calculate_rolling({}, results, quarters),
+        "peers": peers if peers is not None else discover_peers(results, quarters),
+        "imputation": imputation or {},
         "events": events,
+        "event_study": event_study if event_study is not None else run_event_study(results, quarters, events),
+        "did": did if did is not None else run_did(results, quarters, events),
         "company_list": {t: COMPANIES[t] for t in COMPANIES},
     }
 
 
+def write_json(path, payload):
+    """Write JSON atomically so readers (dashboards, roic_server.py) never see a partial file."""
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp, path)
+
+
+# ── Excel workbook ──
+# Streams the workbook with xlsxwriter's constant_memory mode: every sheet is
+# written top to bottom and each row is flushed to disk once the next one
+# starts, so memory does not grow with the number of companies. Adjustment
+# rows are live formulas over the line items above them (cached with the
+# values computed here, so the file reads correctly before recalculation).
+
+ADJUSTMENT_ROWS = [
+    ("Restructuring (4Q avg)", "restruct_avg"),
+    ("NOPAT", "nopat"),
+    ("Invested Capital", "invested_capital"),
+    ("Reported ROIC", "reported_roic"),
+    ("Adj Invested Capital", "adj_invested_capital"),
+    ("Adj NOPAT", "adj_nopat"),
+    ("Adj ROIC", "adj_roic"),
+    ("Spread", "spread"),
+    ("Rev/Employee ($K)", "rev_per_employee"),
+]
+PERCENT_FIELDS = {"reported_roic", "adj_roic", "spread"}
+
+
+def _adjustment_formulas(cell, col, q_pos):
+    """Excel formulas for one quarter column, mirroring calculate_adjustments.
+    
+    `cell(item)` / `cell(field)` give the A1 reference of a line item or an
+    adjustment row in this column; `col(item, k)` the reference of the same
+    line item k quarters back.
+    """
+    opinc, tax, rev = cell("Operating Income ($mm)"), cell("Effective Tax Rate"), cell("Revenue ($mm)")
+    equity = "Total Shareholders' Equity ($mm)"
+    valid = f'AND(ISNUMBER({opinc}),ISNUMBER({tax}),ISNUMBER({cell("Total Debt ($mm)")}),ISNUMBER({cell(equity)}))'
+    n = lambda item: f"N({cell(item)})"
+    back = min(4, q_pos + 1)
+    quarterly = lambda nopat, ic: f"IF({cell(ic)}=0,0,{cell(nopat)}/{cell(ic)})*4"
+    return {
+        "restruct_avg": f'SUM({col("Restructuring Charges ($mm)", back - 1)}:{cell("Restructuring Charges ($mm)")})/{back}',
+        "nopat": f'IF({valid},{opinc}*(1-{tax}),"")',
+        "invested_capital": f'IF({valid},{n("Total Debt ($mm)")}+{n(equity)}-{n("Cash & Equivalents ($mm)")},"")',
+        "reported_roic": f'IF({valid},MAX(-3,MIN(3,{quarterly("nopat", "invested_capital")})),"")',
+        "adj_invested_capital": f'IF({valid},{cell("invested_capital")}-{n("Goodwill ($mm)")}'
+                                f'-{n("Acquired Intangibles ($mm)")}+{n("Operating Lease Liabilities ($mm)")},"")',
+        "adj_nopat": f'IF({valid},({opinc}-{cell("restruct_avg")})*(1-{tax}),"")',
+        "adj_roic": f'IF({valid},MAX(-3,MIN(3,{quarterly("adj_nopat", "adj_invested_capital")})),"")',
+        "spread": f'IF({valid},MAX(-2,MIN(2,{quarterly("adj_nopat", "adj_invested_capital")}'
+                  f'-{quarterly("nopat", "invested_capital")})),"")',
+        "rev_per_employee": f'IF(AND({valid},ISNUMBER({rev}),{n("Headcount")}<>0),{rev}/{cell("Headcount")}*4*1000,"")',
+    }
+
+
+def write_workbook(path, data, results, indices, quarters, events):
+    """Write the ROIC workbook: indices, adjusted ROIC, combined data, events, one sheet per company."""
+    try:
+        import xlsxwriter
+        from xlsxwriter.utility import xl_rowcol_to_cell, xl_col_to_name
+    except ImportError:
+        print("  ⚠ xlsxwriter not installed (pip install xlsxwriter); skipping workbook")
+        return None
+    
+    items = list(ITEM_ALIASES)
+    tickers = [t for t in data if t in results]
+    wb = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_numbers": False})
+    bold = wb.add_format({"bold": True})
+    pct = wb.add_format({"num_format": "0.0%"})
+    num = wb.add_format({"num_format": "#,##0.0"})
+    first_q = 2  # column of the first quarter on company / combined sheets
+    
+    # Company sheet layout: header, line items, blank, adjustment rows
+    item_row = {item: 1 + k for k, item in enumerate(items)}
+    adj_row = {field: len(items) + 3 + k for k, (_, field) in enumerate(ADJUSTMENT_ROWS)}
+    
+    def ref(ticker, row, col):
+        return f"'{ticker}'!{xl_rowcol_to_cell(row, col, row_abs=True, col_abs=True)}"
+    
+    # Sheets are created in display order and each is then streamed top to bottom
+    ws_index = wb.add_worksheet("Indices")
+    ws_adj = wb.add_worksheet("Adjusted ROIC")
+    ws_all = wb.add_worksheet("All Companies")
+    ws_events = wb.add_worksheet("Events")
+    
+    # Indices (market-cap weighted, as published)
+    ws_index.write_row(0, 0, ["Quarter", "Tier 1", "Tier 2", "All", "Gap"], bold)
+    for r, q in enumerate(quarters, start=1):
+        ws_index.write(r, 0, q)
+        for c, key in enumerate(["tier1", "tier2", "all", "gap"], start=1):
+            v = indices[key].get(q)
+            if v is not None:
+                ws_index.write_number(r, c, v, pct)
+    
+    # Adjusted ROIC grid: live references into each company sheet, then
+    # equal-weight tier averages over the grid
+    ws_adj.write_row(0, 0, ["Ticker", "Tier"] + quarters, bold)
+    for r, t in enumerate(tickers, start=1):
+        ws_adj.write(r, 0, t)
+        ws_adj.write_number(r, 1, COMPANY_INFO[t].tier)
+        for j, q in enumerate(quarters):
+            v = results[t]["quarters"].get(q, {}).get("adj_roic")
+            ws_adj.write_formula(r, first_q + j, f"={ref(t, adj_row['adj_roic'], 1 + j)}", pct,
+                                 v if v is not None else "")
+    last = len(tickers)
+    tiers = f"$B$2:$B${last + 1}"
+    for k, (label, tier) in enumerate([("Tier 1 (equal wt)", 1), ("Tier 2 (equal wt)", 2)]):
+        r = last + 2 + k
+        ws_adj.write(r, 0, label, bold)
+        for j in range(len(quarters)):
+            c = xl_col_to_name(first_q + j)
+            ws_adj.write_formula(r, first_q + j, f'=IFERROR(AVERAGEIFS({c}2:{c}{last + 1},{tiers},{tier}),"")', pct)
+    r = last + 4
+    ws_adj.write(r, 0, "Gap", bold)
+    for j in range(len(quarters)):
+        c = xl_col_to_name(first_q + j)
+        ws_adj.write_formula(r, first_q + j, f'=IFERROR({c}{last + 3}-{c}{last + 4},"")', pct)
+    
+    # Combined line items (same layout as all_companies_quarterly.csv)
+    ws_all.write_row(0, 0, ["Ticker", "Line Item"] + quarters, bold)
+    r = 1
+    for t in tickers:
+        for item in items:
+            series = data[t].get(item)
+            ws_all.write(r, 0, t)
+            ws_all.write(r, 1, item)
+            if series is not None:
+                for j, q in enumerate(quarters):
+                    v = series.get(q)
+                    if v is not None:
+                        ws_all.write_number(r, first_q + j, v)
+            r += 1
+    
+    ws_events.write_row(0, 0, ["Ticker", "Quarter", "Jobs", "Type"], bold)
+    for r, e in enumerate(events, start=1):
+        ws_events.write_row(r, 0, [e["ticker"], e["quarter"], e.get("jobs"), e.get("type")])
+    
+    # One sheet per company: line items, then the adjustments as formulas
+    for t in tickers:
+        ws = wb.add_worksheet(t)
+        ws.write_row(0, 0, ["Line Item"] + quarters, bold)
+        ws.set_column(0, 0, 32)
+        for item in items:
+            series = data[t].get(item)
+            ws.write(item_row[item], 0, item)
+            if series is not None:
+                for j, q in enumerate(quarters):
+                    v = series.get(q)
+                    if v is not None:
+                        ws.write_number(item_row[item], 1 + j, v, pct if item == "Effective Tax Rate" else num)
+        ws.write(len(items) + 2, 0, "Adjustments", bold)
+        formulas = [
+            _adjustment_formulas(
+                lambda name, j=j: xl_rowcol_to_cell(item_row[name] if name in item_row else adj_row[name], 1 + j),
+                lambda name, k, j=j: xl_rowcol_to_cell(item_row[name], 1 + j - k),
+                j)
+            for j in range(len(quarters))
+        ]
+        for label, field in ADJUSTMENT_ROWS:
+            ws.write(adj_row[field], 0, label)
+            fmt = pct if field in PERCENT_FIELDS else num
+            for j, q in enumerate(quarters):
+                v = results[t]["quarters"].get(q, {}).get(field)
+                ws.write_formula(adj_row[field], 1 + j, "=" + formulas[j][field], fmt,
+                                 v if v is not None else "")
+    
+    wb.close()
+    return path
+
+
 # ── Main ──
 
 def main():
@@ -368,17 +1873,58 @@ def main():
         all_items.update(ticker_data.keys())
     print(f"  Line items found: {sorted(all_items)}")
     
-    # Build quarter list from data
+    # Build quarter list from data: every quarter any series has a value for
     all_quarters = set()
     for ticker_data in data.values():
         for item_data in ticker_data.values():
-            all_quarters.update(item_data.keys())
+            all_quarters.update(item_data.ordinals[item_data.mask].tolist())
     
-    quarters = sorted(all_quarters, key=lambda q: (int(q.split()[1]), int(q[1])))
+    quarters = [quarter_label(o) for o in sorted(all_quarters)]
     print(f"  Quarters: {quarters[0]} to {quarters[-1]} ({len(quarters)} total)")
     
-    # Calculate
-    results = calculate_adjustments(data, quarters)
+    # Validate before anything is published
+    if QUALITY_GATE != "off":
+        report = run_quality_gate(data, quarters)
+        report_path = os.path.join(os.path.dirname(csv_path), "quality_report.json")
+        write_json(report_path, report)
+        print(f"  Quality gate: {report['status'].upper()} "
+              f"({report['hard_failures']} hard, {report['soft_failures']} soft) -> {report_path}")
+        for c in report["checks"]:
+            if c["severity"] == "hard":
+                print(f"    ✗ {c['check']:18s} {c['item']}: {c['count']} cells — {c['message']}")
+        if report["status"] == "fail" and QUALITY_GATE == "enforce":
+            print("ERROR: Quality gate failed; not publishing to", OUTPUT_DIR)
+            print("  Set QUALITY_GATE=warn to publish anyway")
+            sys.exit(1)
+    
+    events = load_events(os.path.join(os.path.dirname(csv_path), "ai_layoff_events.csv"))
+    if not events:
+        print("  WARNING: ai_layoff_events.csv not found next to the CSV; no events loaded")
+    # Reversals are listed alongside, but are not layoff events for the event study / DiD
+    layoffs = [e for e in events if e["type"] != "reversed"]
+    print(f"  Events: {len(layoffs)} layoff events, {len(events) - len(layoffs)} reversals")
+    
+    # Fill short gaps (the workbook keeps the filed values)
+    filed_data, samples = data, {}
+    if IMPUTE == "on":
+        data, samples = impute_gaps(data, quarters)
+        n_cells = sum(int(imputed.sum()) for co in samples.values() for _, imputed in co.values())
+        print(f"  Imputed {n_cells} line-item cells across {len(samples)} companies ({IMPUTE_DRAWS} draws)")
+    
+    # Calculate (only the changed companies when the previous run can be reused).
+    # Node results are cached per company, so the filed-data pass below only
+    # recomputes what imputation changed
+    adj_cache = {}
+    int_path = os.path.join(OUTPUT_DIR, "internal", "data.json")
+    previous = load_previous_internal(int_path, quarters) if CHANGED_TICKERS else None
+    if previous is not None:
+        changed = {t: data[t] for t in CHANGED_TICKERS if t in data}
+        results = {t: co for t, co in previous["companies"].items() if t not in CHANGED_TICKERS and t in data}
+        results.update(calculate_adjustments(changed, quarters, cache=adj_cache))
+        results = {t: results[t] for t in data if t in results}
+        print(f"  Recomputed {len(changed)} changed companies, reused {len(results) - len(changed)}")
+    else:
+        results = calculate_adjustments(data, quarters, cache=adj_cache)
     print(f"  Companies with valid ROIC data: {len(results)}")
     
     if not results:
@@ -392,6 +1938,7 @@ def main():
                 print(f"    {item_name}: {len(vals)} quarters")
         sys.exit(1)
     
+    imputation = imputation_bands(results, data, samples, quarters) if samples else None
     indices = calculate_indices(results, quarters)
     
     latest = quarters[-1]
@@ -409,18 +1956,61 @@ def main():
     os.makedirs(pub_dir, exist_ok=True)
     os.makedirs(int_dir, exist_ok=True)
     
-    pub = generate_public_json(results, indices, quarters, AI_EVENTS)
+    rollups = calculate_rollups(results, quarters)
+    ranks = calculate_ranks(results, quarters)
+    if previous is not None and "rolling" in previous:
+        rolling = {t: r for t, r in previous["rolling"].items() if t not in CHANGED_TICKERS and t in results}
+        rolling.update(calculate_rolling(data, results, quarters, [t for t in results if t not in rolling]))
+        rolling = {t: rolling[t] for t in results}
+    else:
+        rolling = calculate_rolling(data, results, quarters)
+    restatements = load_restatements(os.path.join(os.path.dirname(csv_path), "changelog.jsonl"))
+    if restatements:
+        print(f"  Restatements:  {sum(len(v) for v in restatements.values())} ticker-quarters flagged")
+    pub = generate_public_json(results, indices, quarters, events, rollups, ranks, restatements, rolling,
+                               imputation)
     pub_path = os.path.join(pub_dir, "data.json")
-    with open(pub_path, 'w') as f:
-        json.dump(pub, f, indent=2)
+    write_json(pub_path, pub)
     print(f"\n  Public data:   {len(pub['scoreboard'])} companies -> {pub_path}")
     
-    internal = generate_internal_json(results, indices, quarters, AI_EVENTS)
-    int_path = os.path.join(int_dir, "data.json")
-    with open(int_path, 'w') as f:
-        json.dump(internal, f, indent=2)
+    # Inference runs on filed values only: imputed centre values are not observations
+    inference_fields = set(EVENT_METRICS) | set(DID_OUTCOMES) | set(PEER_FIELDS)
+    observed = calculate_adjustments({t: filed_data[t] for t in results}, quarters, inference_fields,
+                                     adj_cache) if samples else results
+    study = run_event_study(observed, quarters, layoffs)
+    ar = study["metrics"].get("adj_roic", {}).get("groups", {}).get("all")
+    if ar:
+        print(f"  Event study: {study['events']} events, window {study['window']}, "
+              f"post-event abnormal adj ROIC {ar['post_mean']} (CI {ar['post_ci']})")
+    
+    did = run_did(observed, quarters, layoffs)
+    for spec in did["specs"]:
+        if spec["outcome"] == "adj_roic" and spec["beta"] is not None:
+            print(f"  DiD adj_roic [{spec['treatment']:12s}]: beta {spec['beta']:+.4f} "
+                  f"(se {spec['se']:.4f}, n={spec['n_obs']}, {spec['treated_clusters']} treated)")
+    
+    peers = discover_peers(observed, quarters)
+    lookalikes = sorted((d, t) for t, d in peers["cohort_distance"].items()
+                        if d is not None and results[t]["info"]["tier"] != 1)
+    print(f"  Peers: {len(peers['cluster_members'])} clusters; closest to Tier 1 outside it: "
+          + (", ".join(t for _, t in lookalikes[:3]) or "none"))
+    
+    internal = generate_internal_json(results, indices, quarters, events, rollups, study, did, ranks,
+                                      restatements, rolling, peers, imputation)
+    write_json(int_path, internal)
     print(f"  Internal data: {len(internal['companies'])} companies -> {int_path}")
     
+    if WORKBOOK_PATH:
+        if write_workbook(WORKBOOK_PATH, filed_data, results, indices, quarters, events):
+            print(f"  Workbook:      {len(results)} company sheets -> {WORKBOOK_PATH}")
+    
+    if SENSITIVITY == "on":
+        sens = run_sensitivity(filed_data, quarters)
+        sens_path = os.path.join(int_dir, "sensitivity.json")
+        write_json(sens_path, sens)
+        print(f"  Sensitivity:   {sens['configurations']} configurations, latest gap "
+              f"{sens['summary']['latest_gap_min']} .. {sens['summary']['latest_gap_max']} -> {sens_path}")
+    
     print("\n  Done.")
 
 
@@ -7,7 +7,8 @@
 # ready for the Excel workbook.
 #
 # STATUS: Production-ready for 6-30 companies
-# REQUIREMENTS: Python 3.8+, requests, pandas (all pre-installed in Colab)
+# REQUIREMENTS: Python 3.8+, requests, pandas, numpy (all pre-installed in Colab)
+#               + period_series.py from this repo alongside (upload it in Colab)
 # SEC EDGAR FAIR USE: Max 10 requests/second, User-Agent required
 # ═══════════════════════════════════════════════════════════════════════
 
@@ -28,6 +29,71 @@ END_YEAR = 2025
 import os as _os
 OUTPUT_DIR = _os.environ.get("OUTPUT_DIR", "/content/roic_output")  # Colab default; overridden by GitHub Actions
 
+# Ingestion mode: "companyfacts" (one download per company) or "frames"
+# (one download per tag × quarter covering every filer; cheaper for large universes)
+INGEST_MODE = _os.environ.get("INGEST_MODE", "companyfacts")
+
+# Run mode: "batch" (one full pull, the default), "watch" (poll for new
+# 10-Q/10-K filings and refresh only the affected companies), or the sharded
+# modes "worker", "merge" and "sharded" (see below)
+RUN_MODE = _os.environ.get("RUN_MODE", "batch")
+WATCH_INTERVAL = int(_os.environ.get("WATCH_INTERVAL", "600"))  # seconds between polling sweeps
+WATCH_LOOKBACK_DAYS = 100  # full-index detection window (covers the current and previous quarter)
+DASHBOARD_DIR = _os.environ.get("DASHBOARD_DIR", "docs")  # where calculate_roic.py publishes
+
+# New-filing detection: "index" reads EDGAR's quarterly full-index form.idx
+# (one download covers the whole universe; falls back to "submissions" on
+# error), "submissions" polls each company. FULL_INDEX_DIR may hold local
+# copies as <year>/QTR<n>/form.idx or master.idx
+FILING_DETECTION = _os.environ.get("FILING_DETECTION", "index")
+FULL_INDEX_DIR = _os.environ.get("FULL_INDEX_DIR", "")
+# Watch mode polls submissions by default: the quarterly full-index is only
+# rebuilt nightly, so "index" here trades minutes of latency for up to a day
+WATCH_DETECTION = _os.environ.get("WATCH_DETECTION", "submissions")
+
+# Persistent cache (tag resolutions etc.) reused between quarterly runs
+CACHE_DIR = _os.environ.get("CACHE_DIR", _os.path.join(OUTPUT_DIR, "cache"))
+
+# Sharded runs: COMPANIES is split into SHARDS fixed partitions by CIK hash.
+# RUN_MODE=worker processes (one per node, sharing SHARD_DIR) lease shards
+# from a SQLite queue and write per-shard outputs; RUN_MODE=merge combines
+# them into OUTPUT_DIR and rebuilds DASHBOARD_DIR. RUN_MODE=sharded runs
+# SHARD_WORKERS local worker processes and then the merge. SHARD_RUN names
+# the run in the queue (e.g. a CI run id)
+SHARDS = int(_os.environ.get("SHARDS", "16"))
+SHARD_DIR = _os.environ.get("SHARD_DIR", _os.path.join(OUTPUT_DIR, "shards"))
+SHARD_RUN = _os.environ.get("SHARD_RUN", "default")
+SHARD_LEASE = int(_os.environ.get("SHARD_LEASE", "1800"))  # seconds before an unrenewed lease is retaken
+SHARD_ATTEMPTS = int(_os.environ.get("SHARD_ATTEMPTS", "3"))
+SHARD_WORKERS = int(_os.environ.get("SHARD_WORKERS", "4"))
+WORKER_ID = _os.environ.get("WORKER_ID", "")
+# Worker processes sharing one IP (and so one SEC rate budget); each one
+# slows its requests by this factor
+WORKERS_PER_IP = int(_os.environ.get("WORKERS_PER_IP", "1"))
+
+# In-memory budget for raw EDGAR responses; least-recently-used entries beyond
+# it are dropped, or spilled to RESPONSE_SPILL_DIR when set
+RESPONSE_CACHE_MB = int(_os.environ.get("RESPONSE_CACHE_MB", "512"))
+RESPONSE_SPILL_DIR = _os.environ.get("RESPONSE_SPILL_DIR", "")
+
+# Point-in-time rebuild: comma-separated dates (YYYY-MM-DD). Each rebuilds
+# the panel from facts filed on or before that date, into OUTPUT_DIR/as_of/<date>/
+AS_OF = [d for d in _os.environ.get("AS_OF", "").split(",") if d]
+
+# Segment ingestion: "on" also streams each 10-Q/10-K XBRL instance document
+# for the dimensional facts companyfacts drops (see SEGMENT_AXES). Instances
+# are read from INSTANCE_DIR/<cik>/<accession>.xml when present, otherwise
+# downloaded once into CACHE_DIR/instances/
+SEGMENTS = _os.environ.get("SEGMENTS", "off")
+INSTANCE_DIR = _os.environ.get("INSTANCE_DIR", "")
+
+# Event discovery: "on" indexes 8-K / 10-Q text (primary document and EX-99
+# exhibits) into an on-disk positional index under CACHE_DIR/event_index and
+# writes proposed AI-layoff events to OUTPUT_DIR/event_candidates.csv for
+# review. Documents are read from EVENT_ARCHIVE/<cik>/<accession>/ when present
+EVENT_DISCOVERY = _os.environ.get("EVENT_DISCOVERY", "off")
+EVENT_ARCHIVE = _os.environ.get("EVENT_ARCHIVE", "")
+
 # --- COMPANY UNIVERSE ---
 # Expand this list to 20-30 companies as needed.
 # Format: (Ticker, Company Name, Sector, CIK number)
@@ -151,8 +217,13 @@ def export_events_csv(events, output_dir):
 # ╚═══════════════════════════════════════════════════════════════════╝
 
 # The hardest part of EDGAR XBRL: companies use different tags for the
-# same concept. This mapping tries multiple tags in priority order.
+# same concept. Tags listed under "splice" are true synonyms (one concept
+# renamed over time, e.g. SalesRevenueNet before 2018,
+# RevenueFromContractWithCustomer... after) and are spliced per quarter in
+# priority order; any other tag is a fallback that is used for the whole
+# series or not at all (see choose_tags).
 # "duration" = flow metric (income statement), "instant" = stock (balance sheet)
+# "unit" is the XBRL unit the tags are reported in (frames are fetched by unit)
 
 XBRL_TAG_MAP = {
     "revenue": {
@@ -164,8 +235,16 @@ XBRL_TAG_MAP = {
             "us-gaap:SalesRevenueGoodsNet",
             "us-gaap:InterestAndDividendIncomeOperating",  # banks
         ],
+        "splice": [  # ASC 606 renamed the revenue concepts
+            "us-gaap:RevenueFromContractWithCustomerExcludingAssessedTax",
+            "us-gaap:Revenues",
+            "us-gaap:RevenueFromContractWithCustomerIncludingAssessedTax",
+            "us-gaap:SalesRevenueNet",
+            "us-gaap:SalesRevenueGoodsNet",
+        ],
         "period_type": "duration",
         "scale": 1e-6,  # Convert to $mm
+        "unit": "USD",
     },
     "operating_income": {
         "tags": [
@@ -174,6 +253,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "duration",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "income_tax_rate": {
         # Effective tax rate is reported directly by many companies
@@ -182,6 +262,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "duration",
         "scale": 1,  # Already a ratio
+        "unit": "pure",
         "fallback": "calculate",  # If not reported, calc from tax expense / pretax income
     },
     "income_tax_expense": {
@@ -191,6 +272,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "duration",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "pretax_income": {
         "tags": [
@@ -199,15 +281,16 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "duration",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "sbc": {
         "tags": [
             "us-gaap:ShareBasedCompensation",
             "us-gaap:AllocatedShareBasedCompensationExpense",
-            "us-gaap:EmployeeServiceShareBasedCompensationNonvestedAwardsTotalCompensationCostNotYetRecognized",
         ],
         "period_type": "duration",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "restructuring": {
         "tags": [
@@ -218,6 +301,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "duration",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "total_debt": {
         "tags": [
@@ -227,6 +311,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "instant",
         "scale": 1e-6,
+        "unit": "USD",
         "add_tags": [  # Also add short-term debt
             "us-gaap:ShortTermBorrowings",
             "us-gaap:LongTermDebtCurrent",
@@ -240,6 +325,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "instant",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "cash": {
         "tags": [
@@ -249,6 +335,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "instant",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "goodwill": {
         "tags": [
@@ -256,6 +343,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "instant",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "acquired_intangibles": {
         "tags": [
@@ -264,6 +352,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "instant",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "operating_lease_liabilities": {
         "tags": [
@@ -272,6 +361,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "instant",
         "scale": 1e-6,
+        "unit": "USD",
         "add_tags": [
             "us-gaap:OperatingLeaseLiabilityNoncurrent",
         ],
@@ -283,6 +373,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "duration",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "headcount": {
         "tags": [
@@ -290,6 +381,7 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "instant",
         "scale": 1,  # Raw number
+        "unit": "pure",
     },
     "capex": {
         "tags": [
@@ -298,12 +390,14 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "duration",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "fcf": {
         # FCF = Operating Cash Flow - Capex (calculated, not a direct tag)
         "tags": [],
         "period_type": "duration",
         "scale": 1e-6,
+        "unit": "USD",
         "fallback": "calculate",
     },
     "operating_cash_flow": {
@@ -312,16 +406,77 @@ XBRL_TAG_MAP = {
         ],
         "period_type": "duration",
         "scale": 1e-6,
+        "unit": "USD",
     },
     "market_cap": {
         # Not in EDGAR — pulled separately or from companion source
         "tags": [],
         "period_type": "instant",
         "scale": 1e-6,
+        "unit": "USD",
         "fallback": "external",
     },
 }
 
+# Standard taxonomy namespaces by the prefix used in XBRL_TAG_MAP, without
+# their version year. Instance documents may bind any prefix to these; names
+# are matched as {namespace}local (see qname) through each document's own
+# namespace declarations.
+TAXONOMY_NAMESPACES = {
+    "us-gaap": "http://fasb.org/us-gaap",
+    "srt": "http://fasb.org/srt",
+    "dei": "http://xbrl.sec.gov/dei",
+}
+# Dimensional facts read from instance documents: {axis: allowed members}
+# (None = every member), keyed as {namespace}local. Only contexts with
+# exactly one dimension on one of these axes are kept, so segment × product
+# cross-cuts are never summed.
+SEGMENT_AXES = {
+    "{http://fasb.org/us-gaap}StatementBusinessSegmentsAxis": None,
+    "{http://fasb.org/srt}StatementGeographicalAxis": None,
+}
+# Metrics broken out by segment; their XBRL_TAG_MAP tags are used as-is
+SEGMENT_METRICS = ["revenue", "operating_income"]
+
+# Bump when tag selection rules change so cached resolutions are rescored
+RESOLUTION_VERSION = 2
+
+
+def choose_tags(mapping, series, window):
+    """Tags that make up one metric history, from {tag: {quarter: value}}.
+    
+    The metric's "splice" tags form one candidate, spliced per quarter in
+    priority order; every other tag is a candidate on its own. Candidates
+    are scored by how many `window` quarters they cover, and the first one
+    in XBRL_TAG_MAP order covering at least half as many as the best is
+    used, so a fallback concept replaces the preferred one only when that
+    is mostly missing, and never fills its gaps.
+    
+    Returns (contributing tags in priority order, {tag: coverage}).
+    """
+    tags = [t for t in mapping.get("tags", []) if series.get(t)]
+    coverage = {t: len(window.intersection(series[t])) for t in tags}
+    splice = [t for t in tags if t in mapping.get("splice", [])]
+    candidates = []
+    for tag in tags:
+        if tag not in splice:
+            candidates.append([tag])
+        elif tag == splice[0]:
+            candidates.append(splice)
+    
+    scores = [len(window.intersection(set().union(*(series[t] for t in group)))) for group in candidates]
+    best = max(scores, default=0)
+    chosen = next((g for g, n in zip(candidates, scores) if n and 2 * n >= best), [])
+    
+    # Within a splice group, a tag contributes only the quarters not already filled
+    used, filled = [], set()
+    for tag in chosen:
+        new_quarters = set(series[tag]) - filled
+        if new_quarters:
+            used.append(tag)
+            filled |= new_quarters
+    return used, coverage
+
 
 # ╔═══════════════════════════════════════════════════════════════════╗
 # ║  CELL 3: EDGAR API Client                                       ║
@@ -333,25 +488,168 @@ import time
 import json
 import os
 import warnings
+import hashlib
+import html
+import re
+import sqlite3
+import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
-from collections import defaultdict
+from bisect import bisect_right
+from collections import defaultdict, OrderedDict
+
+import numpy as np
+
+from period_series import PeriodSeries, MetricGraph, as_series, quarter_ordinal, quarter_range
 
 warnings.filterwarnings('ignore')
 
+
+class ResponseCache:
+    """Byte-bounded LRU cache for parsed EDGAR responses.
+    
+    Behaves like the dict it replaces (in, [], []=, pop). Each entry is
+    charged an estimated in-memory size: the raw response length times
+    PARSED_OVERHEAD when the client passes it, otherwise a walk of the
+    object. Entries beyond max_bytes are evicted oldest-use first. With a
+    spill_dir, responses are written there as raw JSON when stored and are
+    reloaded on a later miss instead of being fetched again; the directory
+    is private to the process and removed by close().
+    """
+    
+    PARSED_OVERHEAD = 6  # parsed JSON (dicts, floats, str) vs raw bytes
+    
+    def __init__(self, max_bytes=512 * 2**20, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()   # key -> (value, size)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spill_dir = None
+        self.spilled = set()
+        if spill_dir:
+            import tempfile
+            os.makedirs(spill_dir, exist_ok=True)
+            self.spill_dir = tempfile.mkdtemp(prefix="responses_", dir=spill_dir)
+    
+    @staticmethod
+    def estimate_size(obj):
+        """Approximate deep size of a parsed JSON value in bytes."""
+        import sys
+        total = 0
+        stack = [obj]
+        while stack:
+            o = stack.pop()
+            total += sys.getsizeof(o)
+            if isinstance(o, dict):
+                stack.extend(o.keys())
+                stack.extend(o.values())
+            elif isinstance(o, list):
+                stack.extend(o)
+        return total
+    
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+    
+    def _spill(self, key, value, raw=None):
+        path = self._spill_path(key)
+        with open(path, 'wb' if raw is not None else 'w') as f:
+            if raw is not None:
+                f.write(raw)
+            else:
+                json.dump(value, f)
+        self.spilled.add(key)
+    
+    def __contains__(self, key):
+        return key in self.entries or key in self.spilled
+    
+    def __getitem__(self, key):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+        if key in self.spilled:
+            self.hits += 1
+            with open(self._spill_path(key)) as f:
+                value = json.load(f)
+            self.put(key, value)
+            return value
+        self.misses += 1
+        raise KeyError(key)
+    
+    def __setitem__(self, key, value):
+        self.put(key, value)
+    
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+    
+    def put(self, key, value, raw=None):
+        """Store a value; `raw` is the response body it was parsed from, if any."""
+        self._discard(key)
+        size = len(raw) * self.PARSED_OVERHEAD if raw is not None else self.estimate_size(value)
+        if self.spill_dir and key not in self.spilled and (raw is not None or size > self.max_bytes):
+            self._spill(key, value, raw)
+        if size > self.max_bytes:
+            return  # larger than the whole budget: spilled (if enabled) but not held
+        self.entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and self.entries:
+            old_key, (old_value, old_size) = self.entries.popitem(last=False)
+            self.nbytes -= old_size
+            self.evictions += 1
+            if self.spill_dir and old_key not in self.spilled:
+                self._spill(old_key, old_value)
+    
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+    
+    def pop(self, key, default=None):
+        """Remove a key from memory and disk (e.g. to force a fresh fetch)."""
+        entry = self.entries.get(key)
+        self._discard(key)
+        if key in self.spilled:
+            self.spilled.discard(key)
+            try:
+                os.remove(self._spill_path(key))
+            except OSError:
+                pass
+        return entry[0] if entry is not None else default
+    
+    def close(self):
+        """Drop every entry and delete the spill directory (later puts stay in memory)."""
+        self.entries.clear()
+        self.nbytes = 0
+        self.spilled.clear()
+        if self.spill_dir:
+            import shutil
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+    
+    def stats(self):
+        return (f"{len(self.entries)} held ({self.nbytes / 2**20:.0f}/{self.max_bytes / 2**20:.0f} MB), "
+                f"{len(self.spilled)} spilled, {self.evictions} evicted, "
+                f"{self.hits} hits / {self.misses} misses")
+
+
 class EDGARClient:
     """SEC EDGAR XBRL API client with rate limiting and caching."""
     
     BASE_URL = "https://data.sec.gov"
+    ARCHIVES_URL = "https://www.sec.gov/Archives/edgar/data"
+    FULL_INDEX_URL = "https://www.sec.gov/Archives/edgar/full-index"
     RATE_LIMIT = 0.12  # seconds between requests (~8/sec, under 10/sec limit)
     
-    def __init__(self, user_agent):
+    def __init__(self, user_agent, cache_mb=512, spill_dir=None):
         self.session = requests.Session()
         self.session.headers.update({
             "User-Agent": user_agent,
             "Accept": "application/json",
         })
         self.last_request_time = 0
-        self.cache = {}
+        self.cache = ResponseCache(cache_mb * 2**20, spill_dir)
+        self.validators = {}  # url -> (ETag, Last-Modified) for conditional polling
     
     def _rate_limit(self):
         elapsed = time.time() - self.last_request_time
@@ -374,12 +672,174 @@ class EDGARClient:
             resp = self.session.get(url, timeout=30)
             resp.raise_for_status()
             data = resp.json()
-            self.cache[cache_key] = data
+            self.cache.put(cache_key, data, resp.content)
             return data
         except Exception as e:
             print(f"  ⚠ Error fetching CIK {cik}: {e}")
             return None
     
+    def get_submissions(self, cik):
+        """Pull a company's submissions index (filings list, fiscalYearEnd)."""
+        cik_padded = str(cik).zfill(10)
+        cache_key = f"submissions_{cik}"
+        
+        if cache_key in self.cache:
+            return self.cache[cache_key]
+        
+        self._rate_limit()
+        url = f"{self.BASE_URL}/submissions/CIK{cik_padded}.json"
+        
+        try:
+            resp = self.session.get(url, timeout=30)
+            resp.raise_for_status()
+            data = resp.json()
+            self.cache.put(cache_key, data, resp.content)
+            return data
+        except Exception as e:
+            print(f"  ⚠ Error fetching submissions for CIK {cik}: {e}")
+            return None
+    
+    def poll_submissions(self, cik):
+        """Conditional submissions fetch for watch mode.
+        
+        Sends If-None-Match / If-Modified-Since from the previous poll and
+        returns None when EDGAR answers 304 Not Modified.
+        """
+        cik_padded = str(cik).zfill(10)
+        url = f"{self.BASE_URL}/submissions/CIK{cik_padded}.json"
+        headers = {}
+        etag, modified = self.validators.get(url, (None, None))
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+        
+        self._rate_limit()
+        resp = self.session.get(url, headers=headers, timeout=30)
+        if resp.status_code == 304:
+            return None
+        resp.raise_for_status()
+        self.validators[url] = (resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+        data = resp.json()
+        self.cache.put(f"submissions_{cik}", data, resp.content)
+        return data
+    
+    def get_instance(self, cik, accn, dest_dir):
+        """Path of a filing's XBRL instance document, downloading it once.
+        
+        The instance is found through the filing's index.json and streamed
+        to dest_dir/<accn>.xml in chunks, so no document is held in memory.
+        """
+        path = os.path.join(dest_dir, f"{accn}.xml")
+        if os.path.exists(path):
+            return path
+        folder = f"{self.ARCHIVES_URL}/{int(cik)}/{accn.replace('-', '')}"
+        try:
+            self._rate_limit()
+            resp = self.session.get(f"{folder}/index.json", timeout=30)
+            resp.raise_for_status()
+            names = [item["name"] for item in resp.json().get("directory", {}).get("item", [])]
+            support = ("_cal.xml", "_def.xml", "_lab.xml", "_pre.xml", "FilingSummary.xml")
+            instances = [n for n in names if n.endswith("_htm.xml")] or \
+                        [n for n in names if n.endswith(".xml") and not n.endswith(support)]
+            if not instances:
+                return None
+            return self._download(f"{folder}/{instances[0]}", path)
+        except Exception as e:
+            print(f"  ⚠ Error fetching instance {accn}: {e}")
+            return None
+    
+    def get_full_index(self, year, qtr, dest_dir, kind="form"):
+        """(path, changed) of EDGAR's full-index <kind>.idx for one quarter.
+        
+        Closed quarters are downloaded once. The current quarter's file is
+        refetched with If-None-Match / If-Modified-Since, and a 304 leaves
+        the local copy in place (changed=False).
+        """
+        path = os.path.join(dest_dir, str(year), f"QTR{qtr}", f"{kind}.idx")
+        today = datetime.now()
+        closed = (year, qtr) < (today.year, (today.month - 1) // 3 + 1)
+        if os.path.exists(path) and closed:
+            return path, False
+        url = f"{self.FULL_INDEX_URL}/{year}/QTR{qtr}/{kind}.idx"
+        headers = {}
+        etag, modified = self.validators.get(url, (None, None))
+        if os.path.exists(path):
+            if etag:
+                headers["If-None-Match"] = etag
+            if modified:
+                headers["If-Modified-Since"] = modified
+        self._rate_limit()
+        resp = self.session.get(url, headers=headers, timeout=120, stream=True)
+        if resp.status_code == 304:
+            return path, False
+        resp.raise_for_status()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            for chunk in resp.iter_content(1 << 16):
+                f.write(chunk)
+        os.replace(tmp, path)
+        self.validators[url] = (resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+        return path, True
+    
+    def get_filing_documents(self, cik, accn, dest_dir, primary=None):
+        """Paths of a filing's primary document and EX-99 exhibits, downloading each once.
+        
+        Files land in dest_dir/<accn>/; a filing already there is not refetched.
+        """
+        folder_path = os.path.join(dest_dir, accn)
+        if os.path.isdir(folder_path) and os.listdir(folder_path):
+            return sorted(os.path.join(folder_path, n) for n in os.listdir(folder_path) if not n.endswith(".tmp"))
+        folder = f"{self.ARCHIVES_URL}/{int(cik)}/{accn.replace('-', '')}"
+        try:
+            self._rate_limit()
+            resp = self.session.get(f"{folder}/index.json", timeout=30)
+            resp.raise_for_status()
+            names = [item["name"] for item in resp.json().get("directory", {}).get("item", [])]
+            wanted = [n for n in names if n == primary or
+                      (re.search(r"ex-?99", n, re.I) and n.lower().endswith((".htm", ".html", ".txt")))]
+            return [self._download(f"{folder}/{n}", os.path.join(folder_path, n)) for n in wanted]
+        except Exception as e:
+            print(f"  ⚠ Error fetching filing {accn}: {e}")
+            return []
+    
+    def _download(self, url, path):
+        """Stream a file to disk in chunks (never held in memory whole)."""
+        self._rate_limit()
+        resp = self.session.get(url, timeout=120, stream=True)
+        resp.raise_for_status()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            for chunk in resp.iter_content(1 << 16):
+                f.write(chunk)
+        os.replace(tmp, path)
+        return path
+    
+    def get_frame(self, taxonomy, tag, unit, period):
+        """Pull one tag for one period across all filers (e.g. period="CY2023Q1I")."""
+        cache_key = f"frame_{taxonomy}_{tag}_{unit}_{period}"
+        
+        if cache_key in self.cache:
+            return self.cache[cache_key]
+        
+        self._rate_limit()
+        url = f"{self.BASE_URL}/api/xbrl/frames/{taxonomy}/{tag}/{unit}/{period}.json"
+        
+        try:
+            resp = self.session.get(url, timeout=60)
+            if resp.status_code == 404:
+                self.cache[cache_key] = None
+                return None
+            resp.raise_for_status()
+            data = resp.json()
+            self.cache.put(cache_key, data, resp.content)
+            return data
+        except Exception as e:
+            print(f"  ⚠ Error fetching frame {tag} {period}: {e}")
+            return None
+    
     def get_company_concept(self, cik, taxonomy, tag):
         """Pull a single XBRL concept for a company."""
         cik_padded = str(cik).zfill(10)
@@ -397,7 +857,7 @@ class EDGARClient:
                 return None
             resp.raise_for_status()
             data = resp.json()
-            self.cache[cache_key] = data
+            self.cache.put(cache_key, data, resp.content)
             return data
         except Exception as e:
             return None
@@ -407,39 +867,495 @@ class EDGARClient:
 # ║  CELL 4: Data Extraction Engine                                  ║
 # ╚═══════════════════════════════════════════════════════════════════╝
 
+class FiscalCalendar:
+    """Per-company index from period-end dates to fiscal and calendar quarters.
+    
+    Built once per company from the submissions `fiscalYearEnd` ("MMDD") and
+    the `fy`/`fp` labels on its facts; every metric then shares it. Each
+    filing's latest period end carries that filing's fy/fp, which labels the
+    fiscal quarter directly; other dates fall back to arithmetic from the
+    fiscal year end. Calendar keys ("Q1 2024") use the calendar quarter whose
+    end is nearest the period end, so a WMT quarter ending Apr 30 is Q1, not Q2.
+    Dates are parsed once and every lookup afterwards is a dict hit.
+    """
+    
+    FP_QUARTER = {"Q1": 1, "Q2": 2, "Q3": 3, "Q4": 4, "FY": 4}
+    
+    def __init__(self, fiscal_year_end="1231"):
+        fye = str(fiscal_year_end or "1231").zfill(4)
+        self.fye_month = int(fye[:2]) if 1 <= int(fye[:2]) <= 12 else 12
+        self.fye_day = int(fye[2:])
+        self.fy_offset = 0  # filer's fy convention relative to the arithmetic one
+        self._ordinals = {}
+        self._fiscal = {}
+        self._calendar = {}
+        self._labels = {}  # end date -> (fy, fq) from the filings themselves
+    
+    @classmethod
+    def from_facts(cls, filings, fiscal_year_end=None):
+        """Build an index from fact lists (one list or several)."""
+        if filings and isinstance(filings[0], dict):
+            filings = [filings]
+        
+        # One pass: the latest period end in each accession carries its fy/fp
+        latest = {}
+        for facts in filings or []:
+            for f in facts:
+                accn, end = f.get("accn"), f.get("end")
+                if not accn or not end or f.get("fp") not in cls.FP_QUARTER or not f.get("fy"):
+                    continue
+                if accn not in latest or end > latest[accn][0]:
+                    latest[accn] = (end, f["fy"], f["fp"])
+        
+        if fiscal_year_end is None:
+            # Infer the fiscal year end from annual filings' period ends
+            fy_ends = defaultdict(int)
+            for end, fy, fp in latest.values():
+                if fp == "FY":
+                    fy_ends[end[5:7] + end[8:10]] += 1
+            fiscal_year_end = max(fy_ends, key=fy_ends.get) if fy_ends else "1231"
+        
+        calendar = cls(fiscal_year_end)
+        offsets = defaultdict(int)
+        for end, fy, fp in latest.values():
+            if calendar.ordinal(end) is None:
+                continue
+            fq = cls.FP_QUARTER[fp]
+            calendar._labels[end] = (int(fy), fq)
+            arith_fy, arith_fq = calendar._fiscal_from_arithmetic(end)
+            if arith_fq == fq:
+                offsets[int(fy) - arith_fy] += 1
+        if offsets:
+            calendar.fy_offset = max(offsets, key=offsets.get)
+        return calendar
+    
+    @property
+    def signature(self):
+        return f"{self.fye_month:02d}{self.fye_day:02d}{self.fy_offset:+d}"
+    
+    def ordinal(self, date_str):
+        """Day ordinal for an ISO date string (parsed once), or None."""
+        if date_str in self._ordinals:
+            return self._ordinals[date_str]
+        try:
+            o = datetime.strptime(date_str, "%Y-%m-%d").toordinal()
+        except (TypeError, ValueError):
+            o = None
+        self._ordinals[date_str] = o
+        return o
+    
+    def duration_days(self, start, end):
+        s, e = self.ordinal(start), self.ordinal(end)
+        if s is None or e is None:
+            return 0
+        return e - s
+    
+    def _snapped_month(self, date_str):
+        # 52/53-week filers end a few days either side of a month end
+        d = datetime.fromordinal(self.ordinal(date_str))
+        if d.day >= 15:
+            return d.year, d.month
+        return (d.year, d.month - 1) if d.month > 1 else (d.year - 1, 12)
+    
+    def _fiscal_from_arithmetic(self, date_str):
+        year, month = self._snapped_month(date_str)
+        months_in = (month - self.fye_month) % 12
+        if months_in == 0:
+            return year, 4
+        fq = min(4, max(1, round(months_in / 3)))
+        fy = year if month < self.fye_month else year + 1
+        return fy, fq
+    
+    def fiscal_quarter(self, date_str):
+        """(fiscal year, fiscal quarter 1-4) for a period end date."""
+        key = self._fiscal.get(date_str)
+        if key is None:
+            key = self._labels.get(date_str)
+            if key is None:
+                fy, fq = self._fiscal_from_arithmetic(date_str)
+                key = (fy + self.fy_offset, fq)
+            self._fiscal[date_str] = key
+        return key
+    
+    def calendar_quarter(self, date_str):
+        """Calendar quarter label ("Q1 2024") nearest to a period end date."""
+        key = self._calendar.get(date_str)
+        if key is None:
+            year, month = self._snapped_month(date_str)
+            q = round(month / 3)
+            if q == 0:
+                year, q = year - 1, 4
+            key = f"Q{q} {year}"
+            self._calendar[date_str] = key
+        return key
+
+
+class QuarterSeriesCache:
+    """Memoized tag → quarterly series conversions, shared across metrics and runs.
+    
+    The same concept is often converted more than once (the pretax-income tag
+    backs both operating_income and pretax_income; add_tags are shared by
+    total_debt and operating_lease_liabilities). Entries are keyed by
+    (cik, taxonomy, tag, unit, period_type, scale, hash of the tag's facts),
+    and each entry is [series, {quarter: source accession number}],
+    so a changed XBRL_TAG_MAP or a new filing only recomputes the affected
+    tags. Least-recently-used entries are evicted beyond max_entries.
+    """
+    
+    VERSION = 3  # bump when the conversion itself changes (v3: entries carry accessions)
+    
+    def __init__(self, path=None, max_entries=50000):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = OrderedDict(json.load(f))
+            except (OSError, ValueError):
+                self.entries = OrderedDict()
+    
+    @staticmethod
+    def digest(facts):
+        payload = json.dumps(facts, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(payload.encode()).hexdigest()
+    
+    @staticmethod
+    def make_key(cik, tag_full, unit, period_type, scale, digest):
+        taxonomy, tag = tag_full.split(":", 1)
+        return f"v{QuarterSeriesCache.VERSION}|{cik}|{taxonomy}|{tag}|{unit}|{period_type}|{scale}|{digest}"
+    
+    def get(self, key):
+        series = self.entries.get(key)
+        if series is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return series
+    
+    def put(self, key, series):
+        self.entries[key] = series
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Per-process temp name: workers retaking a shard share its cache_dir
+        tmp = f"{self.path}.{os.uname().nodename}-{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+
+_NS_VERSION_RE = re.compile(r"/\d{4}(?:-?\d{2}-?\d{2})?$")
+
+
+def qname(name, namespaces=TAXONOMY_NAMESPACES):
+    """'us-gaap:Revenues' -> '{http://fasb.org/us-gaap}Revenues' (None if the prefix is unbound).
+    
+    `namespaces` maps prefixes to URIs; a trailing version year is dropped
+    so every taxonomy release resolves to the same name.
+    """
+    if name.startswith("{"):
+        uri, local = name[1:].split("}", 1)
+    else:
+        prefix, _, local = name.rpartition(":")
+        uri = namespaces.get(prefix)
+        if uri is None:
+            return None
+    return f"{{{_NS_VERSION_RE.sub('', uri)}}}{local}"
+
+
+class InstanceParser:
+    """Streaming reader for the dimensional facts of an XBRL instance document.
+    
+    Two iterparse passes over the file: the first keeps only contexts whose
+    single dimension is a configured axis/member, the second keeps only
+    facts for the wanted tags in those contexts. Each top-level element is
+    discarded as soon as it has been read, so memory holds the kept
+    contexts and facts, never the document tree.
+    
+    Element names, dimensions and members are resolved through the
+    document's namespace declarations (see qname), so a filer binding
+    us-gaap to another prefix is read the same. Facts come back in the
+    companyfacts format (start, end, val, form, filed, accn) grouped as
+    {tag: {(axis, member): [fact, ...]}}, with tags as given and axes and
+    members written with the standard prefixes (the filer's own prefix for
+    its extension members), so they go through _assign_to_quarter like any
+    other fact.
+    """
+    
+    XBRLI = "http://www.xbrl.org/2003/instance"
+    XBRLDI = "http://xbrl.org/2006/xbrldi"
+    
+    def __init__(self, axes, tags):
+        self.axes = {qname(a): None if m is None else {qname(x) for x in m} for a, m in axes.items()}
+        self.tags = {qname(t): t for t in tags}
+        self._labels = {uri: prefix for prefix, uri in TAXONOMY_NAMESPACES.items()}
+    
+    @staticmethod
+    def _elements(path):
+        """(prefix → namespace, iterator of completed top-level elements)."""
+        namespaces = {}
+        
+        def walk():
+            depth, root = 0, None
+            for event, item in ET.iterparse(path, events=("start-ns", "start", "end")):
+                if event == "start-ns":
+                    namespaces[item[0]] = item[1]
+                elif event == "start":
+                    root = item if root is None else root
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 1:
+                        yield item
+                        root.clear()
+        return namespaces, walk()
+    
+    def _label(self, name, namespaces):
+        """'{uri}Local' -> 'us-gaap:Local', or the document's own prefix for other namespaces."""
+        uri, local = name[1:].split("}", 1)
+        prefix = self._labels.get(uri) or next(
+            (p for p, u in namespaces.items() if _NS_VERSION_RE.sub("", u) == uri), None)
+        return f"{prefix}:{local}" if prefix else name
+    
+    def _context(self, elem, namespaces):
+        """(axis, member, start, end) for a kept context, else None."""
+        segment = elem.find(f"{{{self.XBRLI}}}entity/{{{self.XBRLI}}}segment")
+        if segment is None or len(segment) != 1:
+            return None
+        member = segment[0]
+        if member.tag != f"{{{self.XBRLDI}}}explicitMember":
+            return None
+        axis = qname(member.get("dimension") or "", namespaces)
+        name = qname((member.text or "").strip(), namespaces)
+        if axis not in self.axes or name is None or (self.axes[axis] is not None and name not in self.axes[axis]):
+            return None
+        period = elem.find(f"{{{self.XBRLI}}}period")
+        if period is None:
+            return None
+        instant = period.findtext(f"{{{self.XBRLI}}}instant")
+        start = period.findtext(f"{{{self.XBRLI}}}startDate")
+        end = instant or period.findtext(f"{{{self.XBRLI}}}endDate")
+        return (self._label(axis, namespaces), self._label(name, namespaces),
+                (start or "").strip(), (end or "").strip())
+    
+    def parse(self, path, form=None, filed=None, accn=None):
+        contexts = {}
+        namespaces, elements = self._elements(path)
+        for elem in elements:
+            if elem.tag == f"{{{self.XBRLI}}}context":
+                kept = self._context(elem, namespaces)
+                if kept:
+                    contexts[elem.get("id")] = kept
+        
+        out = defaultdict(lambda: defaultdict(list))
+        if not contexts:
+            return {}
+        _, elements = self._elements(path)
+        for elem in elements:
+            ctx = contexts.get(elem.get("contextRef"))
+            if ctx is None or not elem.tag.startswith("{"):
+                continue
+            tag_full = self.tags.get(qname(elem.tag))
+            if tag_full is None:
+                continue
+            try:
+                val = float((elem.text or "").strip())
+            except ValueError:
+                continue
+            axis, member, start, end = ctx
+            fact = {"end": end, "val": val, "form": form, "filed": filed, "accn": accn}
+            if start:
+                fact["start"] = start
+            out[tag_full][(axis, member)].append(fact)
+        return {tag: dict(groups) for tag, groups in out.items()}
+
+
+# Derived metrics, each computed from the extracted series it names. Add a
+# metric here (not in extract_company) and every extraction path gets it.
+DERIVED_METRICS = MetricGraph()
+
+
+@DERIVED_METRICS.metric("income_tax_rate", "income_tax_rate", "income_tax_expense", "pretax_income")
+def _effective_tax_rate(rate, tax_exp, pretax):
+    """Reported rate, or expense / pretax where under half the quarters report one."""
+    if len(rate) >= len(rate.values) * 0.5:
+        return rate
+    both = tax_exp.mask & pretax.mask & (pretax.values != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        computed = np.abs(tax_exp.values / np.where(both, pretax.values, 1))
+    ok = both & (computed > 0) & (computed < 0.6)  # Sanity check
+    if not ok.any():
+        return rate
+    return PeriodSeries(rate.start, len(rate.values), np.where(ok, np.round(computed, 3), 0), ok)
+
+
+@DERIVED_METRICS.metric("fcf", "operating_cash_flow", "capex")
+def _free_cash_flow(ocf, capex):
+    """FCF = Operating Cash Flow - Capex."""
+    both = ocf.mask & capex.mask
+    return PeriodSeries(ocf.start, len(ocf.values), np.where(both, np.round(ocf.values - capex.values, 1), 0), both)
+
+
+@DERIVED_METRICS.metric("restructuring", "restructuring")
+def _restructuring_filled(restructuring):
+    """Zero for quarters with no restructuring reported (most have none)."""
+    return PeriodSeries(restructuring.start, len(restructuring.values),
+                        np.where(restructuring.mask, restructuring.values, 0),
+                        np.ones(len(restructuring.values), dtype=bool))
+
+
+class FactTimeline:
+    """Bitemporal index over one company's candidate facts.
+    
+    Facts are kept per tag in filed-date order and per (tag, period end) as
+    a list of vintages, so "what was known on date D" is a binary search on
+    filed dates rather than a fresh download. as_of() returns a fact index
+    in the _index_candidate_facts format, holding for every (start, end)
+    period only its most recent vintage filed on or before D. Unlike the
+    live pull, which keeps the first value met per quarter, a restated
+    period therefore shows its restated value from the restatement onwards
+    and its original value before it.
+    """
+    
+    def __init__(self, fact_index):
+        self.units = {}
+        self.facts = {}     # tag -> facts sorted by filed
+        self.filed = {}     # tag -> their filed dates, for bisect
+        self.vintages = {}  # tag -> {end: ([filed, ...], [fact, ...])}
+        for tag_full, (unit, data) in fact_index.items():
+            facts = sorted((f for f in data if f.get("filed")), key=lambda f: f["filed"])
+            self.units[tag_full] = unit
+            self.facts[tag_full] = facts
+            self.filed[tag_full] = [f["filed"] for f in facts]
+            by_end = self.vintages[tag_full] = {}
+            for f in facts:
+                dates, versions = by_end.setdefault(f.get("end", ""), ([], []))
+                dates.append(f["filed"])
+                versions.append(f)
+    
+    def facts_as_of(self, tag_full, date):
+        """Latest vintage per (start, end) period among facts filed by `date`."""
+        facts = self.facts.get(tag_full, [])
+        latest = {}
+        for f in facts[:bisect_right(self.filed.get(tag_full, []), date)]:
+            latest[(f.get("start"), f.get("end"))] = f
+        return list(latest.values())
+    
+    def as_of(self, date):
+        """Candidate fact index as it stood on `date`."""
+        index = {}
+        for tag_full, unit in self.units.items():
+            facts = self.facts_as_of(tag_full, date)
+            if facts:
+                index[tag_full] = (unit, facts)
+        return index
+    
+    def value_as_of(self, tag_full, end, date, start=None):
+        """Raw value of one tag for the period ending `end`, as known on `date`.
+        
+        `start` selects the duration (e.g. the three-month fact rather than
+        the year-to-date one); None accepts any. Returns (val, filed, accn),
+        or None if nothing for that period had been filed yet.
+        """
+        dates, versions = self.vintages.get(tag_full, {}).get(end, ([], []))
+        for i in range(bisect_right(dates, date) - 1, -1, -1):
+            f = versions[i]
+            if start is None or f.get("start") == start:
+                return f["val"], f["filed"], f.get("accn")
+        return None
+
+
 class XBRLExtractor:
     """Extracts and normalizes quarterly financial data from EDGAR XBRL."""
     
-    def __init__(self, client, start_year=2015, end_year=2025):
+    METRICS_TO_PULL = [
+        "revenue", "operating_income", "income_tax_rate",
+        "income_tax_expense", "pretax_income",
+        "sbc", "restructuring",
+        "total_debt", "total_equity", "cash",
+        "goodwill", "acquired_intangibles", "operating_lease_liabilities",
+        "share_buybacks", "headcount",
+        "capex", "operating_cash_flow",
+    ]
+    
+    def __init__(self, client, start_year=2015, end_year=2025, cache_dir=None):
         self.client = client
         self.start_year = start_year
         self.end_year = end_year
-        # Build quarter labels
-        self.quarters = []
-        for y in range(start_year, end_year + 1):
-            for q in range(1, 5):
-                self.quarters.append(f"Q{q} {y}")
+        # Quarter labels and the ordinal range every metric series spans
+        self.quarters = quarter_range(start_year, end_year)
+        self.start_ordinal = quarter_ordinal(self.quarters[0])
+        
+        # Chosen tag resolution per company/metric, persisted between runs
+        self.resolution_path = None
+        self.resolutions = {}
+        self.series_cache = QuarterSeriesCache(
+            os.path.join(cache_dir, "quarter_series.json") if cache_dir else None
+        )
+        self._digests = {}
+        # Source accession per value: {ticker: {metric: {quarter: accn}}}
+        self.accessions = {}
+        self._sources = {}
+        self._metric_sources = {}
+        # Point-in-time mode: only facts filed on or before this date are used
+        self.as_of = None
+        self._timelines = {}
+        # Derived-metric cache per ticker, reused while inputs are unchanged
+        self.derived_cache = {}
+        # Per-company fiscal calendars and segment series from instance documents
+        self.calendars = {}
+        self.segments = {}
+        self.cache_dir = cache_dir
+        if cache_dir:
+            self.resolution_path = os.path.join(cache_dir, "tag_resolutions.json")
+            if os.path.exists(self.resolution_path):
+                try:
+                    with open(self.resolution_path) as f:
+                        self.resolutions = json.load(f)
+                except (OSError, ValueError):
+                    self.resolutions = {}
     
-    def _parse_tag_from_facts(self, facts_data, taxonomy, tag_name):
-        """Extract a specific tag's data from the company facts JSON."""
+    def save_resolutions(self):
+        """Persist the tag resolution and quarter-series caches for later runs."""
+        self.series_cache.save()
+        if not self.resolution_path:
+            return
+        os.makedirs(os.path.dirname(self.resolution_path), exist_ok=True)
+        tmp = f"{self.resolution_path}.{os.uname().nodename}-{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.resolutions, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.resolution_path)
+    
+    def _parse_tag_units(self, facts_data, taxonomy, tag_name):
+        """Return (unit, data points) for a tag in the company facts JSON."""
         try:
             tag_data = facts_data["facts"][taxonomy][tag_name]
             # Get USD units (or pure number for ratios/counts)
             units = tag_data.get("units", {})
-            if "USD" in units:
-                return units["USD"]
-            elif "pure" in units:
-                return units["pure"]
-            elif "shares" in units:
-                return units["shares"]
+            for preferred in ("USD", "pure", "shares"):
+                if preferred in units:
+                    return preferred, units[preferred]
             # Try first available unit
             for unit_key, unit_data in units.items():
-                return unit_data
-            return []
+                return unit_key, unit_data
+            return None, []
         except (KeyError, TypeError):
-            return []
+            return None, []
+    
+    def _parse_tag_from_facts(self, facts_data, taxonomy, tag_name):
+        """Extract a specific tag's data from the company facts JSON."""
+        return self._parse_tag_units(facts_data, taxonomy, tag_name)[1]
     
-    def _assign_to_quarter(self, filings, period_type, scale=1e-6):
+    def _assign_to_quarter(self, filings, period_type, scale=1e-6, calendar=None, sources=None):
         """Map filing data points to calendar quarters.
         
         This is the tricky part:
@@ -448,7 +1364,23 @@ class XBRLExtractor:
           - 10-Q filings are quarterly (3 months)
           - 10-K filings may be annual (12 months) — need to subtract prior 3 quarters
           - Some companies file YTD figures in 10-Q (6mo, 9mo) — need to difference
+        
+        Period ends are resolved through the company's FiscalCalendar, so
+        YTD/annual differencing happens within a fiscal year and off-calendar
+        quarters (WMT, COST, CRM, WDAY) land on the nearest calendar quarter.
+        
+        If `sources` is a dict it is filled with {quarter: accession number}
+        of the filing each value came from (the cumulative filing for
+        differenced quarters).
         """
+        if sources is None:
+            sources = {}
+        if calendar is None:
+            calendar = FiscalCalendar.from_facts(filings)
+        
+        def scaled(v):
+            return v * scale if scale != 1 else v
+        
         quarterly = {}
         
         # Sort by end date
@@ -466,54 +1398,35 @@ class XBRLExtractor:
                 continue
             if form not in ("10-Q", "10-K", "10-K/A", "10-Q/A"):
                 continue
-            
-            # Calculate duration in days
-            if start:
-                try:
-                    d_start = datetime.strptime(start, "%Y-%m-%d")
-                    d_end = datetime.strptime(end, "%Y-%m-%d")
-                    duration_days = (d_end - d_start).days
-                except:
-                    duration_days = 0
-            else:
-                duration_days = 0
+            if calendar.ordinal(end) is None:
+                continue
             
             by_end[end].append({
                 "val": val,
                 "start": start,
                 "end": end,
                 "form": form,
-                "duration_days": duration_days,
+                "accn": f.get("accn"),
+                "duration_days": calendar.duration_days(start, end),
             })
         
         if period_type == "instant":
             # Balance sheet items: just take the value at period end
             for end_date, entries in by_end.items():
-                try:
-                    dt = datetime.strptime(end_date, "%Y-%m-%d")
-                except:
-                    continue
-                year = dt.year
-                # Determine quarter from month
-                month = dt.month
-                if month <= 3: q = 1
-                elif month <= 6: q = 2
-                elif month <= 9: q = 3
-                else: q = 4
-                
-                qkey = f"Q{q} {year}"
+                qkey = calendar.calendar_quarter(end_date)
                 # Prefer 10-Q/10-K over amendments
                 best = None
                 for e in entries:
                     if best is None or e["form"] in ("10-Q", "10-K"):
                         best = e
                 if best and qkey not in quarterly:
-                    quarterly[qkey] = best["val"] * (1/scale) if scale != 1 else best["val"]
+                    quarterly[qkey] = scaled(best["val"])
+                    sources[qkey] = best["accn"]
         
         elif period_type == "duration":
             # Income statement / cash flow: need quarterly isolation
             # Strategy: collect all periods, prefer ~90-day durations (true quarterly)
-            # Fall back to differencing YTD/annual figures
+            # Fall back to differencing YTD/annual figures within the fiscal year
             
             all_periods = []
             for end_date, entries in by_end.items():
@@ -523,106 +1436,192 @@ class XBRLExtractor:
             # Sort by end date, then by duration (prefer shorter = more granular)
             all_periods.sort(key=lambda x: (x["end"], x["duration_days"]))
             
-            # First, collect true quarterly values (60-100 day duration)
+            # Raw (unscaled) values keyed by fiscal period: {(fy, fq): (val, end, accn)}
+            fiscal_q = {}
+            annual_vals = {}
+            h1_vals = {}
+            m9_vals = {}
+            
             for p in all_periods:
-                if 60 <= p["duration_days"] <= 105:
-                    try:
-                        dt = datetime.strptime(p["end"], "%Y-%m-%d")
-                    except:
-                        continue
-                    month = dt.month
-                    year = dt.year
-                    if month <= 3: q = 1
-                    elif month <= 6: q = 2
-                    elif month <= 9: q = 3
-                    else: q = 4
-                    qkey = f"Q{q} {year}"
+                fy, fq = calendar.fiscal_quarter(p["end"])
+                days = p["duration_days"]
+                if 60 <= days <= 105:
+                    # True quarterly value
+                    fiscal_q.setdefault((fy, fq), (p["val"], p["end"], p["accn"]))
+                    qkey = calendar.calendar_quarter(p["end"])
                     if qkey not in quarterly:
-                        quarterly[qkey] = p["val"] * (1/scale) if scale != 1 else p["val"]
+                        quarterly[qkey] = scaled(p["val"])
+                        sources[qkey] = p["accn"]
+                elif 350 <= days <= 380:
+                    annual_vals[fy] = (p["val"], p["end"], p["accn"])
+                elif 170 <= days <= 200 and fq == 2:
+                    h1_vals[fy] = (p["val"], p["end"], p["accn"])
+                elif 260 <= days <= 290 and fq == 3:
+                    m9_vals[fy] = (p["val"], p["end"], p["accn"])
             
-            # Second pass: for missing quarters, try to derive from YTD/annual
-            # Collect annual and semi-annual values
-            annual_vals = {}
-            ytd_vals = defaultdict(dict)
+            # Fill gaps by differencing cumulative figures of the same fiscal year
+            derivations = []
+            for fy, (h1, end, accn) in h1_vals.items():
+                if (fy, 1) in fiscal_q:  # Q2 = H1 - Q1
+                    derivations.append((fy, 2, h1 - fiscal_q[(fy, 1)][0], end, accn))
+            for fy, (m9, end, accn) in m9_vals.items():
+                if fy in h1_vals:  # Q3 = 9M - H1
+                    derivations.append((fy, 3, m9 - h1_vals[fy][0], end, accn))
+            for fy, (annual, end, accn) in annual_vals.items():
+                if fy in m9_vals:  # Q4 = FY - 9M
+                    derivations.append((fy, 4, annual - m9_vals[fy][0], end, accn))
             
-            for p in all_periods:
-                try:
-                    dt_end = datetime.strptime(p["end"], "%Y-%m-%d")
-                except:
+            for fy, fq, val, end, accn in derivations:
+                if (fy, fq) in fiscal_q:
                     continue
-                year = dt_end.year
-                
-                if 350 <= p["duration_days"] <= 380:
-                    # Annual value
-                    annual_vals[year] = p["val"]
-                elif 170 <= p["duration_days"] <= 200:
-                    # 6-month YTD
-                    month = dt_end.month
-                    if month <= 6:
-                        ytd_vals[year]["H1"] = p["val"]
-                    else:
-                        ytd_vals[year]["H2_cumul"] = p["val"]
-                elif 260 <= p["duration_days"] <= 290:
-                    # 9-month YTD
-                    ytd_vals[year]["9M"] = p["val"]
-            
-            # Try to fill gaps using differencing
-            for year in range(self.start_year, self.end_year + 1):
-                for q in range(1, 5):
-                    qkey = f"Q{q} {year}"
-                    if qkey in quarterly:
-                        continue
-                    
-                    # Try deriving Q4 from annual - 9M
-                    if q == 4 and year in annual_vals and "9M" in ytd_vals.get(year, {}):
-                        val = annual_vals[year] - ytd_vals[year]["9M"]
-                        quarterly[qkey] = val * (1/scale) if scale != 1 else val
-                    
-                    # Try deriving Q2 from H1 - Q1
-                    elif q == 2 and "H1" in ytd_vals.get(year, {}):
-                        q1key = f"Q1 {year}"
-                        if q1key in quarterly:
-                            raw_q1 = quarterly[q1key] * scale if scale != 1 else quarterly[q1key]
-                            val = ytd_vals[year]["H1"] - raw_q1
-                            quarterly[qkey] = val * (1/scale) if scale != 1 else val
+                fiscal_q[(fy, fq)] = (val, end, accn)
+                qkey = calendar.calendar_quarter(end)
+                if qkey not in quarterly:
+                    quarterly[qkey] = scaled(val)
+                    sources[qkey] = accn
         
         return quarterly
     
-    def extract_metric(self, facts_data, metric_name):
-        """Extract a specific metric using the tag mapping with fallbacks."""
+    def _index_candidate_facts(self, facts_data):
+        """Single pass over a company's facts, keeping only tags named in XBRL_TAG_MAP.
+        
+        Returns {"taxonomy:Tag": (unit, [fact, ...])} for every candidate
+        (primary or add_tag) the company actually reports.
+        """
+        wanted = set()
+        for mapping in XBRL_TAG_MAP.values():
+            wanted.update(mapping.get("tags", []))
+            wanted.update(mapping.get("add_tags", []))
+        
+        index = {}
+        for taxonomy, tags in (facts_data or {}).get("facts", {}).items():
+            for tag in tags:
+                tag_full = f"{taxonomy}:{tag}"
+                if tag_full in wanted:
+                    unit, data = self._parse_tag_units(facts_data, taxonomy, tag)
+                    if data:
+                        index[tag_full] = (unit, data)
+        return index
+    
+    def _build_calendar(self, fact_index, fiscal_year_end=None):
+        """FiscalCalendar for a company from its candidate facts.
+        
+        dei facts are left out: their 'end' is often the cover-page date,
+        which would hide the real period end of the filing.
+        """
+        return FiscalCalendar.from_facts(
+            [data for tag_full, (_, data) in fact_index.items() if not tag_full.startswith("dei:")],
+            fiscal_year_end,
+        )
+    
+    def _tag_series(self, cik, tag_full, fact_index, period_type, scale, calendar):
+        """Quarterly series for one tag, served from the memo cache when possible."""
+        unit, data = fact_index[tag_full]
+        # Hash each fact list once per company, however many metrics use it
+        memo = self._digests.get(id(data))
+        if memo is None or memo[0] is not data:
+            memo = (data, self.series_cache.digest(data))
+            self._digests[id(data)] = memo
+        key = self.series_cache.make_key(cik, tag_full, unit, period_type, scale,
+                                         f"{calendar.signature}|{memo[1]}")
+        entry = self.series_cache.get(key)
+        if entry is None:
+            sources = {}
+            entry = [self._assign_to_quarter(data, period_type, scale, calendar, sources), sources]
+            self.series_cache.put(key, entry)
+        self._sources[tag_full] = entry[1]
+        return dict(entry[0])
+    
+    def timeline(self, cik, facts, fact_index=None):
+        """FactTimeline for a company, rebuilt only when its facts change."""
+        cached = self._timelines.get(cik)
+        if cached is None or cached[0] is not facts:
+            if fact_index is None:
+                fact_index = self._index_candidate_facts(facts)
+            cached = self._timelines[cik] = (facts, FactTimeline(fact_index))
+        return cached[1]
+    
+    def resolve_metric(self, fact_index, metric_name, cik=None, calendar=None):
+        """Pick the tags that make up a metric's history (see choose_tags).
+        
+        Every candidate tag is converted to quarters and scored by how many
+        of self.quarters it covers; only synonyms listed under "splice" are
+        combined. The choice is cached per company and reused as long as the
+        company's candidate facts are unchanged.
+        
+        Returns (ordered list of contributing tags, {tag: quarterly series}).
+        """
+        if calendar is None:
+            calendar = self._build_calendar(fact_index)
         mapping = XBRL_TAG_MAP.get(metric_name, {})
         tags = mapping.get("tags", [])
         period_type = mapping.get("period_type", "duration")
         scale = mapping.get("scale", 1e-6)
+        
+        # Signature: which candidates exist and how many facts each carries.
+        # A new filing changes the counts and forces a rescore.
+        signature = {t: len(fact_index[t][1]) for t in tags if t in fact_index}
+        cached = self.resolutions.get(str(cik), {}).get(metric_name) if cik else None
+        if cached and cached.get("signature") == signature and cached.get("version") == RESOLUTION_VERSION:
+            series = {t: self._tag_series(cik, t, fact_index, period_type, scale, calendar)
+                      for t in cached["tags"]}
+            return cached["tags"], series
+        
+        series = {t: self._tag_series(cik, t, fact_index, period_type, scale, calendar)
+                  for t in tags if t in fact_index}
+        used, coverage = choose_tags(mapping, series, set(self.quarters))
+        
+        if cik:
+            self.resolutions.setdefault(str(cik), {})[metric_name] = {
+                "version": RESOLUTION_VERSION,
+                "signature": signature,
+                "tags": used,
+                "coverage": coverage,
+            }
+        return used, {t: series[t] for t in used}
+    
+    def _series(self, mapping=None):
+        """PeriodSeries over self.quarters (labels outside the range are dropped)."""
+        return PeriodSeries.from_mapping(mapping, self.start_ordinal, len(self.quarters))
+    
+    def extract_metric(self, facts_data, metric_name, cik=None, fact_index=None, calendar=None):
+        """Extract a specific metric as a PeriodSeries from the tags resolve_metric picks."""
+        mapping = XBRL_TAG_MAP.get(metric_name, {})
+        period_type = mapping.get("period_type", "duration")
+        scale = mapping.get("scale", 1e-6)
         add_tags = mapping.get("add_tags", [])
         
-        # Try primary tags in order
-        for tag_full in tags:
-            taxonomy, tag = tag_full.split(":", 1)
-            # Map taxonomy prefix to EDGAR format
-            tax_map = {"us-gaap": "us-gaap", "dei": "dei"}
-            taxonomy_key = tax_map.get(taxonomy, taxonomy)
-            
-            data = self._parse_tag_from_facts(facts_data, taxonomy_key, tag)
-            if data:
-                result = self._assign_to_quarter(data, period_type, scale)
-                if result:
-                    # If there are add_tags, sum them in
-                    if add_tags:
-                        for add_tag_full in add_tags:
-                            add_tax, add_tag = add_tag_full.split(":", 1)
-                            add_tax_key = tax_map.get(add_tax, add_tax)
-                            add_data = self._parse_tag_from_facts(facts_data, add_tax_key, add_tag)
-                            if add_data:
-                                add_result = self._assign_to_quarter(add_data, period_type, scale)
-                                for qk, qv in add_result.items():
-                                    if qk in result:
-                                        result[qk] += qv
-                                    else:
-                                        result[qk] = qv
-                    return result
-        
-        return {}
+        if fact_index is None:
+            fact_index = self._index_candidate_facts(facts_data)
+        if calendar is None:
+            calendar = self._build_calendar(fact_index)
+        
+        used, series = self.resolve_metric(fact_index, metric_name, cik, calendar)
+        if not used:
+            return self._series()
+        
+        # Higher-priority synonyms win each quarter they cover
+        result = {}
+        accns = self._metric_sources.setdefault(metric_name, {})
+        for tag_full in used:
+            tag_sources = self._sources.get(tag_full, {})
+            for qk, qv in series[tag_full].items():
+                if qk not in result:
+                    result[qk] = qv
+                    accns[qk] = tag_sources.get(qk)
+        
+        # If there are add_tags, sum them in
+        for add_tag_full in add_tags:
+            if add_tag_full in fact_index:
+                add_result = self._tag_series(cik, add_tag_full, fact_index, period_type, scale, calendar)
+                add_sources = self._sources.get(add_tag_full, {})
+                for qk, qv in add_result.items():
+                    if qk in result:
+                        result[qk] += qv
+                    else:
+                        result[qk] = qv
+                        accns[qk] = add_sources.get(qk)
+        return self._series(result)
     
     def extract_company(self, ticker, name, cik):
         """Extract all metrics for a single company."""
@@ -636,58 +1635,220 @@ class XBRLExtractor:
             return None
         
         results = {}
+        self._digests = {}
+        self._sources = {}
+        self._metric_sources = self.accessions[ticker] = {}
+        fact_index = self._index_candidate_facts(facts)
+        if self.as_of:
+            fact_index = self.timeline(cik, facts, fact_index).as_of(self.as_of)
+            print(f"  ℹ As of {self.as_of}: {sum(len(d) for _, d in fact_index.values())} facts")
+        
+        # One fiscal calendar per company, shared by every metric
+        submissions = self.client.get_submissions(cik) if self.client else None
+        fiscal_year_end = (submissions or {}).get("fiscalYearEnd") or None
+        calendar = self.calendars[ticker] = self._build_calendar(fact_index, fiscal_year_end)
+        print(f"  ℹ Fiscal year end {calendar.fye_month:02d}/{calendar.fye_day:02d}")
         
         # Extract each metric
-        metrics_to_pull = [
-            "revenue", "operating_income", "income_tax_rate",
-            "income_tax_expense", "pretax_income",
-            "sbc", "restructuring",
-            "total_debt", "total_equity", "cash",
-            "goodwill", "acquired_intangibles", "operating_lease_liabilities",
-            "share_buybacks", "headcount",
-            "capex", "operating_cash_flow",
-        ]
-        
-        for metric in metrics_to_pull:
-            data = self.extract_metric(facts, metric)
+        for metric in self.METRICS_TO_PULL:
+            data = self.extract_metric(facts, metric, cik=cik, fact_index=fact_index,
+                                       calendar=calendar)
             results[metric] = data
-            found = sum(1 for q in self.quarters if q in data)
+            found = len(data)
             total = len(self.quarters)
             status = "✓" if found > total * 0.7 else ("◐" if found > 0 else "✗")
-            print(f"  {status} {metric:35s} {found:2d}/{total} quarters")
-        
-        # Calculate derived metrics
-        # Effective tax rate (if not directly reported)
-        if len(results.get("income_tax_rate", {})) < len(self.quarters) * 0.5:
-            tax_exp = results.get("income_tax_expense", {})
-            pretax = results.get("pretax_income", {})
-            calc_rate = {}
-            for q in self.quarters:
-                if q in tax_exp and q in pretax and pretax[q] != 0:
-                    rate = abs(tax_exp[q] / pretax[q])
-                    if 0 < rate < 0.6:  # Sanity check
-                        calc_rate[q] = round(rate, 3)
-            if calc_rate:
-                results["income_tax_rate"] = calc_rate
-                print(f"  ℹ Calculated tax rate from expense/pretax for {len(calc_rate)} quarters")
-        
-        # FCF = Operating Cash Flow - Capex
-        ocf = results.get("operating_cash_flow", {})
-        capex = results.get("capex", {})
-        fcf = {}
-        for q in self.quarters:
-            if q in ocf and q in capex:
-                fcf[q] = round(ocf[q] - capex[q], 1)
-        results["fcf"] = fcf
-        
-        # Fill zero for missing restructuring (most quarters have none)
-        for q in self.quarters:
-            if q not in results.get("restructuring", {}):
-                results.setdefault("restructuring", {})[q] = 0
+            n_tags = len(self.resolutions.get(str(cik), {}).get(metric, {}).get("tags", []))
+            spliced = f"  ({n_tags} tags spliced)" if n_tags > 1 else ""
+            print(f"  {status} {metric:35s} {found:2d}/{total} quarters{spliced}")
         
+        return self.derive_metrics(results, None if self.as_of else ticker)
+    
+    def extract_segments(self, ticker, cik, instance_dir=None):
+        """Segment series from the company's 10-Q/10-K instance documents.
+        
+        Returns {metric: {(axis, member): PeriodSeries}}, with each member's
+        tags chosen as in resolve_metric (see choose_tags). Instances
+        come from instance_dir/<cik>/ when present, else the download cache.
+        """
+        submissions = self.client.get_submissions(cik) or {}
+        recent = submissions.get("filings", {}).get("recent", {})
+        tags = {t: m for m in SEGMENT_METRICS for t in XBRL_TAG_MAP[m]["tags"]}
+        parser = InstanceParser(SEGMENT_AXES, tags)
+        download_dir = os.path.join(self.cache_dir or ".", "instances", str(cik))
+        
+        facts = defaultdict(lambda: defaultdict(list))
+        n_filings = 0
+        for accn, form, filed in zip(recent.get("accessionNumber", []), recent.get("form", []),
+                                     recent.get("filingDate", [])):
+            if form not in ("10-Q", "10-K", "10-Q/A", "10-K/A") or int(filed[:4]) < self.start_year:
+                continue
+            local = os.path.join(instance_dir, str(cik), f"{accn}.xml") if instance_dir else None
+            path = local if local and os.path.exists(local) else \
+                self.client.get_instance(cik, accn, download_dir)
+            if not path:
+                continue
+            n_filings += 1
+            for tag_full, groups in parser.parse(path, form, filed, accn).items():
+                for key, tag_facts in groups.items():
+                    facts[tag_full][key].extend(tag_facts)
+        
+        calendar = self.calendars.get(ticker) or FiscalCalendar.from_facts(
+            [f for groups in facts.values() for fs in groups.values() for f in fs])
+        segments = {}
+        window = set(self.quarters)
+        for metric in SEGMENT_METRICS:
+            mapping = XBRL_TAG_MAP[metric]
+            by_key = defaultdict(dict)
+            for tag_full in mapping["tags"]:
+                for key, tag_facts in facts.get(tag_full, {}).items():
+                    by_key[key][tag_full] = self._assign_to_quarter(
+                        tag_facts, mapping.get("period_type", "duration"), mapping.get("scale", 1e-6), calendar)
+            segments[metric] = {}
+            for key, series in by_key.items():
+                used, _ = choose_tags(mapping, series, window)
+                values = {}
+                for tag_full in used:
+                    for qk, qv in series[tag_full].items():
+                        values.setdefault(qk, qv)
+                if values:
+                    segments[metric][key] = self._series(values)
+        self.segments[ticker] = segments
+        n_members = len({key for groups in segments.values() for key in groups})
+        print(f"  ℹ Segments: {n_members} axis members from {n_filings} instance documents")
+        return segments
+    
+    def derive_metrics(self, results, ticker=None):
+        """Fill metrics computed from others (see DERIVED_METRICS).
+        
+        Every metric is a PeriodSeries over self.quarters. With a ticker,
+        derived series are cached per company and reused while their inputs
+        are unchanged (watch mode re-extracts the same companies).
+        """
+        empty = self._series()
+        results = {m: v if isinstance(v, PeriodSeries) else self._series(v) for m, v in results.items()}
+        cache = self.derived_cache.setdefault(ticker, {}) if ticker is not None else None
+        derived = DERIVED_METRICS.evaluate(results, DERIVED_METRICS.nodes, cache, empty)
+        
+        # Compare contents: on a cache hit the node returns the previous call's object
+        rate = results.get("income_tax_rate", empty)
+        if derived["income_tax_rate"].digest() != rate.digest():
+            print(f"  ℹ Calculated tax rate from expense/pretax for {len(derived['income_tax_rate'])} quarters")
+        results.update({m: d for m, d in derived.items() if d is not empty})
         return results
 
 
+class FramesExtractor(XBRLExtractor):
+    """Tag-major extraction through the XBRL frames API.
+    
+    companyfacts returns tens of MB per company to use a few dozen tags. A
+    frame (/api/xbrl/frames/{taxonomy}/{tag}/{unit}/CY####Q#.json) instead
+    holds one tag for one calendar quarter across every filer, so request
+    count scales with tags × quarters rather than companies. Frames are
+    already aligned to calendar quarters; duration Q4s missing from the
+    quarterly frame are derived from the annual frame (CY####) minus Q1-Q3.
+    """
+    
+    def _frame_series(self, tag_full, period_type, scale, unit, cik_to_ticker, sources=None):
+        """{ticker: {quarter: value}} for one tag across the universe.
+        
+        If `sources` is a dict it is filled with {ticker: {quarter: accn}}.
+        """
+        if sources is None:
+            sources = defaultdict(dict)
+        taxonomy, tag = tag_full.split(":", 1)
+        suffix = "I" if period_type == "instant" else ""
+        
+        def scaled(v):
+            return v * scale if scale != 1 else v
+        
+        series = defaultdict(dict)
+        raw = defaultdict(dict)
+        for year in range(self.start_year, self.end_year + 1):
+            for q in range(1, 5):
+                frame = self.client.get_frame(taxonomy, tag, unit, f"CY{year}Q{q}{suffix}")
+                for row in (frame or {}).get("data", []):
+                    ticker = cik_to_ticker.get(int(row.get("cik", 0)))
+                    if ticker is not None and row.get("val") is not None:
+                        raw[ticker][(year, q)] = row["val"]
+                        series[ticker][f"Q{q} {year}"] = scaled(row["val"])
+                        sources[ticker][f"Q{q} {year}"] = row.get("accn")
+            
+            if period_type != "duration":
+                continue
+            # Q4 is rarely filed as a quarter; derive it from the annual frame
+            missing_q4 = [t for t in raw
+                          if (year, 4) not in raw[t] and all((year, q) in raw[t] for q in (1, 2, 3))]
+            if not missing_q4:
+                continue
+            annual = self.client.get_frame(taxonomy, tag, unit, f"CY{year}")
+            for row in (annual or {}).get("data", []):
+                ticker = cik_to_ticker.get(int(row.get("cik", 0)))
+                if ticker in missing_q4 and row.get("val") is not None:
+                    val = row["val"] - sum(raw[ticker][(year, q)] for q in (1, 2, 3))
+                    series[ticker][f"Q4 {year}"] = scaled(val)
+                    sources[ticker][f"Q4 {year}"] = row.get("accn")
+        return series
+    
+    def extract_universe(self, companies):
+        """Extract every metric for every company; returns {ticker: results}."""
+        cik_to_ticker = {int(cik): ticker for ticker, name, sector, cik in companies}
+        all_results = {ticker: {} for ticker in cik_to_ticker.values()}
+        
+        for metric in self.METRICS_TO_PULL:
+            mapping = XBRL_TAG_MAP.get(metric, {})
+            period_type = mapping.get("period_type", "duration")
+            scale = mapping.get("scale", 1e-6)
+            unit = mapping.get("unit", "USD")
+            
+            # Each company's tags are chosen as in resolve_metric; synonyms
+            # splice with higher-priority tags winning each quarter
+            per_tag = {}
+            for tag_full in mapping.get("tags", []):
+                sources = defaultdict(dict)
+                per_tag[tag_full] = (self._frame_series(tag_full, period_type, scale, unit, cik_to_ticker,
+                                                        sources), sources)
+            window = set(self.quarters)
+            for ticker in all_results:
+                series = {t: by_ticker.get(ticker, {}) for t, (by_ticker, _) in per_tag.items()}
+                used, _ = choose_tags(mapping, series, window)
+                for tag_full in used:
+                    merged = all_results[ticker].setdefault(metric, {})
+                    accns = self.accessions.setdefault(ticker, {}).setdefault(metric, {})
+                    sources = per_tag[tag_full][1]
+                    for qk, qv in series[tag_full].items():
+                        if qk not in merged:
+                            merged[qk] = qv
+                            accns[qk] = sources[ticker].get(qk)
+            
+            # add_tags are summed onto whatever the primary tags produced
+            for add_tag_full in mapping.get("add_tags", []):
+                sources = defaultdict(dict)
+                by_ticker = self._frame_series(add_tag_full, period_type, scale, unit, cik_to_ticker, sources)
+                for ticker, series in by_ticker.items():
+                    merged = all_results[ticker].get(metric)
+                    if not merged:
+                        continue
+                    accns = self.accessions.setdefault(ticker, {}).setdefault(metric, {})
+                    for qk, qv in series.items():
+                        if qk in merged:
+                            merged[qk] += qv
+                        else:
+                            merged[qk] = qv
+                            accns[qk] = sources[ticker].get(qk)
+            
+            found = sum(1 for r in all_results.values() if r.get(metric))
+            print(f"  {metric:35s} {found:4d}/{len(all_results)} companies")
+        
+        extracted = {}
+        for ticker, results in all_results.items():
+            if not any(results.values()):
+                print(f"  ✗ {ticker}: no frame data")
+                continue
+            extracted[ticker] = self.derive_metrics(
+                {metric: self._series(results.get(metric)) for metric in self.METRICS_TO_PULL}, ticker)
+        return extracted
+
+
 # ╔═══════════════════════════════════════════════════════════════════╗
 # ║  CELL 5: Market Cap Supplement                                   ║
 # ╚═══════════════════════════════════════════════════════════════════╝
@@ -722,31 +1883,44 @@ def get_market_caps_placeholder(companies, quarters):
 # ║  CELL 6: Export to CSV (maps to Excel workbook structure)        ║
 # ╚═══════════════════════════════════════════════════════════════════╝
 
+# Map our internal metric names to the Excel line item names
+EXCEL_LINE_MAP = [
+    ("Revenue ($mm)",                   "revenue"),
+    ("Operating Income ($mm)",          "operating_income"),
+    ("Effective Tax Rate",              "income_tax_rate"),
+    ("Stock-Based Compensation ($mm)",  "sbc"),
+    ("Restructuring Charges ($mm)",     "restructuring"),
+    ("Total Debt ($mm)",                "total_debt"),
+    ("Total Shareholders' Equity ($mm)","total_equity"),
+    ("Cash & Equivalents ($mm)",        "cash"),
+    ("Goodwill ($mm)",                  "goodwill"),
+    ("Acquired Intangibles ($mm)",      "acquired_intangibles"),
+    ("Operating Lease Liabilities ($mm)","operating_lease_liabilities"),
+    ("Share Buybacks ($mm)",            "share_buybacks"),
+    ("Headcount",                       "headcount"),
+    ("Capital Expenditures ($mm)",      "capex"),
+    ("Free Cash Flow ($mm)",            "fcf"),
+    ("Market Cap ($mm)",                "market_cap"),
+]
+
+
+def _csv_cells(metric_data, quarters):
+    """{quarter: cell} for one metric row, "" where the quarter has no value.
+    
+    Values are rounded to one decimal; zeros (zero-filled restructuring) are
+    written as 0.
+    """
+    series = as_series(metric_data, quarters)
+    rounded = np.round(series.values, 1)
+    return {q: (v if v != 0 else 0) if ok else ""
+            for q, v, ok in zip(quarters, rounded.tolist(), series.mask.tolist())}
+
+
 def export_to_csv(all_results, companies, quarters, output_dir):
     """Export extracted data to CSVs matching the Excel workbook structure."""
     
     os.makedirs(output_dir, exist_ok=True)
     
-    # Map our internal metric names to the Excel line item names
-    EXCEL_LINE_MAP = [
-        ("Revenue ($mm)",                   "revenue"),
-        ("Operating Income ($mm)",          "operating_income"),
-        ("Effective Tax Rate",              "income_tax_rate"),
-        ("Stock-Based Compensation ($mm)",  "sbc"),
-        ("Restructuring Charges ($mm)",     "restructuring"),
-        ("Total Debt ($mm)",                "total_debt"),
-        ("Total Shareholders' Equity ($mm)","total_equity"),
-        ("Cash & Equivalents ($mm)",        "cash"),
-        ("Goodwill ($mm)",                  "goodwill"),
-        ("Acquired Intangibles ($mm)",      "acquired_intangibles"),
-        ("Operating Lease Liabilities ($mm)","operating_lease_liabilities"),
-        ("Share Buybacks ($mm)",            "share_buybacks"),
-        ("Headcount",                       "headcount"),
-        ("Capital Expenditures ($mm)",      "capex"),
-        ("Free Cash Flow ($mm)",            "fcf"),
-        ("Market Cap ($mm)",                "market_cap"),
-    ]
-    
     # Create one CSV per company (easy to review and correct)
     for ticker, name, sector, cik in companies:
         if ticker not in all_results:
@@ -756,13 +1930,7 @@ def export_to_csv(all_results, companies, quarters, output_dir):
         rows = []
         
         for excel_name, metric_key in EXCEL_LINE_MAP:
-            row = {"Line Item": excel_name}
-            metric_data = company_data.get(metric_key, {})
-            for q in quarters:
-                val = metric_data.get(q, "")
-                if isinstance(val, float):
-                    val = round(val, 1)
-                row[q] = val
+            row = {"Line Item": excel_name, **_csv_cells(company_data.get(metric_key), quarters)}
             rows.append(row)
         
         df = pd.DataFrame(rows)
@@ -777,13 +1945,8 @@ def export_to_csv(all_results, companies, quarters, output_dir):
             continue
         company_data = all_results[ticker]
         for excel_name, metric_key in EXCEL_LINE_MAP:
-            row = {"Ticker": ticker, "Company": name, "Line Item": excel_name}
-            metric_data = company_data.get(metric_key, {})
-            for q in quarters:
-                val = metric_data.get(q, "")
-                if isinstance(val, float):
-                    val = round(val, 1)
-                row[q] = val
+            row = {"Ticker": ticker, "Company": name, "Line Item": excel_name,
+                   **_csv_cells(company_data.get(metric_key), quarters)}
             all_rows.append(row)
     
     df_all = pd.DataFrame(all_rows)
@@ -803,27 +1966,264 @@ def export_to_csv(all_results, companies, quarters, output_dir):
         total_cells = 0
         filled_cells = 0
         for excel_name, metric_key in EXCEL_LINE_MAP:
-            metric_data = company_data.get(metric_key, {})
-            for q in quarters:
-                total_cells += 1
-                if q in metric_data and metric_data[q] != "" and metric_data[q] != 0:
-                    filled_cells += 1
+            series = as_series(company_data.get(metric_key), quarters)
+            total_cells += len(quarters)
+            filled_cells += int((series.mask & (series.values != 0)).sum())
         pct = filled_cells / total_cells * 100 if total_cells > 0 else 0
         print(f"  {ticker:6s}  {filled_cells:4d}/{total_cells:4d} cells ({pct:.0f}%)")
     
     return combined_path
 
 
+def export_segments_csv(segments, companies, quarters, output_dir):
+    """Write segment series to segments_quarterly.csv, one row per metric × axis member."""
+    line_names = {metric: excel_name for excel_name, metric in EXCEL_LINE_MAP}
+    rows = []
+    for ticker, name, sector, cik in companies:
+        for metric, groups in segments.get(ticker, {}).items():
+            for (axis, member), series in sorted(groups.items()):
+                rows.append({"Ticker": ticker, "Company": name, "Line Item": line_names.get(metric, metric),
+                             "Axis": axis, "Member": member, **_csv_cells(series, quarters)})
+    path = os.path.join(output_dir, "segments_quarterly.csv")
+    pd.DataFrame(rows, columns=["Ticker", "Company", "Line Item", "Axis", "Member", *quarters]).to_csv(path, index=False)
+    print(f"  ✓ Segments file: {path} ({len(rows)} rows)")
+    return path
+
+
+def merge_company_csvs(all_results, companies, quarters, output_dir):
+    """Rewrite outputs for just the companies in all_results.
+    
+    Per-company CSVs are replaced; their rows in all_companies_quarterly.csv
+    are swapped in place, leaving every other company untouched.
+    """
+    combined_path = os.path.join(output_dir, "all_companies_quarterly.csv")
+    if not os.path.exists(combined_path):
+        return export_to_csv(all_results, companies, quarters, output_dir)
+    
+    order = {ticker: i for i, (ticker, name, sector, cik) in enumerate(companies)}
+    existing = pd.read_csv(combined_path, dtype=str, keep_default_na=False)
+    existing = existing[~existing["Ticker"].isin(all_results.keys())]
+    
+    new_rows = []
+    for ticker, name, sector, cik in companies:
+        if ticker not in all_results:
+            continue
+        rows = []
+        for excel_name, metric_key in EXCEL_LINE_MAP:
+            rows.append({"Line Item": excel_name, **_csv_cells(all_results[ticker].get(metric_key), quarters)})
+        pd.DataFrame(rows).to_csv(os.path.join(output_dir, f"{ticker}_quarterly.csv"), index=False)
+        new_rows += [{"Ticker": ticker, "Company": name, **r} for r in rows]
+    
+    merged = pd.concat([existing, pd.DataFrame(new_rows).astype(str)], ignore_index=True)
+    merged = merged.fillna("")
+    line_order = {excel_name: i for i, (excel_name, _) in enumerate(EXCEL_LINE_MAP)}
+    merged = merged.sort_values(
+        by=["Ticker", "Line Item"],
+        key=lambda col: col.map(order if col.name == "Ticker" else line_order).fillna(len(order)),
+        kind="stable",
+    )
+    merged.to_csv(combined_path, index=False)
+    print(f"  ✓ Updated {len(all_results)} companies in {combined_path}")
+    return combined_path
+
+
+# Derived line items take their source accession from the input they come from
+ACCESSION_FALLBACK = {"fcf": "operating_cash_flow", "income_tax_rate": "income_tax_expense"}
+
+
+def export_as_of_panels(extractor, companies, dates, output_dir):
+    """Rebuild the CSV panel as known on each date, into output_dir/as_of/<date>/.
+    
+    Companies are the outer loop so each one's facts are fetched once and
+    served from the response cache for every date. Tag resolutions chosen
+    for historical facts are kept apart from the live ones.
+    """
+    dates = sorted(dates)
+    panels = {d: {} for d in dates}
+    live_resolutions = extractor.resolutions
+    try:
+        for ticker, name, sector, cik in companies:
+            for date in dates:
+                extractor.as_of = date
+                extractor.resolutions = {}
+                result = extractor.extract_company(ticker, name, cik)
+                if result:
+                    panels[date][ticker] = result
+    finally:
+        extractor.as_of = None
+        extractor.resolutions = live_resolutions
+    
+    paths = {}
+    for date in dates:
+        print(f"\n  Panel as of {date}: {len(panels[date])} companies")
+        paths[date] = export_to_csv(panels[date], companies, extractor.quarters,
+                                    os.path.join(output_dir, "as_of", date))
+    return paths
+
+
+# Bump when extraction methodology changes (scale, quarter assignment, tag
+# selection): older snapshots are then discarded instead of diffed, so the
+# change is not logged as a wave of restatements
+SNAPSHOT_VERSION = 2
+
+
+def diff_against_snapshot(all_results, quarters, accessions, snapshot_path, changelog_path):
+    """Log values that moved since the previous run (restatements, 10-K/As).
+    
+    The snapshot keeps, per "ticker|line item" row, a hash of the row and its
+    {quarter: value} cells. Only rows of the companies in all_results are
+    looked at, and only rows whose hash changed are compared cell by cell,
+    so the work follows what changed rather than the universe size. Each
+    changed or removed cell is appended to changelog_path as one JSON line
+    with old/new values and the accession number of the new value.
+    Companies with nothing to compare against (first run, evicted cache,
+    a snapshot from an older SNAPSHOT_VERSION) are recorded with a
+    "baseline" line instead, which tells readers of the log to disregard
+    their earlier entries.
+    
+    Returns the list of change records written.
+    """
+    snapshot = {}
+    if os.path.exists(snapshot_path):
+        try:
+            with open(snapshot_path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            snapshot = {}
+    if snapshot.pop("__version__", None) != SNAPSHOT_VERSION:
+        snapshot = {}
+    known = {key.split("|", 1)[0] for key in snapshot}
+    
+    run = datetime.now().isoformat(timespec="seconds")
+    changes = []
+    added = 0
+    baseline = sorted(t for t in all_results if t not in known)
+    for ticker, company_data in all_results.items():
+        company_accns = accessions.get(ticker, {})
+        for excel_name, metric_key in EXCEL_LINE_MAP:
+            cells = {q: v for q, v in _csv_cells(company_data.get(metric_key), quarters).items() if v != ""}
+            digest = hashlib.sha1(json.dumps(cells, sort_keys=True).encode()).hexdigest()
+            key = f"{ticker}|{excel_name}"
+            previous = snapshot.get(key)
+            snapshot[key] = {"digest": digest, "values": cells}
+            if previous is None or previous["digest"] == digest:
+                continue
+            
+            metric_accns = company_accns.get(metric_key) or company_accns.get(
+                ACCESSION_FALLBACK.get(metric_key), {})
+            old_cells = previous["values"]
+            for q in quarters:
+                old, new = old_cells.get(q), cells.get(q)
+                if old == new:
+                    continue
+                if old is None:
+                    added += 1
+                    continue
+                changes.append({
+                    "run": run, "ticker": ticker, "item": excel_name, "quarter": q,
+                    "old": old, "new": new, "accn": metric_accns.get(q),
+                    "kind": "removed" if new is None else "restated",
+                })
+    
+    if changes or baseline:
+        os.makedirs(os.path.dirname(changelog_path) or ".", exist_ok=True)
+        with open(changelog_path, 'a') as f:
+            if baseline:
+                f.write(json.dumps({"run": run, "kind": "baseline", "version": SNAPSHOT_VERSION,
+                                    "tickers": baseline}) + "\n")
+            for c in changes:
+                f.write(json.dumps(c) + "\n")
+    os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+    tmp = snapshot_path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump({"__version__": SNAPSHOT_VERSION, **snapshot}, f, separators=(",", ":"))
+    os.replace(tmp, snapshot_path)
+    
+    restated = {(c["ticker"], c["quarter"]) for c in changes}
+    print(f"  Change log: {len(changes)} changed cells in {len(restated)} ticker-quarters, "
+          f"{added} new cells, {len(baseline)} companies baselined -> {changelog_path}")
+    return changes
+
+
 # ╔═══════════════════════════════════════════════════════════════════╗
 # ║  CELL 7: Scheduling / Auto-Update                               ║
 # ╚═══════════════════════════════════════════════════════════════════╝
 
-def check_new_filings(client, companies, days_back=45):
+PERIODIC_FORMS = ("10-Q", "10-K", "10-Q/A", "10-K/A")
+_FORM_IDX_RE = re.compile(r"^(\S.*?)\s{2,}(.+?)\s{2,}(\d+)\s{2,}(\d{4}-?\d{2}-?\d{2})\s{2,}(\S+)\s*$")
+
+
+def scan_full_index(path, ciks, forms=PERIODIC_FORMS, since=""):
+    """Filings in one form.idx / master.idx by companies in `ciks`.
+    
+    Streams the file line by line and joins on CIK with a dict lookup.
+    form.idx is sorted by form type, so the scan stops once it is past the
+    wanted forms. Returns [{"ticker", "cik", "form", "date", "accn"}].
+    """
+    found = []
+    last_form, in_range = "", False
+    with open(path, encoding="latin-1") as f:
+        for line in f:
+            if "|" in line:  # master.idx: CIK|Company Name|Form Type|Date Filed|Filename
+                parts = line.rstrip("\n").split("|")
+                if len(parts) != 5 or not parts[0].isdigit():
+                    continue
+                cik, _, form, date, filename = parts
+            else:
+                m = _FORM_IDX_RE.match(line)
+                if not m:
+                    continue
+                form, _, cik, date, filename = m.groups()
+                if form < last_form:
+                    in_range = None  # not sorted after all: no early exit
+                elif in_range is not None:
+                    if form in forms:
+                        in_range = True
+                    elif in_range and form > max(forms):
+                        break
+                last_form = form
+            if form not in forms:
+                continue
+            ticker = ciks.get(int(cik))
+            date = date if "-" in date else f"{date[:4]}-{date[4:6]}-{date[6:]}"
+            if ticker is None or date < since:
+                continue
+            accn = os.path.splitext(os.path.basename(filename))[0]
+            found.append({"ticker": ticker, "cik": int(cik), "form": form, "date": date, "accn": accn})
+    return found
+
+
+def detect_filings_from_index(client, companies, since, forms=PERIODIC_FORMS, index_dir=None):
+    """(filings since `since`, whether any index file changed) for the universe.
+    
+    One full-index file per calendar quarter in [since, today], from
+    index_dir when a local copy exists, else downloaded into the cache.
+    """
+    ciks = {int(cik): ticker for ticker, name, sector, cik in companies}
+    start = datetime.strptime(since, "%Y-%m-%d")
+    today = datetime.now()
+    filings, changed = [], False
+    for o in range(start.year * 4 + (start.month - 1) // 3, today.year * 4 + (today.month - 1) // 3 + 1):
+        year, qtr = divmod(o, 4)
+        local = [os.path.join(index_dir, str(year), f"QTR{qtr + 1}", name)
+                 for name in ("form.idx", "master.idx")] if index_dir else []
+        path = next((p for p in local if os.path.exists(p)), None)
+        if path is None:
+            path, fresh = client.get_full_index(year, qtr + 1, os.path.join(CACHE_DIR, "full-index"))
+            changed |= fresh
+        filings.extend(scan_full_index(path, ciks, forms, since))
+    return filings, changed
+
+
+def check_new_filings(client, companies, days_back=45, mode=None):
     """Check EDGAR for recent 10-Q/10-K filings to trigger update.
     
-    Uses the EDGAR full-text search to find recent filings.
-    Designed to be called by a scheduler (cron, Colab scheduler, GitHub Actions).
+    In "index" mode (FILING_DETECTION) one full-index file per quarter
+    answers for the whole universe; "submissions" mode makes one request
+    per company. Designed to be called by a scheduler (cron, Colab
+    scheduler, GitHub Actions).
     """
+    mode = mode or FILING_DETECTION
     print(f"\n{'='*60}")
     print(f"  CHECKING FOR NEW FILINGS (last {days_back} days)")
     print(f"{'='*60}")
@@ -831,6 +2231,19 @@ def check_new_filings(client, companies, days_back=45):
     new_filings = []
     cutoff = datetime.now() - timedelta(days=days_back)
     
+    if mode == "index":
+        try:
+            found, _ = detect_filings_from_index(client, companies, cutoff.strftime("%Y-%m-%d"),
+                                                 ("10-Q", "10-K"), FULL_INDEX_DIR or None)
+            for filing in sorted(found, key=lambda x: (x["date"], x["ticker"])):
+                new_filings.append({k: filing[k] for k in ("ticker", "form", "date", "accn")})
+                print(f"  ✓ {filing['ticker']}: {filing['form']} filed {filing['date']}")
+            if not new_filings:
+                print("  No new 10-Q/10-K filings found")
+            return new_filings
+        except Exception as e:
+            print(f"  ⚠ Full-index detection failed ({e}); polling submissions instead")
+    
     for ticker, name, sector, cik in companies:
         cik_padded = str(cik).zfill(10)
         client._rate_limit()
@@ -867,6 +2280,590 @@ def check_new_filings(client, companies, days_back=45):
     return new_filings
 
 
+def watch_filings(client, extractor, companies, interval=600, max_cycles=None):
+    """Long-running watch mode: refresh companies minutes after they file.
+    
+    Each sweep polls every company's submissions with a conditional request
+    (a 304 costs almost nothing), or with WATCH_DETECTION=index reads the
+    full-index file once (cheaper, but only updated nightly), compares 10-Q/10-K accession numbers with
+    the ones already processed, and queues companies that have new ones.
+    Queued companies are re-extracted, their rows are swapped into the CSV
+    outputs, and calculate_roic.py is rerun with CHANGED_TICKERS so only
+    their dashboard entries are recomputed. Sweeps never run faster than the
+    client rate limit allows for the requests they make.
+    """
+    import subprocess
+    import sys
+    
+    state_path = os.path.join(CACHE_DIR, "watch_state.json")
+    state = {"seen": {}, "validators": {}}
+    if os.path.exists(state_path):
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"  ⚠ Unreadable watch state ({e}); starting fresh")
+    client.validators.update({k: tuple(v) for k, v in state.get("validators", {}).items()})
+    seen = state.setdefault("seen", {})
+    pending = state.setdefault("pending", {})  # cik -> accessions awaiting a successful extraction
+    
+    by_index = WATCH_DETECTION == "index"
+    sweep_floor = client.RATE_LIMIT if by_index else len(companies) * client.RATE_LIMIT
+    cycle = 0
+    while max_cycles is None or cycle < max_cycles:
+        cycle += 1
+        started = time.time()
+        queue = []
+        polled = None
+        if by_index:
+            # One conditional full-index fetch covers every company
+            try:
+                since = (datetime.now() - timedelta(days=WATCH_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+                filings, _ = detect_filings_from_index(client, companies, since, PERIODIC_FORMS,
+                                                       FULL_INDEX_DIR or None)
+                polled = defaultdict(set)
+                for filing in filings:
+                    polled[filing["cik"]].add(filing["accn"])
+            except Exception as e:
+                print(f"  ⚠ Full-index poll failed — {e}; polling submissions")
+        for ticker, name, sector, cik in companies:
+            accns = None
+            if polled is not None:
+                accns = polled.get(int(cik), set())
+            else:
+                try:
+                    data = client.poll_submissions(cik)
+                except Exception as e:
+                    print(f"  ⚠ {ticker}: poll failed — {e}")
+                    data = None
+                if data is not None:
+                    recent = data.get("filings", {}).get("recent", {})
+                    accns = {a for a, form in zip(recent.get("accessionNumber", []), recent.get("form", []))
+                             if form in PERIODIC_FORMS}
+            retry = set(pending.get(str(cik), []))
+            if accns is None and not retry:
+                continue  # unchanged (304) and nothing outstanding
+            accns = (accns or set()) | retry
+            known = set(seen.get(str(cik), []))
+            if str(cik) in seen and accns - known:
+                print(f"  ✓ {ticker}: new filing(s) {sorted(accns - known)}")
+                pending[str(cik)] = sorted(accns | known)
+                queue.append((ticker, name, sector, cik))
+            else:
+                seen[str(cik)] = sorted(accns | known)
+        
+        if queue:
+            updated = {}
+            for ticker, name, sector, cik in queue:
+                client.cache.pop(f"facts_{cik}", None)  # force a fresh companyfacts pull
+                try:
+                    result = extractor.extract_company(ticker, name, cik)
+                except Exception as e:
+                    print(f"  ⚠ {ticker}: extraction failed — {e}; retrying next sweep")
+                    continue
+                if result:
+                    updated[ticker] = result
+                    # Only now are the new accessions processed; a failed
+                    # extraction leaves them pending for the next sweep
+                    seen[str(cik)] = pending.pop(str(cik))
+            extractor.save_resolutions()
+            if updated:
+                diff_against_snapshot(updated, extractor.quarters, extractor.accessions,
+                                      os.path.join(CACHE_DIR, "series_snapshot.json"),
+                                      os.path.join(OUTPUT_DIR, "changelog.jsonl"))
+                merge_company_csvs(updated, companies, extractor.quarters, OUTPUT_DIR)
+                env = dict(os.environ, INPUT_DIR=OUTPUT_DIR, OUTPUT_DIR=DASHBOARD_DIR,
+                           CHANGED_TICKERS=",".join(sorted(updated)))
+                script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calculate_roic.py")
+                subprocess.run([sys.executable, script], env=env, check=False)
+        
+        state["validators"] = {k: list(v) for k, v in client.validators.items()}
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = state_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, state_path)
+        
+        elapsed = time.time() - started
+        print(f"  Sweep {cycle}: {len(queue)} queued, {len(pending)} pending retry, in {elapsed:.0f}s")
+        wait = max(interval, sweep_floor) - elapsed
+        if (max_cycles is None or cycle < max_cycles) and wait > 0:
+            time.sleep(wait)
+    return seen
+
+
+# ╔═══════════════════════════════════════════════════════════════════╗
+# ║  CELL 7B: AI Layoff Event Discovery (8-K full-text index)         ║
+# ╚═══════════════════════════════════════════════════════════════════╝
+# Filing text is tokenized once into a positional inverted index (SQLite,
+# one row per term × document with its token positions). Phrase and
+# proximity queries then only read the postings of the query terms, so a
+# rescan indexes just the new filings and re-queries in seconds.
+
+EVENT_AI_PHRASES = ["artificial intelligence", "ai", "generative ai", "ai agents",
+                    "machine learning", "automation"]
+EVENT_LAYOFF_PHRASES = ["reduction in force", "workforce reduction", "reduction of our workforce",
+                        "headcount reduction", "layoffs", "job cuts", "positions eliminated",
+                        "eliminate positions", "restructuring plan", "severance"]
+EVENT_NEAR = 50          # tokens between an AI phrase and a layoff phrase
+EVENT_DIRECT_NEAR = 15   # closest pair within this many tokens → "direct"
+EVENT_FORMS = ("8-K", "8-K/A", "10-Q")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_TAG_RE = re.compile(r"<[^>]*>")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def stream_tokens(path, chunk_size=1 << 16):
+    """Tokens of an HTML/text document, read in chunks.
+    
+    Each chunk is cut before any unclosed tag, entity or word and the tail
+    carried into the next one, so tokens never split across chunks.
+    """
+    carry = ""
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            text = carry + chunk
+            if chunk:
+                cut = len(text)
+                lt = text.find("<", text.rfind(">") + 1)  # first unclosed "<", not the last
+                if lt != -1:
+                    cut = lt
+                amp = text.rfind("&", 0, cut)
+                if amp != -1 and text.rfind(";", amp, cut) == -1 and cut - amp < 12:
+                    cut = amp
+                m = re.search(r"[A-Za-z0-9]+$", text[:cut])
+                if m:
+                    cut = m.start()
+                text, carry = text[:cut], text[cut:]
+            yield from tokenize(html.unescape(_TAG_RE.sub(" ", text)))
+            if not chunk:
+                return
+
+
+class FilingIndex:
+    """On-disk positional inverted index over filing documents."""
+    
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY, ticker TEXT, accn TEXT, name TEXT,
+                form TEXT, filed TEXT, n_tokens INTEGER, UNIQUE (accn, name));
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT, doc INTEGER, positions BLOB, PRIMARY KEY (term, doc)) WITHOUT ROWID;
+        """)
+    
+    def has_filing(self, accn):
+        return self.db.execute("SELECT 1 FROM docs WHERE accn = ? LIMIT 1", (accn,)).fetchone() is not None
+    
+    def add_document(self, ticker, accn, name, form, filed, path):
+        """Index one document; returns False if it was already indexed."""
+        if self.db.execute("SELECT 1 FROM docs WHERE accn = ? AND name = ?", (accn, name)).fetchone():
+            return False
+        positions = defaultdict(list)
+        n = -1
+        for n, term in enumerate(stream_tokens(path)):
+            positions[term].append(n)
+        with self.db:
+            doc = self.db.execute(
+                "INSERT INTO docs (ticker, accn, name, form, filed, n_tokens) VALUES (?, ?, ?, ?, ?, ?)",
+                (ticker, accn, name, form, filed, n + 1)).lastrowid
+            self.db.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                ((t, doc, np.asarray(p, dtype=np.uint32).tobytes()) for t, p in positions.items()))
+        return True
+    
+    def postings(self, term):
+        """{doc id: sorted positions} for one term."""
+        return {doc: np.frombuffer(blob, dtype=np.uint32).astype(np.int64)
+                for doc, blob in self.db.execute("SELECT doc, positions FROM postings WHERE term = ?", (term,))}
+    
+    def phrase(self, phrase):
+        """{doc id: start positions} of an exact phrase, by positional intersection."""
+        terms = tokenize(phrase)
+        if not terms:
+            return {}
+        hits = self.postings(terms[0])
+        for offset, term in enumerate(terms[1:], 1):
+            nxt = self.postings(term)
+            hits = {doc: np.intersect1d(pos, nxt[doc] - offset) for doc, pos in hits.items() if doc in nxt}
+            hits = {doc: pos for doc, pos in hits.items() if len(pos)}
+        return hits
+    
+    def any_phrase(self, phrases):
+        """{doc id: sorted positions} of any of the phrases."""
+        merged = defaultdict(list)
+        for phrase in phrases:
+            for doc, pos in self.phrase(phrase).items():
+                merged[doc].append(pos)
+        return {doc: np.unique(np.concatenate(parts)) for doc, parts in merged.items()}
+    
+    def near(self, phrases_a, phrases_b, window):
+        """{doc id: (a positions within `window` of a b position, their distances)}."""
+        a_hits, b_hits = self.any_phrase(phrases_a), self.any_phrase(phrases_b)
+        out = {}
+        for doc in a_hits.keys() & b_hits.keys():
+            a, b = a_hits[doc], b_hits[doc]
+            i = np.clip(np.searchsorted(b, a), 1, len(b)) - 1
+            j = np.minimum(i + 1, len(b) - 1)
+            dist = np.minimum(np.abs(a - b[i]), np.abs(a - b[j]))
+            close = dist <= window
+            if close.any():
+                out[doc] = (a[close], dist[close])
+        return out
+    
+    def docs(self, ids):
+        rows = self.db.execute(f"SELECT id, ticker, accn, name, form, filed, n_tokens FROM docs "
+                               f"WHERE id IN ({','.join('?' * len(ids))})", list(ids)) if ids else []
+        return {r[0]: dict(zip(("id", "ticker", "accn", "name", "form", "filed", "n_tokens"), r)) for r in rows}
+    
+    def close(self):
+        self.db.close()
+
+
+def index_filings(client, index, companies, since, archive_dir=None, download_dir=None):
+    """Add every not-yet-indexed 8-K / 10-Q filed on or after `since` to the index."""
+    added = 0
+    for ticker, name, sector, cik in companies:
+        recent = (client.get_submissions(cik) or {}).get("filings", {}).get("recent", {})
+        for accn, form, filed, primary in zip(recent.get("accessionNumber", []), recent.get("form", []),
+                                              recent.get("filingDate", []), recent.get("primaryDocument", [])):
+            if form not in EVENT_FORMS or filed < since or index.has_filing(accn):
+                continue
+            local = os.path.join(archive_dir, str(cik), accn) if archive_dir else None
+            if local and os.path.isdir(local):
+                paths = sorted(os.path.join(local, n) for n in os.listdir(local))
+            else:
+                paths = client.get_filing_documents(cik, accn, os.path.join(download_dir or ".", str(cik)), primary)
+            for path in paths:
+                if path and index.add_document(ticker, accn, os.path.basename(path), form, filed, path):
+                    added += 1
+    return added
+
+
+def propose_events(index, known_events=(), window=EVENT_NEAR):
+    """Scored AI-layoff event candidates, one per ticker × quarter.
+    
+    Each co-mention of an AI phrase and a layoff phrase within `window`
+    tokens adds 1 / (1 + distance / 10), so tight co-mentions dominate.
+    """
+    known = {(e[0], e[1]) for e in known_events}
+    near = index.near(EVENT_AI_PHRASES, EVENT_LAYOFF_PHRASES, window)
+    best = {}
+    for doc_id, meta in index.docs(list(near)).items():
+        _, dist = near[doc_id]
+        year, month = int(meta["filed"][:4]), int(meta["filed"][5:7])
+        quarter = f"Q{(month - 1) // 3 + 1} {year}"
+        score = float((1 / (1 + dist / 10)).sum())
+        key = (meta["ticker"], quarter)
+        if key not in best or score > best[key]["score"]:
+            best[key] = {
+                "ticker": meta["ticker"], "quarter": quarter, "filed": meta["filed"], "form": meta["form"],
+                "accn": meta["accn"], "document": meta["name"], "score": round(score, 3), "hits": int(len(dist)),
+                "attribution": "direct" if dist.min() <= EVENT_DIRECT_NEAR else "partial",
+                "known": key in known,
+            }
+    return sorted(best.values(), key=lambda c: (-c["score"], c["ticker"], c["quarter"]))
+
+
+def discover_events(client, companies, output_dir, cache_dir, since, archive_dir=None):
+    """Index new filings, then write event_candidates.csv; returns the candidates."""
+    index = FilingIndex(os.path.join(cache_dir, "event_index", "postings.sqlite"))
+    try:
+        start = time.time()
+        added = index_filings(client, index, companies, since, archive_dir,
+                              os.path.join(cache_dir, "filings"))
+        candidates = propose_events(index, AI_LAYOFF_EVENTS)
+    finally:
+        index.close()
+    path = os.path.join(output_dir, "event_candidates.csv")
+    columns = ["ticker", "quarter", "filed", "form", "accn", "document", "score", "hits", "attribution", "known"]
+    pd.DataFrame(candidates, columns=columns).to_csv(path, index=False)
+    new = sum(1 for c in candidates if not c["known"])
+    print(f"  ✓ Event discovery: {added} documents indexed, {len(candidates)} candidates "
+          f"({new} not in AI_LAYOFF_EVENTS) in {time.time() - start:.1f}s -> {path}")
+    return candidates
+
+
+# ╔═══════════════════════════════════════════════════════════════════╗
+# ║  CELL 7C: Sharded Runs (lease queue + merge)                      ║
+# ╚═══════════════════════════════════════════════════════════════════╝
+# Shards are fixed by CIK hash, so a company always lands in the same shard
+# and each shard keeps its own cache between runs. Workers lease shards from
+# a SQLite queue on a shared filesystem; a lease not renewed within
+# SHARD_LEASE seconds (crashed node) is handed to the next worker, and a
+# shard that fails SHARD_ATTEMPTS times is marked failed. Each attempt
+# writes to its own directory (including its copy of the shard's restatement
+# snapshot) and only the lease holder can record it as the shard's output
+# and promote the snapshot, so a late or duplicate worker never clobbers it.
+
+def shard_of(cik, shards):
+    """Shard number of a CIK (stable across processes and Python versions)."""
+    return int(hashlib.sha1(str(int(cik)).encode()).hexdigest()[:8], 16) % shards
+
+
+def partition(companies, shards):
+    """[companies of shard 0, ..., shard n-1], each in COMPANIES order."""
+    parts = [[] for _ in range(shards)]
+    for company in companies:
+        parts[shard_of(company[3], shards)].append(company)
+    return parts
+
+
+class ShardQueue:
+    """SQLite work queue of shards with leases and bounded retries."""
+    
+    def __init__(self, path, run=SHARD_RUN, max_attempts=SHARD_ATTEMPTS):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.run = run
+        self.max_attempts = max_attempts
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS shards (
+                run TEXT, shard INTEGER, n_shards INTEGER, state TEXT DEFAULT 'pending',
+                worker TEXT, lease_until REAL, attempts INTEGER DEFAULT 0,
+                output TEXT, error TEXT, PRIMARY KEY (run, shard))""")
+        self.db.execute("CREATE TABLE IF NOT EXISTS merges (run TEXT PRIMARY KEY, merged_at TEXT)")
+    
+    def _tx(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+    
+    def seed(self, shards):
+        """Create the run's shards if needed (idempotent across workers)."""
+        db = self._tx()
+        try:
+            seeded = {r[0] for r in db.execute("SELECT DISTINCT n_shards FROM shards WHERE run = ?", (self.run,))}
+            if seeded and seeded != {shards}:
+                raise ValueError(f"run {self.run!r} was seeded with {sorted(seeded)} shards, not {shards}")
+            db.executemany("INSERT OR IGNORE INTO shards (run, shard, n_shards) VALUES (?, ?, ?)",
+                           ((self.run, i, shards) for i in range(shards)))
+        finally:
+            db.execute("COMMIT")
+    
+    def reset(self):
+        self.db.execute("DELETE FROM shards WHERE run = ?", (self.run,))
+        self.db.execute("DELETE FROM merges WHERE run = ?", (self.run,))
+    
+    def mark_merged(self):
+        """Record the run as merged; False if it already was."""
+        cur = self.db.execute("INSERT OR IGNORE INTO merges VALUES (?, ?)",
+                              (self.run, datetime.now().isoformat(timespec="seconds")))
+        return cur.rowcount == 1
+    
+    def lease(self, worker, seconds):
+        """Claim a pending or expired shard; returns (shard, attempt) or None."""
+        now = time.time()
+        db = self._tx()
+        try:
+            db.execute("UPDATE shards SET state = 'failed', error = COALESCE(error, 'lease expired') "
+                       "WHERE run = ? AND state = 'leased' AND lease_until < ? AND attempts >= ?",
+                       (self.run, now, self.max_attempts))
+            row = db.execute("SELECT shard, attempts FROM shards WHERE run = ? AND (state = 'pending' "
+                             "OR (state = 'leased' AND lease_until < ?)) ORDER BY attempts, shard LIMIT 1",
+                             (self.run, now)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE shards SET state = 'leased', worker = ?, lease_until = ?, attempts = ? "
+                       "WHERE run = ? AND shard = ?", (worker, now + seconds, row[1] + 1, self.run, row[0]))
+            return row[0], row[1] + 1
+        finally:
+            db.execute("COMMIT")
+    
+    def renew(self, shard, worker, seconds):
+        """Extend a held lease; False if it has been lost to another worker."""
+        cur = self.db.execute("UPDATE shards SET lease_until = ? WHERE run = ? AND shard = ? "
+                              "AND state = 'leased' AND worker = ?",
+                              (time.time() + seconds, self.run, shard, worker))
+        return cur.rowcount == 1
+    
+    def complete(self, shard, worker, output):
+        cur = self.db.execute("UPDATE shards SET state = 'done', output = ?, error = NULL WHERE run = ? "
+                              "AND shard = ? AND state = 'leased' AND worker = ?",
+                              (output, self.run, shard, worker))
+        return cur.rowcount == 1
+    
+    def fail(self, shard, worker, error):
+        """Release a lease after an error: back to pending, or failed when out of attempts."""
+        self.db.execute("UPDATE shards SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                        "error = ?, lease_until = NULL WHERE run = ? AND shard = ? AND state = 'leased' "
+                        "AND worker = ?", (self.max_attempts, error, self.run, shard, worker))
+    
+    def status(self):
+        """{state: shard count} for the run."""
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM shards WHERE run = ? GROUP BY state",
+                                    (self.run,)).fetchall())
+    
+    def outputs(self):
+        """{shard: output dir} of completed shards."""
+        return dict(self.db.execute("SELECT shard, output FROM shards WHERE run = ? AND state = 'done' "
+                                    "ORDER BY shard", (self.run,)).fetchall())
+    
+    def close(self):
+        self.db.close()
+
+
+def run_shard(client, shard, companies, output_dir, cache_dir, heartbeat=None):
+    """Extract one shard's companies into output_dir (CSVs + changelog).
+    
+    Restatements are diffed against a copy of the shard's snapshot kept in
+    output_dir; run_worker promotes it once the attempt is accepted.
+    """
+    import shutil
+    
+    extractor = XBRLExtractor(client, START_YEAR, END_YEAR, cache_dir=cache_dir)
+    results = {}
+    for ticker, name, sector, cik in companies:
+        result = extractor.extract_company(ticker, name, cik)
+        if result:
+            results[ticker] = result
+        if heartbeat and not heartbeat():
+            raise RuntimeError(f"lease on shard {shard} lost")
+    extractor.save_resolutions()
+    shutil.rmtree(output_dir, ignore_errors=True)  # left over from a reset run of the same name
+    os.makedirs(output_dir)
+    if results:
+        export_to_csv(results, companies, extractor.quarters, output_dir)
+    snapshot = os.path.join(cache_dir, "series_snapshot.json")
+    if os.path.exists(snapshot):
+        shutil.copy(snapshot, os.path.join(output_dir, "series_snapshot.json"))
+    diff_against_snapshot(results, extractor.quarters, extractor.accessions,
+                          os.path.join(output_dir, "series_snapshot.json"),
+                          os.path.join(output_dir, "changelog.jsonl"))
+    return results
+
+
+def run_worker(companies, shards=SHARDS, shard_dir=SHARD_DIR, worker=None, lease=SHARD_LEASE):
+    """Lease and process shards until none are left; returns the shards this worker completed."""
+    import shutil
+    
+    worker = worker or f"{os.uname().nodename}-{os.getpid()}"
+    queue = ShardQueue(os.path.join(shard_dir, "queue.sqlite"))
+    queue.seed(shards)
+    parts = partition(companies, shards)
+    client = EDGARClient(USER_AGENT, RESPONSE_CACHE_MB, RESPONSE_SPILL_DIR or None)
+    client.RATE_LIMIT = EDGARClient.RATE_LIMIT * max(WORKERS_PER_IP, 1)
+    done = []
+    try:
+        while True:
+            claim = queue.lease(worker, lease)
+            if claim is None:
+                status = queue.status()
+                if not status.get("pending") and not status.get("leased"):
+                    break
+                time.sleep(min(lease, 30))  # other workers hold the rest; retake any that expire
+                continue
+            shard, attempt = claim
+            print(f"\n  [{worker}] shard {shard}/{shards}: {len(parts[shard])} companies (attempt {attempt})")
+            out = os.path.join(shard_dir, SHARD_RUN, f"shard_{shard:03d}.{worker}.{attempt}")
+            cache_dir = os.path.join(CACHE_DIR, "shards", f"shard_{shard:03d}")
+            try:
+                run_shard(client, shard, parts[shard], out, cache_dir,
+                          heartbeat=lambda: queue.renew(shard, worker, lease))
+            except Exception as e:
+                print(f"  ⚠ [{worker}] shard {shard} failed: {e}")
+                queue.fail(shard, worker, str(e))
+                continue
+            if queue.complete(shard, worker, out):
+                tmp = os.path.join(cache_dir, f"series_snapshot.json.{worker}")
+                shutil.copy(os.path.join(out, "series_snapshot.json"), tmp)
+                os.replace(tmp, os.path.join(cache_dir, "series_snapshot.json"))
+                done.append(shard)
+            else:
+                print(f"  ⚠ [{worker}] shard {shard} was retaken; discarding {out}")
+    finally:
+        client.cache.close()
+        queue.close()
+    print(f"  [{worker}] completed shards {done}")
+    return done
+
+
+def merge_shards(companies, shard_dir=SHARD_DIR, output_dir=OUTPUT_DIR, dashboard_dir=DASHBOARD_DIR):
+    """Reduce step: combine completed shards into output_dir, then rebuild the dashboard.
+    
+    Writes all_companies_quarterly.csv (rows in COMPANIES order), the
+    per-company CSVs and the events CSV, appends the shards' change logs
+    (on the run's first merge only), and reruns calculate_roic.py into
+    dashboard_dir. Refuses to merge
+    while any shard is unfinished; returns the combined CSV path or None.
+    """
+    import shutil
+    import subprocess
+    import sys
+    
+    queue = ShardQueue(os.path.join(shard_dir, "queue.sqlite"))
+    try:
+        status, outputs = queue.status(), queue.outputs()
+        print(f"\n  Shards: {status}")
+        if not outputs or set(status) != {"done"}:
+            print("  ⚠ Not merging: unfinished or failed shards (rerun workers, or reset the run)")
+            return None
+        # The change log is appended once per run; re-merging only rewrites outputs
+        append_changelog = queue.mark_merged()
+    finally:
+        queue.close()
+    
+    os.makedirs(output_dir, exist_ok=True)
+    frames = []
+    changelog = os.path.join(output_dir, "changelog.jsonl")
+    for shard, out in outputs.items():
+        combined = os.path.join(out, "all_companies_quarterly.csv")
+        if os.path.exists(combined):
+            frames.append(pd.read_csv(combined, dtype=str, keep_default_na=False))
+        for name in os.listdir(out):
+            if name.endswith("_quarterly.csv") and name != "all_companies_quarterly.csv":
+                shutil.copy(os.path.join(out, name), os.path.join(output_dir, name))
+        shard_log = os.path.join(out, "changelog.jsonl")
+        if append_changelog and os.path.exists(shard_log):
+            with open(shard_log) as src, open(changelog, 'a') as dst:
+                shutil.copyfileobj(src, dst)
+    
+    order = {ticker: i for i, (ticker, name, sector, cik) in enumerate(companies)}
+    merged = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if len(merged):
+        merged = merged.sort_values(by="Ticker", key=lambda col: col.map(order).fillna(len(order)),
+                                    kind="stable")
+    combined_path = os.path.join(output_dir, "all_companies_quarterly.csv")
+    merged.to_csv(combined_path, index=False)
+    export_events_csv(AI_LAYOFF_EVENTS, output_dir)
+    print(f"  ✓ Merged {len(outputs)} shards, {merged['Ticker'].nunique() if len(merged) else 0} "
+          f"companies -> {combined_path}")
+    
+    env = dict(os.environ, INPUT_DIR=output_dir, OUTPUT_DIR=dashboard_dir)
+    env.pop("CHANGED_TICKERS", None)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calculate_roic.py")
+    subprocess.run([sys.executable, script], env=env, check=False)
+    return combined_path
+
+
+def run_sharded_local(companies, workers=SHARD_WORKERS, shards=SHARDS, shard_dir=SHARD_DIR):
+    """Start a fresh run with `workers` local processes standing in for nodes, then merge.
+    
+    The processes share this machine's IP, so each gets 1/workers of the
+    SEC rate budget (WORKERS_PER_IP).
+    """
+    import subprocess
+    import sys
+    
+    queue = ShardQueue(os.path.join(shard_dir, "queue.sqlite"))
+    queue.reset()
+    queue.seed(shards)
+    queue.close()
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                              env=dict(os.environ, RUN_MODE="worker", WORKER_ID=f"local-{i}",
+                                       SHARDS=str(shards), SHARD_DIR=shard_dir, WORKERS_PER_IP=str(workers)))
+             for i in range(workers)]
+    for proc in procs:
+        proc.wait()
+    return merge_shards(companies, shard_dir)
+
+
 # ╔═══════════════════════════════════════════════════════════════════╗
 # ║  CELL 8: MAIN EXECUTION                                         ║
 # ╚═══════════════════════════════════════════════════════════════════╝
@@ -884,28 +2881,70 @@ def main():
         print("  Example: 'John Smith john@company.com'")
         return
     
+    if RUN_MODE == "worker":
+        return run_worker(COMPANIES, worker=WORKER_ID or None)
+    if RUN_MODE == "merge":
+        return merge_shards(COMPANIES)
+    if RUN_MODE == "sharded":
+        print(f"\n  Sharded run: {SHARDS} shards, {SHARD_WORKERS} local workers")
+        return run_sharded_local(COMPANIES)
+    
     # Initialize
-    client = EDGARClient(USER_AGENT)
-    extractor = XBRLExtractor(client, START_YEAR, END_YEAR)
+    client = EDGARClient(USER_AGENT, RESPONSE_CACHE_MB, RESPONSE_SPILL_DIR or None)
+    extractor = XBRLExtractor(client, START_YEAR, END_YEAR, cache_dir=CACHE_DIR)
+    
+    if RUN_MODE == "watch":
+        print(f"\n  Watch mode: polling every {WATCH_INTERVAL}s (Ctrl+C to stop)")
+        return watch_filings(client, extractor, COMPANIES, interval=WATCH_INTERVAL)
+    
+    if AS_OF:
+        print(f"\n  Point-in-time rebuild as of {', '.join(sorted(AS_OF))}")
+        paths = export_as_of_panels(extractor, COMPANIES, AS_OF, OUTPUT_DIR)
+        extractor.series_cache.save()
+        client.cache.close()
+        for date, path in paths.items():
+            panel_dir = os.path.dirname(path)
+            print(f"  {date}: INPUT_DIR={panel_dir} OUTPUT_DIR={os.path.join(panel_dir, 'docs')} python calculate_roic.py")
+        return paths
     
     # Extract data for all companies
     all_results = {}
-    for ticker, name, sector, cik in COMPANIES:
-        result = extractor.extract_company(ticker, name, cik)
-        if result:
-            all_results[ticker] = result
+    if INGEST_MODE == "frames":
+        print(f"\n  Frames mode: {len(XBRL_TAG_MAP)} metrics × {len(extractor.quarters)} quarters")
+        frames = FramesExtractor(client, START_YEAR, END_YEAR)
+        all_results = frames.extract_universe(COMPANIES)
+        extractor.accessions = frames.accessions
+    else:
+        for ticker, name, sector, cik in COMPANIES:
+            result = extractor.extract_company(ticker, name, cik)
+            if result:
+                all_results[ticker] = result
+                if SEGMENTS == "on":
+                    extractor.extract_segments(ticker, cik, INSTANCE_DIR or None)
+    extractor.save_resolutions()
+    sc = extractor.series_cache
+    print(f"\n  Quarter-series cache: {sc.hits} hits / {sc.misses} recomputed")
+    print(f"  Response cache: {client.cache.stats()}")
     
     # Export
     print(f"\n{'='*60}")
     print("  EXPORTING TO CSV")
     print(f"{'='*60}")
+    diff_against_snapshot(all_results, extractor.quarters, extractor.accessions,
+                          os.path.join(CACHE_DIR, "series_snapshot.json"),
+                          os.path.join(OUTPUT_DIR, "changelog.jsonl"))
     combined_path = export_to_csv(all_results, COMPANIES, extractor.quarters, OUTPUT_DIR)
+    if extractor.segments:
+        export_segments_csv(extractor.segments, COMPANIES, extractor.quarters, OUTPUT_DIR)
     
     # Export AI layoff events timeline
     export_events_csv(AI_LAYOFF_EVENTS, OUTPUT_DIR)
+    if EVENT_DISCOVERY == "on":
+        discover_events(client, COMPANIES, OUTPUT_DIR, CACHE_DIR, f"{START_YEAR}-01-01", EVENT_ARCHIVE or None)
     
     # Check for new filings (for scheduling context)
     new = check_new_filings(client, COMPANIES, days_back=45)
+    client.cache.close()
     
     print(f"\n{'='*60}")
     print("  COMPLETE")
@@ -915,10 +2954,11 @@ def main():
     print(f"\n  NEXT STEPS:")
     print(f"  1. Review individual company CSVs for data gaps")
     print(f"  2. Fill Market Cap from Yahoo Finance or FMP API")
-    print(f"  3. Upload combined CSV + ai_layoff_events.csv to Claude")
-    print(f"  4. Claude will rebuild the Excel workbook with verified data")
-    print(f"     and overlay AI layoff events on the ROIC timeline")
-    print(f"  5. Set up quarterly schedule (see SCHEDULING section below)")
+    print(f"  3. Build the Excel workbook (needs xlsxwriter):")
+    print(f"       INPUT_DIR={OUTPUT_DIR} WORKBOOK_PATH={os.path.join(OUTPUT_DIR, 'roic_workbook.xlsx')} python calculate_roic.py")
+    print(f"     One sheet per company with live adjustment formulas, plus")
+    print(f"     combined data, adjusted ROIC, indices and AI layoff events")
+    print(f"  4. Set up quarterly schedule (see SCHEDULING section below)")
     
     return all_results
 
@@ -984,6 +3024,23 @@ OPTION D: Windows Task Scheduler
   3. Action: Start a program → python.exe
   4. Arguments: edgar_roic_agent.py
   5. Start in: C:\\path\\to\\project
+
+OPTION E: Filing-watch daemon (minutes from 10-Q to dashboard)
+  RUN_MODE=watch WATCH_INTERVAL=600 OUTPUT_DIR=./output DASHBOARD_DIR=./docs \\
+      python3 edgar_roic_agent.py
+  Polls submissions with conditional requests, re-extracts only companies
+  with new 10-Q/10-K accessions and reruns calculate_roic.py for them.
+
+OPTION F: Sharded run across several machines
+  # On each node (SHARD_DIR on a shared filesystem, same SHARD_RUN):
+  RUN_MODE=worker SHARDS=16 SHARD_RUN=2025Q3 SHARD_DIR=/shared/shards \\
+      python3 edgar_roic_agent.py
+  # Once all workers exit, on any one node:
+  RUN_MODE=merge SHARDS=16 SHARD_RUN=2025Q3 SHARD_DIR=/shared/shards \\
+      OUTPUT_DIR=./output DASHBOARD_DIR=./docs python3 edgar_roic_agent.py
+  Each node spends its own SEC rate budget (set WORKERS_PER_IP when a node
+  runs several workers). RUN_MODE=sharded SHARD_WORKERS=4 does the same on
+  one machine with local processes, splitting one IP's budget between them.
 """
 
 print(SCHEDULING_GUIDE)
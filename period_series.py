@@ -0,0 +1,311 @@
+"""
+Period Series
+═══════════════════════════════════════════════════════
+Compact quarterly data model shared by edgar_roic_agent.py
+and calculate_roic.py.
+
+  Quarters are integer ordinals (year * 4 + quarter - 1), so
+  "prior 4 quarters" or "same quarter last year" is index math.
+  A PeriodSeries is one float array plus a validity mask over a
+  contiguous ordinal range, and still reads like the
+  {"Q1 2015": value} dicts it replaces.
+"""
+
+import hashlib
+
+import numpy as np
+
+
+# ── Period ordinals ──
+
+def quarter_ordinal(label):
+    """'Q3 2021' -> 2021 * 4 + 2."""
+    q, year = label.split()
+    return int(year) * 4 + int(q[1:]) - 1
+
+
+def quarter_label(ordinal):
+    """2021 * 4 + 2 -> 'Q3 2021'."""
+    year, q = divmod(int(ordinal), 4)
+    return f"Q{q + 1} {year}"
+
+
+def quarter_range(start_year, end_year):
+    """Labels for every quarter of start_year..end_year, in order."""
+    return [quarter_label(o) for o in range(start_year * 4, end_year * 4 + 4)]
+
+
+def sort_quarters(labels):
+    """Quarter labels in chronological order."""
+    return [quarter_label(o) for o in sorted({quarter_ordinal(q) for q in labels})]
+
+
+# ── Series ──
+
+class PeriodSeries:
+    """Float values over a contiguous run of quarter ordinals, with a mask.
+
+    Mapping-compatible with the label-keyed dicts used elsewhere: `in`,
+    `[]`, `get`, `items()`, `keys()`, `len()` and iteration all see only
+    the valid quarters, and assignment marks a quarter valid. Labels
+    outside the range are never present; assigning one raises KeyError.
+    """
+
+    __slots__ = ("start", "values", "mask")
+
+    def __init__(self, start, length, values=None, mask=None):
+        self.start = int(start)
+        self.values = np.zeros(length) if values is None else np.asarray(values, dtype=float)
+        self.mask = np.zeros(length, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+    @classmethod
+    def from_mapping(cls, mapping, start, length):
+        """Series over [start, start + length) from a {label: value} dict."""
+        s = cls(start, length)
+        for label, v in (mapping or {}).items():
+            i = quarter_ordinal(label) - s.start
+            if 0 <= i < length and v is not None:
+                s.values[i] = v
+                s.mask[i] = True
+        return s
+
+    @classmethod
+    def for_quarters(cls, quarters, mapping=None):
+        """Series spanning the (contiguous, ordered) quarter labels given."""
+        start = quarter_ordinal(quarters[0]) if quarters else 0
+        return cls.from_mapping(mapping, start, len(quarters))
+
+    def __len__(self):
+        return int(self.mask.sum())
+
+    def _index(self, label):
+        i = quarter_ordinal(label) - self.start if isinstance(label, str) else int(label) - self.start
+        return i if 0 <= i < len(self.values) else None
+
+    def __contains__(self, label):
+        i = self._index(label)
+        return i is not None and bool(self.mask[i])
+
+    def __getitem__(self, label):
+        i = self._index(label)
+        if i is None or not self.mask[i]:
+            raise KeyError(label)
+        return float(self.values[i])
+
+    def __setitem__(self, label, value):
+        i = self._index(label)
+        if i is None:
+            raise KeyError(label)
+        self.values[i] = value
+        self.mask[i] = True
+
+    def get(self, label, default=None):
+        i = self._index(label)
+        return float(self.values[i]) if i is not None and self.mask[i] else default
+
+    def keys(self):
+        return [quarter_label(self.start + i) for i in np.flatnonzero(self.mask)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(quarter_label(self.start + i), float(self.values[i])) for i in np.flatnonzero(self.mask)]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"PeriodSeries({quarter_label(self.start)}, {len(self)}/{len(self.values)} valid)"
+
+    # Array views
+
+    @property
+    def ordinals(self):
+        return np.arange(self.start, self.start + len(self.values))
+
+    def reindex(self, start, length):
+        """Same data over another ordinal range (uncovered quarters invalid)."""
+        out = PeriodSeries(start, length)
+        lo, hi = max(start, self.start), min(start + length, self.start + len(self.values))
+        if lo < hi:
+            out.values[lo - start:hi - start] = self.values[lo - self.start:hi - self.start]
+            out.mask[lo - start:hi - start] = self.mask[lo - self.start:hi - self.start]
+        return out
+
+    def digest(self):
+        """Content hash (range, values and mask), used as a cache version."""
+        h = hashlib.sha1(str(self.start).encode())
+        h.update(np.where(self.mask, self.values, 0.0).tobytes())
+        h.update(self.mask.tobytes())
+        return h.hexdigest()
+
+    def filled(self, fill=np.nan):
+        """Values with invalid quarters replaced by `fill`."""
+        return np.where(self.mask, self.values, fill)
+
+    def shift(self, n):
+        """Value n quarters earlier at each position (n=4 is year-over-year)."""
+        out = PeriodSeries(self.start, len(self.values))
+        if 0 < n < len(self.values):
+            out.values[n:] = self.values[:-n]
+            out.mask[n:] = self.mask[:-n]
+        elif n <= 0:
+            out.values[:], out.mask[:] = self.values, self.mask
+        return out
+
+    def _windows(self, window):
+        """(sum of valid values, count of valid quarters) per trailing window.
+
+        One cumulative sum of the values and one of the mask give every
+        window as a difference of two entries: O(1) per position.
+        """
+        c = np.concatenate([[0.0], np.cumsum(self.filled(0.0))])
+        k = np.concatenate([[0], np.cumsum(self.mask)])
+        idx = np.arange(1, len(c))
+        lo = np.maximum(idx - window, 0)
+        return c[idx] - c[lo], k[idx] - k[lo]
+
+    def rolling_sum(self, window, min_periods=None):
+        """Sum over the trailing `window` quarters at each position.
+
+        A position is valid only when at least `min_periods` (default: all)
+        of its quarters are, so gaps never masquerade as full windows.
+        """
+        total, count = self._windows(window)
+        need = window if min_periods is None else max(min_periods, 1)
+        return PeriodSeries(self.start, len(self.values), total, count >= need)
+
+    def rolling_mean(self, window, min_periods=None):
+        """Mean of the valid quarters in each trailing window (see rolling_sum)."""
+        total, count = self._windows(window)
+        need = window if min_periods is None else max(min_periods, 1)
+        ok = count >= need
+        return PeriodSeries(self.start, len(self.values), np.where(ok, total / np.maximum(count, 1), 0.0), ok)
+
+    def trailing_mean(self, window, fill=0.0):
+        """Mean of the last min(window, i + 1) quarters at each position.
+
+        Invalid quarters count as `fill`; the result is valid everywhere.
+        """
+        c = np.cumsum(self.filled(fill))
+        prior = np.zeros_like(c)
+        prior[window:] = c[:-window]
+        n = np.minimum(np.arange(1, len(c) + 1), window)
+        return PeriodSeries(self.start, len(c), (c - prior) / n, np.ones(len(c), dtype=bool))
+
+
+def as_series(data, quarters):
+    """A PeriodSeries over `quarters` from a PeriodSeries or {label: value} dict."""
+    start = quarter_ordinal(quarters[0]) if quarters else 0
+    if isinstance(data, PeriodSeries):
+        return data.reindex(start, len(quarters))
+    return PeriodSeries.from_mapping(data, start, len(quarters))
+
+
+# ── Derived metrics ──
+
+class MetricGraph:
+    """Registry of derived metrics, each declaring the metrics it is computed from.
+
+    evaluate() walks the graph lazily, computing only what the requested
+    names need. A node's version is a hash of its name and its inputs'
+    versions, with sources hashed by content, so given the same cache dict
+    on a later call a node whose inputs are unchanged is returned from the
+    cache without recomputing it or anything upstream. A node that lists
+    its own name as an input receives the source series of that name
+    (fallbacks and fills of extracted metrics).
+    """
+
+    def __init__(self):
+        self.nodes = {}
+
+    def metric(self, name, *inputs):
+        """Decorator registering fn(*input series) -> PeriodSeries as `name`."""
+        def register(fn):
+            self.nodes[name] = (inputs, fn)
+            return fn
+        return register
+
+    def requires(self, names):
+        """Source names the given metrics depend on."""
+        needed, seen = set(), set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            if name not in self.nodes:
+                needed.add(name)
+                continue
+            for i in self.nodes[name][0]:
+                if i == name:
+                    needed.add(name)
+                else:
+                    stack.append(i)
+        return needed
+
+    def evaluate(self, sources, names, cache=None, empty=None):
+        """{name: PeriodSeries} for each requested name.
+
+        `sources` maps source names to series; a missing source is passed
+        to nodes as `empty`. `cache` is a dict owned by the caller (one per
+        company) that persists results between calls.
+        """
+        versions, values = {}, {}
+
+        def source(name):
+            return sources.get(name, empty)
+
+        def version(name, raw=False):
+            key = (name, raw)
+            if key not in versions:
+                if raw or name not in self.nodes:
+                    s = source(name)
+                    versions[key] = s.digest() if s is not None else ""
+                else:
+                    h = hashlib.sha1(name.encode())
+                    for i in self.nodes[name][0]:
+                        h.update(version(i, raw=i == name).encode())
+                    versions[key] = h.hexdigest()
+            return versions[key]
+
+        def value(name, raw=False):
+            if raw or name not in self.nodes:
+                return source(name)
+            if name not in values:
+                v = version(name)
+                hit = cache.get(name) if cache is not None else None
+                if hit is not None and hit[0] == v:
+                    values[name] = hit[1]
+                else:
+                    inputs, fn = self.nodes[name]
+                    values[name] = fn(*(value(i, raw=i == name) for i in inputs))
+                    if cache is not None:
+                        cache[name] = (v, values[name])
+            return values[name]
+
+        return {name: value(name) for name in names}
+
+
+# ── Company metadata ──
+
+class CompanyInfo:
+    """Fixed-field company record."""
+
+    __slots__ = ("ticker", "name", "sector", "tier", "cik")
+
+    def __init__(self, ticker, name, sector, tier=None, cik=None):
+        self.ticker = ticker
+        self.name = name
+        self.sector = sector
+        self.tier = tier
+        self.cik = cik
+
+    def as_dict(self):
+        """The {"name", "sector", "tier"} form written to the dashboard JSON."""
+        return {"name": self.name, "sector": self.sector, "tier": self.tier}
+
+    def __repr__(self):
+        return f"CompanyInfo({self.ticker!r}, {self.name!r}, {self.sector!r}, tier={self.tier}, cik={self.cik})"
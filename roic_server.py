@@ -0,0 +1,255 @@
+"""
+ROIC Query Server
+═══════════════════════════════════════════════════════
+Serves calculate_roic.py output from memory so clients no longer download
+the full docs/*/data.json. Ticker × quarter arrays are indexed by ticker,
+sector, tier and quarter; the data file is reloaded atomically when a new
+run replaces it, and every response carries an ETag for cheap polling.
+
+  GET /series?metric=adj_roic&tier=1&from=Q1 2022&to=Q4 2025
+  GET /series?metric=revenue&ticker=MSFT,AMZN
+  GET /top?metric=spread&quarter=Q3 2025&n=20[&order=asc][&sector=Retail]
+  GET /indices
+  GET /meta
+
+Run:  DATA_PATH=docs/internal/data.json PORT=8765 python roic_server.py
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+# ── Configuration ──
+DATA_PATH = os.environ.get("DATA_PATH", os.path.join("docs", "internal", "data.json"))
+HOST = os.environ.get("HOST", "127.0.0.1")
+PORT = int(os.environ.get("PORT", "8765"))
+RELOAD_CHECK_SECONDS = 1.0
+
+METRICS = [
+    "adj_roic", "reported_roic", "spread", "revenue", "operating_income",
+    "nopat", "invested_capital", "adj_invested_capital", "adj_nopat",
+    "restruct_avg", "goodwill", "intangibles", "leases", "market_cap",
+    "headcount", "rev_per_employee", "capex_intensity", "fcf_conversion",
+]
+
+
+def quarter_key(q):
+    """'Q3 2025' -> (2025, 3) for ordering."""
+    return int(q.split()[1]), int(q[1])
+
+
+class ROICIndex:
+    """Immutable in-memory index over one internal data.json."""
+    
+    def __init__(self, payload, version):
+        self.version = version
+        self.quarters = sorted(payload.get("quarters", []), key=quarter_key)
+        self.q_idx = {q: j for j, q in enumerate(self.quarters)}
+        companies = payload.get("companies", {})
+        self.tickers = sorted(companies)
+        self.t_idx = {t: i for i, t in enumerate(self.tickers)}
+        self.info = {t: companies[t].get("info", {}) for t in self.tickers}
+        self.indices = payload.get("indices", {})
+        
+        self.by_sector = {}
+        self.by_tier = {}
+        for i, t in enumerate(self.tickers):
+            self.by_sector.setdefault(self.info[t].get("sector"), []).append(i)
+            self.by_tier.setdefault(str(self.info[t].get("tier")), []).append(i)
+        self.by_sector = {k: np.array(v) for k, v in self.by_sector.items()}
+        self.by_tier = {k: np.array(v) for k, v in self.by_tier.items()}
+        
+        shape = (len(self.tickers), len(self.quarters))
+        self.arrays = {m: np.full(shape, np.nan) for m in METRICS}
+        for i, t in enumerate(self.tickers):
+            for q, qd in companies[t].get("quarters", {}).items():
+                j = self.q_idx.get(q)
+                if j is None:
+                    continue
+                for m in METRICS:
+                    v = qd.get(m)
+                    if isinstance(v, (int, float)) and not isinstance(v, bool):
+                        self.arrays[m][i, j] = v
+    
+    def rows(self, params):
+        """Row indices selected by ticker / sector / tier filters (intersection)."""
+        rows = np.arange(len(self.tickers))
+        if "ticker" in params:
+            wanted = [self.t_idx[t] for t in params["ticker"].split(",") if t in self.t_idx]
+            rows = np.intersect1d(rows, np.array(wanted, dtype=int))
+        if "sector" in params:
+            rows = np.intersect1d(rows, self.by_sector.get(params["sector"], np.array([], dtype=int)))
+        if "tier" in params:
+            rows = np.intersect1d(rows, self.by_tier.get(params["tier"], np.array([], dtype=int)))
+        return rows
+    
+    def quarter_range(self, params):
+        for key in ("from", "to"):
+            if key in params and params[key] not in self.q_idx:
+                raise KeyError(f"unknown quarter: {params[key]}")
+        lo = self.q_idx.get(params.get("from"), 0)
+        hi = self.q_idx.get(params.get("to"), len(self.quarters) - 1)
+        return lo, hi + 1
+    
+    def series(self, params):
+        metric = params.get("metric", "adj_roic")
+        if metric not in self.arrays:
+            raise KeyError(f"unknown metric: {metric}")
+        rows = self.rows(params)
+        lo, hi = self.quarter_range(params)
+        block = self.arrays[metric][rows, lo:hi]
+        return {
+            "metric": metric,
+            "quarters": self.quarters[lo:hi],
+            "series": {
+                self.tickers[i]: [None if np.isnan(v) else float(v) for v in block[k]]
+                for k, i in enumerate(rows)
+            },
+        }
+    
+    def top(self, params):
+        metric = params.get("metric", "adj_roic")
+        if metric not in self.arrays:
+            raise KeyError(f"unknown metric: {metric}")
+        quarter = params.get("quarter", self.quarters[-1] if self.quarters else None)
+        if quarter not in self.q_idx:
+            raise KeyError(f"unknown quarter: {quarter}")
+        n = int(params.get("n", 20))
+        if n < 0:
+            raise ValueError(f"n must be non-negative: {n}")
+        rows = self.rows(params)
+        col = self.arrays[metric][rows, self.q_idx[quarter]]
+        valid = ~np.isnan(col)
+        rows, col = rows[valid], col[valid]
+        order = np.argsort(col if params.get("order") == "asc" else -col, kind="stable")[:n]
+        return {
+            "metric": metric,
+            "quarter": quarter,
+            "results": [
+                {"ticker": self.tickers[rows[k]], **self.info[self.tickers[rows[k]]], metric: float(col[k])}
+                for k in order
+            ],
+        }
+    
+    def meta(self, params):
+        return {
+            "version": self.version,
+            "quarters": self.quarters,
+            "tickers": self.tickers,
+            "sectors": sorted(s for s in self.by_sector if s),
+            "metrics": METRICS,
+        }
+    
+    def get_indices(self, params):
+        return self.indices
+
+
+class IndexHolder:
+    """Holds the current ROICIndex and swaps in a new one when DATA_PATH changes.
+    
+    calculate_roic.py replaces the file with os.replace, so a reload always
+    reads a complete file; requests in flight keep the index they started with.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.index = None
+        self.stamp = None
+        self.last_check = 0
+        self.lock = threading.Lock()
+        self.reload()
+    
+    def reload(self):
+        st = os.stat(self.path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self.stamp:
+            return
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        index = ROICIndex(json.loads(raw), hashlib.sha1(raw).hexdigest()[:16])
+        self.index, self.stamp = index, stamp
+        print(f"  Loaded {len(index.tickers)} companies × {len(index.quarters)} quarters (v{index.version})")
+    
+    def current(self):
+        now = time.time()
+        if now - self.last_check >= RELOAD_CHECK_SECONDS and self.lock.acquire(blocking=False):
+            try:
+                self.last_check = now
+                self.reload()
+            except (OSError, ValueError) as e:
+                print(f"  ⚠ Reload failed, keeping previous data: {e}")
+            finally:
+                self.lock.release()
+        return self.index
+
+
+ROUTES = {
+    "/series": ROICIndex.series,
+    "/top": ROICIndex.top,
+    "/indices": ROICIndex.get_indices,
+    "/meta": ROICIndex.meta,
+}
+
+
+def make_handler(holder):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            route = ROUTES.get(url.path)
+            if route is None:
+                return self.send_json(404, {"error": f"unknown path {url.path}"})
+            
+            index = holder.current()
+            # Responses are a pure function of (data version, URL)
+            etag = '"' + hashlib.sha1(f"{index.version}{self.path}".encode()).hexdigest()[:20] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                payload = route(index, params)
+            except (KeyError, ValueError) as e:
+                return self.send_json(400, {"error": str(e).strip("'")})
+            self.send_json(200, payload, etag)
+        
+        def send_json(self, status, payload, etag=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, fmt, *args):
+            pass
+    
+    return Handler
+
+
+def main():
+    print("=" * 55)
+    print("  ROIC QUERY SERVER")
+    print("=" * 55)
+    holder = IndexHolder(DATA_PATH)
+    server = ThreadingHTTPServer((HOST, PORT), make_handler(holder))
+    print(f"  Serving {DATA_PATH} on http://{HOST}:{PORT}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n  Stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Chunked tokenization and positional queries of the event-discovery index."""
+
+import numpy as np
+import pytest
+
+import edgar_roic_agent as agent
+
+DOCUMENT = (
+    "<html><body><p class=\"lead\">Management announced a reduction&nbsp;in&nbsp;force</p>"
+    "<div>affecting 1,200 employees as AI&amp;automation tools mature.</div>"
+    "<!-- comment with <nested> text --><p>Artificial Intelligence spending rose.</p></body></html>"
+)
+TOKENS = [
+    "management", "announced", "a", "reduction", "in", "force",
+    "affecting", "1", "200", "employees", "as", "ai", "automation", "tools", "mature",
+    "text", "artificial", "intelligence", "spending", "rose",
+]
+
+
+def _write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 64))
+def test_tokens_do_not_depend_on_chunk_boundaries(tmp_path, chunk_size):
+    path = _write(tmp_path, "doc.htm", DOCUMENT)
+    assert list(agent.stream_tokens(path, chunk_size)) == TOKENS
+
+
+def test_word_longer_than_a_chunk_is_kept_whole(tmp_path):
+    path = _write(tmp_path, "doc.txt", "restructuring " * 3)
+    assert list(agent.stream_tokens(path, 4)) == ["restructuring"] * 3
+
+
+@pytest.fixture
+def index(tmp_path):
+    idx = agent.FilingIndex(str(tmp_path / "index.sqlite"))
+    docs = {
+        "a.htm": "We will cut 500 jobs. Artificial intelligence now writes code; artificial intelligence tests it.",
+        "b.htm": "Artificial general intelligence is a research goal.",
+        "c.htm": "Intelligence, artificial or not, drove the workforce reduction.",
+    }
+    ids = {}
+    for name, text in docs.items():
+        assert idx.add_document("TEST", "0000000000-25-000001", name, "8-K", "2025-03-01",
+                                _write(tmp_path, name, text))
+    for doc in idx.docs(range(1, 10)).values():
+        ids[doc["name"]] = doc["id"]
+    yield idx, ids
+    idx.close()
+
+
+def test_documents_are_indexed_once(index, tmp_path):
+    idx, ids = index
+    assert not idx.add_document("TEST", "0000000000-25-000001", "a.htm", "8-K", "2025-03-01",
+                                _write(tmp_path, "a.htm", "anything"))
+    assert idx.docs([ids["a.htm"]])[ids["a.htm"]]["n_tokens"] == 14
+
+
+def test_phrase_requires_adjacent_terms_in_order(index):
+    idx, ids = index
+    hits = idx.phrase("artificial intelligence")
+    assert list(hits) == [ids["a.htm"]]
+    np.testing.assert_array_equal(hits[ids["a.htm"]], [5, 10])
+    assert idx.phrase("Artificial-Intelligence").keys() == hits.keys()
+    assert idx.phrase("intelligence artificial") == {ids["c.htm"]: np.array([0])}
+    assert idx.phrase("artificial superintelligence") == {}
+    assert idx.phrase("...") == {}
+
+
+def test_any_phrase_merges_positions(index):
+    idx, ids = index
+    hits = idx.any_phrase(["artificial intelligence", "jobs"])
+    np.testing.assert_array_equal(hits[ids["a.htm"]], [4, 5, 10])
+
+
+def test_near_window_is_inclusive_and_symmetric(index):
+    idx, ids = index
+    a = ids["a.htm"]
+    # "jobs" at 4; "artificial intelligence" at 5 and 10
+    pos, dist = idx.near(["artificial intelligence"], ["jobs"], 6)[a]
+    np.testing.assert_array_equal(pos, [5, 10])
+    np.testing.assert_array_equal(dist, [1, 6])
+    pos, dist = idx.near(["artificial intelligence"], ["jobs"], 5)[a]
+    np.testing.assert_array_equal(pos, [5])
+    # b before and after a: the nearer one counts
+    pos, dist = idx.near(["now"], ["jobs", "tests"], 10)[a]
+    np.testing.assert_array_equal(dist, [3])
+    assert a not in idx.near(["tests"], ["jobs"], 7)
+    assert idx.near(["tests"], ["jobs"], 8)[a][1].tolist() == [8]
+
+
+def test_near_needs_both_sides_in_the_same_document(index):
+    idx, ids = index
+    near = idx.near(["intelligence"], ["reduction"], 20)
+    assert list(near) == [ids["c.htm"]]
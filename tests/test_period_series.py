@@ -0,0 +1,162 @@
+"""Edge cases of the PeriodSeries data model and MetricGraph caching."""
+
+import numpy as np
+import pytest
+
+from period_series import MetricGraph, PeriodSeries, as_series, quarter_label, quarter_ordinal
+
+NAN = np.nan
+
+
+def series(values, start="Q1 2020"):
+    """PeriodSeries from a list, None marking invalid quarters."""
+    mask = [v is not None for v in values]
+    return PeriodSeries(quarter_ordinal(start), len(values), [0.0 if v is None else v for v in values], mask)
+
+
+def check(s, expected):
+    np.testing.assert_array_equal(s.filled(NAN), np.array([NAN if v is None else v for v in expected]))
+
+
+def test_ordinals_round_trip():
+    assert quarter_ordinal("Q3 2021") == 2021 * 4 + 2
+    assert quarter_label(quarter_ordinal("Q4 1999")) == "Q4 1999"
+
+
+def test_mapping_view_sees_only_valid_quarters():
+    s = series([1.0, None, 3.0])
+    assert len(s) == 2
+    assert list(s) == ["Q1 2020", "Q3 2020"]
+    assert "Q2 2020" not in s and "Q1 2019" not in s
+    assert s.get("Q2 2020", "missing") == "missing"
+    with pytest.raises(KeyError):
+        s["Q2 2020"]
+    s["Q2 2020"] = 2.0
+    assert s.to_dict() == {"Q1 2020": 1.0, "Q2 2020": 2.0, "Q3 2020": 3.0}
+    with pytest.raises(KeyError):
+        s["Q4 2020"] = 4.0
+
+
+@pytest.mark.parametrize("n, expected", [
+    (0, [1, 2, None, 4, 5]),
+    (1, [None, 1, 2, None, 4]),
+    (4, [None, None, None, None, 1]),
+    (5, [None] * 5),
+    (9, [None] * 5),
+])
+def test_shift(n, expected):
+    check(series([1, 2, None, 4, 5]).shift(n), expected)
+
+
+def test_rolling_sum_requires_full_windows_by_default():
+    s = series([1, 2, None, 4, 5, 6])
+    check(s.rolling_sum(2), [None, 3, None, None, 9, 11])
+    check(s.rolling_sum(2, min_periods=1), [1, 3, 2, 4, 9, 11])
+    check(s.rolling_sum(3, min_periods=2), [None, 3, 3, 6, 9, 15])
+    # min_periods=0 still needs one valid quarter: an all-gap window is not a zero
+    check(series([None, None, 1]).rolling_sum(2, min_periods=0), [None, None, 1])
+
+
+def test_rolling_mean_averages_valid_quarters_only():
+    check(series([2, None, 4, 6]).rolling_mean(3, min_periods=2), [None, None, 3, 5])
+
+
+def test_trailing_mean_counts_gaps_as_fill_and_short_heads():
+    s = series([4, None, 8, 4])
+    check(s.trailing_mean(2), [4, 2, 4, 6])
+    check(s.trailing_mean(2, fill=2.0), [4, 3, 5, 6])
+    check(s.trailing_mean(10), [4, 2, 4, 4])
+    assert s.trailing_mean(2).mask.all()
+
+
+@pytest.mark.parametrize("start, length, expected", [
+    ("Q3 2019", 4, [None, None, 1, 2]),          # overlaps the head
+    ("Q2 2020", 4, [2, None, 4, None]),           # overlaps the tail
+    ("Q2 2020", 2, [2, None]),                    # inside
+    ("Q1 2019", 2, [None, None]),                 # disjoint
+])
+def test_reindex_partial_overlap(start, length, expected):
+    s = series([1, 2, None, 4])
+    check(s.reindex(quarter_ordinal(start), length), expected)
+
+
+def test_as_series_accepts_dicts_and_series():
+    quarters = ["Q4 2019", "Q1 2020", "Q2 2020"]
+    check(as_series({"Q1 2020": 1.0, "Q3 2020": 9.0, "Q2 2020": None}, quarters), [None, 1, None])
+    check(as_series(series([1, 2]), quarters), [None, 1, 2])
+
+
+def test_digest_ignores_values_under_the_mask():
+    a = PeriodSeries(0, 3, [1.0, 5.0, 3.0], [True, False, True])
+    b = PeriodSeries(0, 3, [1.0, 7.0, 3.0], [True, False, True])
+    assert a.digest() == b.digest()
+    assert a.digest() != PeriodSeries(1, 3, a.values, a.mask).digest()
+    assert a.digest() != PeriodSeries(0, 3, a.values, [True, True, True]).digest()
+
+
+@pytest.fixture
+def graph():
+    calls = []
+    g = MetricGraph()
+
+    @g.metric("fcf", "ocf", "capex")
+    def fcf(ocf, capex):
+        calls.append("fcf")
+        return PeriodSeries(ocf.start, len(ocf.values), ocf.values - capex.values, ocf.mask & capex.mask)
+
+    @g.metric("fcf_ttm", "fcf")
+    def fcf_ttm(fcf):
+        calls.append("fcf_ttm")
+        return fcf.rolling_sum(2)
+
+    @g.metric("rate", "rate", "tax")
+    def rate(rate, tax):
+        calls.append("rate")
+        return rate if len(rate) else tax
+
+    return g, calls
+
+
+def test_graph_requires_lists_sources(graph):
+    g, _ = graph
+    assert g.requires(["fcf_ttm"]) == {"ocf", "capex"}
+    assert g.requires(["rate"]) == {"rate", "tax"}
+
+
+def test_graph_cache_reuses_unchanged_nodes(graph):
+    g, calls = graph
+    sources = {"ocf": series([5, 6, 7]), "capex": series([1, 1, 1])}
+    cache = {}
+    out = g.evaluate(sources, ["fcf_ttm"], cache)
+    check(out["fcf_ttm"], [None, 9, 11])
+    assert calls == ["fcf", "fcf_ttm"]
+
+    calls.clear()
+    again = g.evaluate({k: series(list(v.filled(NAN))) for k, v in sources.items()}, ["fcf_ttm"], cache)
+    assert calls == []  # equal content, new objects: nothing recomputed
+    assert again["fcf_ttm"] is out["fcf_ttm"]
+
+    calls.clear()
+    sources["capex"] = series([1, 1, 2])
+    check(g.evaluate(sources, ["fcf_ttm"], cache)["fcf_ttm"], [None, 9, 10])
+    assert sorted(calls) == ["fcf", "fcf_ttm"]
+
+
+def test_graph_cache_only_computes_what_is_asked(graph):
+    g, calls = graph
+    cache = {}
+    g.evaluate({"ocf": series([1]), "capex": series([1])}, ["fcf"], cache)
+    assert calls == ["fcf"] and set(cache) == {"fcf"}
+
+
+def test_graph_self_input_sees_the_source_and_missing_sources_are_empty(graph):
+    g, calls = graph
+    empty = PeriodSeries(0, 2)
+    cache = {}
+    tax = series([0.2, 0.3])
+    assert g.evaluate({"tax": tax}, ["rate"], cache, empty)["rate"] is tax
+
+    calls.clear()
+    reported = series([0.25, 0.25])
+    assert g.evaluate({"tax": tax, "rate": reported}, ["rate"], cache, empty)["rate"] is reported
+    assert calls == ["rate"]  # the source under the node's own name is part of its version
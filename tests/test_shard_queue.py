@@ -0,0 +1,132 @@
+"""ShardQueue leasing driven from several local processes against one SQLite file."""
+
+import multiprocessing as mp
+import os
+import time
+
+import pytest
+
+import edgar_roic_agent as agent
+
+
+def _drain(path, worker, hold, results):
+    """Lease and complete shards until none are left; report what this worker finished."""
+    queue = agent.ShardQueue(path, run="test")
+    done = []
+    while True:
+        claim = queue.lease(worker, 30)
+        if claim is None:
+            break
+        shard, attempt = claim
+        time.sleep(hold)
+        if queue.complete(shard, worker, f"{worker}/{shard}"):
+            done.append(shard)
+    queue.close()
+    results.put((worker, done))
+
+
+def _lease_and_crash(path, worker, seconds, results):
+    """Take one lease and exit without renewing, completing or failing it."""
+    queue = agent.ShardQueue(path, run="test")
+    results.put(queue.lease(worker, seconds))
+    queue.close()
+
+
+def _run(target, *args):
+    proc = mp.Process(target=target, args=args)
+    proc.start()
+    return proc
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "queue.sqlite")
+
+
+def test_workers_complete_every_shard_once(path):
+    agent.ShardQueue(path, run="test").seed(12)
+    results = mp.Queue()
+    procs = [_run(_drain, path, f"w{i}", 0.02, results) for i in range(3)]
+    finished = dict(results.get(timeout=60) for _ in procs)
+    for proc in procs:
+        proc.join(timeout=60)
+        assert proc.exitcode == 0
+
+    shards = sorted(s for done in finished.values() for s in done)
+    assert shards == list(range(12))
+    queue = agent.ShardQueue(path, run="test")
+    assert queue.status() == {"done": 12}
+    assert {s: out.split("/")[0] for s, out in queue.outputs().items()} == \
+        {s: w for w, done in finished.items() for s in done}
+
+
+def test_expired_lease_is_retaken_and_stale_worker_rejected(path):
+    queue = agent.ShardQueue(path, run="test")
+    queue.seed(1)
+    results = mp.Queue()
+    proc = _run(_lease_and_crash, path, "crashed", 0.2, results)
+    assert results.get(timeout=30) == (0, 1)
+    proc.join(timeout=30)
+
+    assert queue.lease("other", 30) is None  # still held
+    time.sleep(0.3)
+    assert queue.lease("other", 30) == (0, 2)
+    assert not queue.renew(0, "crashed", 30)
+    assert not queue.complete(0, "crashed", "stale")
+    assert queue.complete(0, "other", "fresh")
+    assert queue.outputs() == {0: "fresh"}
+
+
+def test_renewed_lease_is_not_retaken(path):
+    queue = agent.ShardQueue(path, run="test")
+    queue.seed(1)
+    assert queue.lease("a", 0.2) == (0, 1)
+    assert queue.renew(0, "a", 30)
+    time.sleep(0.3)
+    assert queue.lease("b", 30) is None
+
+
+def test_failures_stop_at_max_attempts(path):
+    queue = agent.ShardQueue(path, run="test", max_attempts=2)
+    queue.seed(1)
+    assert queue.lease("a", 30) == (0, 1)
+    queue.fail(0, "a", "boom")
+    assert queue.status() == {"pending": 1}
+    assert queue.lease("a", 30) == (0, 2)
+    queue.fail(0, "a", "boom again")
+    assert queue.status() == {"failed": 1}
+    assert queue.lease("a", 30) is None
+
+
+def test_expired_lease_on_last_attempt_fails(path):
+    queue = agent.ShardQueue(path, run="test", max_attempts=1)
+    queue.seed(1)
+    results = mp.Queue()
+    proc = _run(_lease_and_crash, path, "crashed", 0.1, results)
+    assert results.get(timeout=30) == (0, 1)
+    proc.join(timeout=30)
+    time.sleep(0.2)
+    assert queue.lease("other", 30) is None
+    assert queue.status() == {"failed": 1}
+
+
+def test_seed_is_idempotent_but_rejects_a_new_shard_count(path):
+    queue = agent.ShardQueue(path, run="test")
+    queue.seed(4)
+    queue.seed(4)
+    assert queue.status() == {"pending": 4}
+    with pytest.raises(ValueError):
+        queue.seed(8)
+
+
+def test_merge_refuses_unfinished_shards(tmp_path):
+    shard_dir = str(tmp_path / "shards")
+    queue = agent.ShardQueue(os.path.join(shard_dir, "queue.sqlite"))
+    queue.seed(2)
+    shard, _ = queue.lease("a", 30)
+    assert queue.complete(shard, "a", str(tmp_path / "out"))
+
+    out = tmp_path / "output"
+    assert agent.merge_shards([], shard_dir, str(out), str(tmp_path / "docs")) is None
+    assert not out.exists()
+    assert queue.mark_merged()  # the refused merge did not count as the run's first